@@ -16,4 +16,7 @@ from .gimpPatPattern import *
 from .gimpVbrBrush import *
 from .gimpVectors import *
 from .gimpXcfDocument import *
+from .gimpXcfIndex import *
+from .gimpTileCache import *
+from .gimpCompositor import *
 from .gimpGplPalette import *
\ No newline at end of file
@@ -6,7 +6,39 @@ Base binary I/O helper.
 Does boilerplate things like reading the next uint32 from the document
 """
 import struct
-from typing import Optional, Union, List
+import mmap
+import array
+import sys
+from typing import Optional, Union, List, Tuple
+
+
+# precompiled structs for every primitive, so reads are a single unpack_from()
+_I8BE=struct.Struct('>b')
+_I8LE=struct.Struct('<b')
+_U8BE=struct.Struct('>B')
+_U8LE=struct.Struct('<B')
+_I16BE=struct.Struct('>h')
+_I16LE=struct.Struct('<h')
+_U16BE=struct.Struct('>H')
+_U16LE=struct.Struct('<H')
+_I32BE=struct.Struct('>i')
+_I32LE=struct.Struct('<i')
+_U32BE=struct.Struct('>I')
+_U32LE=struct.Struct('<I')
+_I64BE=struct.Struct('>q')
+_I64LE=struct.Struct('<q')
+_U64BE=struct.Struct('>Q')
+_U64LE=struct.Struct('<Q')
+_FLOAT32BE=struct.Struct('>f')
+_FLOAT32LE=struct.Struct('<f')
+_FLOAT64BE=struct.Struct('>d')
+_FLOAT64LE=struct.Struct('<d')
+_BIG_ENDIAN=(_I8BE,_U8BE,_I16BE,_U16BE,_I32BE,_U32BE,_I64BE,_U64BE,_FLOAT32BE,_FLOAT64BE)
+# array typecodes that hold exactly 4 and 8 bytes on this platform
+_U32_TYPECODE='I' if array.array('I').itemsize==4 else 'L'
+_U64_TYPECODE='Q'
+_NATIVE_LITTLE_ENDIAN=sys.byteorder=='little'
+_LITTLE_ENDIAN=(_I8LE,_U8LE,_I16LE,_U16LE,_I32LE,_U32LE,_I64LE,_U64LE,_FLOAT32LE,_FLOAT64LE)
 
 
 class GimpIOException(Exception):
@@ -19,19 +51,25 @@ class IO:
     Class to handle i/o to a byte buffer or file-like object
     """
 
-    def __init__(self,data: Union[None,bytes,bytearray]=None,idx: int=0,littleEndian: bool=False,boolSize: int=8,stringEncoding: str='U') -> None:
+    def __init__(self,data: Union[None,bytes,bytearray,memoryview,mmap.mmap]=None,idx: int=0,littleEndian: bool=False,boolSize: int=8,stringEncoding: str='U') -> None:
         """
         :param data: can be a data buffer or a file-like object
+            NOTE: bytes and bytearrays are copied so they can be written to,
+            memoryviews and mmaps are used in-place (read-only, no copy)
         :param idx: start reading/writing the data at the given index
         :param littleEndian: whether the default is big-endian or little-endian
         :param boolSize: how many default bits to use for a bool (8,16,32,or 64)
         :param stringEncoding: default string encoding A=Ascii, U=UTF-8, W-Unicode wide
         """
-        self._data:Union[bytearray,None]=None
+        self._data:Union[bytearray,memoryview,None]=None
         if data is None:
             self.data=bytearray()
         elif isinstance(data,(bytes,bytearray)):
             self.data=bytearray(data)
+        elif isinstance(data,memoryview):
+            self.data=data
+        elif isinstance(data,mmap.mmap):
+            self.data=memoryview(data)
         else:
             if hasattr(data,'encode'):
                 data=data.encode(data)
@@ -53,6 +91,23 @@ class IO:
             raise Exception('ERR: incorrect type for data buffer'+str(type(data)))
         self._data=data
 
+    @property
+    def littleEndian(self)->bool:
+        return self._littleEndian
+    @littleEndian.setter
+    def littleEndian(self,littleEndian:bool):
+        """
+        bind the readers/writers for the default endianness
+        once, rather than checking it on every single access
+        """
+        self._littleEndian=littleEndian
+        if littleEndian:
+            structs=_LITTLE_ENDIAN
+        else:
+            structs=_BIG_ENDIAN
+        self._i8,self._u8,self._i16,self._u16,self._i32,self._u32,\
+            self._i64,self._u64,self._float32,self._float64=structs
+
     def beginContext(self,newIndex):
         """
         Start a new context where the index can be changed all you want,
@@ -65,19 +120,39 @@ class IO:
         """
         self.index=self.contexts.pop()
 
-    def _write(self,size: int,fmt: str,data: int) -> None:
+    def _readError(self,unpacker: struct.Struct) -> GimpIOException:
+        """
+        the error for a formatted read that runs past the end of the data
+        """
+        available=max(len(self._data)-self.index,0)
+        return GimpIOException(self,'Err reading %d bytes, only %d available'%(unpacker.size,available))
+
+    def _write(self,packer: struct.Struct,data: Union[int,float]) -> None:
         """
         general formatted write
         """
-        if self.index+size>=len(self.data):
-            self.data.extend(bytearray((self.index+size)-len(self.data)))
         try:
-            struct.pack_into(fmt,self.data,self.index,data)
-            self.index+=size
+            packed=packer.pack(data)
         except struct.error as e:
-            raise Exception(type(data),fmt,size)
-            print(data)
-            raise e
+            raise Exception(type(data),packer.format,packer.size) from e
+        self._writeBytes(packed)
+
+    def _writeBytes(self,data: Union[bytes,bytearray,memoryview]) -> None:
+        """
+        write raw bytes at the index and advance past them
+
+        Writing at the end is an amortized O(1) append, because bytearray
+        over-allocates as it grows.  Anywhere else, slice assignment
+        overwrites in place (and grows the buffer if it runs off the end).
+        """
+        if self.index>=len(self.data):
+            if self.index>len(self.data):
+                # pad out any gap between the end of the data and the index
+                self.data.extend(bytes(self.index-len(self.data)))
+            self.data.extend(data)
+        else:
+            self.data[self.index:self.index+len(data)]=data
+        self.index+=len(data)
 
     @property
     def bool(self):
@@ -179,298 +254,372 @@ class IO:
 
     @property
     def i8(self):
-        if self.littleEndian:
-            return self.i8le
-        return self.i8be
+        """
+        read the next signed int8 and advance the index
+        """
+        try:
+            d=self._i8.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._i8) from None
+        self.index+=1
+        return d
     @i8.setter
     def i8(self,i8):
-        if self.littleEndian:
-            self.i8le=i8
-        else:
-            self.i8be=i8
+        self._write(self._i8,int(i8))
     @property
     def u8(self):
-        if self.littleEndian:
-            return self.u8le
-        return self.u8be
+        """
+        read the next uint8 and advance the index
+        """
+        try:
+            d=self._u8.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._u8) from None
+        self.index+=1
+        return d
     @u8.setter
     def u8(self,u8):
-        if self.littleEndian:
-            self.u8le=u8
-        else:
-            self.u8be=u8
+        self._write(self._u8,int(u8))
     @property
     def i16(self):
-        if self.littleEndian:
-            return self.i16le
-        return self.i16be
+        """
+        read the next signed int16 and advance the index
+        """
+        try:
+            d=self._i16.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._i16) from None
+        self.index+=2
+        return d
     @i16.setter
     def i16(self,i16):
-        if self.littleEndian:
-            self.i16le=i16
-        else:
-            self.i16be=i16
+        self._write(self._i16,int(i16))
     @property
     def u16(self):
-        if self.littleEndian:
-            return self.i16le
-        return self.i16be
+        """
+        read the next uint16 and advance the index
+        """
+        try:
+            d=self._u16.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._u16) from None
+        self.index+=2
+        return d
     @u16.setter
     def u16(self,u16):
-        if self.littleEndian:
-            self.u16le=u16
-        else:
-            self.u16be=u16
+        self._write(self._u16,int(u16))
     @property
     def i32(self):
-        if self.littleEndian:
-            return self.i32le
-        return self.i32be
+        """
+        read the next signed int32 and advance the index
+        """
+        try:
+            d=self._i32.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._i32) from None
+        self.index+=4
+        return d
     @i32.setter
     def i32(self,i32):
-        if self.littleEndian:
-            self.i32le=i32
-        else:
-            self.i32be=i32
+        self._write(self._i32,int(i32))
     @property
     def u32(self):
-        if self.littleEndian:
-            return self.i32le
-        return self.i32be
+        """
+        read the next uint32 and advance the index
+        """
+        try:
+            d=self._u32.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._u32) from None
+        self.index+=4
+        return d
     @u32.setter
     def u32(self,u32):
-        if self.littleEndian:
-            self.u32le=u32
-        else:
-            self.u32be=u32
+        self._write(self._u32,int(u32))
     @property
     def i64(self):
-        if self.littleEndian:
-            return self.i64le
-        return self.i64be
+        """
+        read the next signed int64 and advance the index
+        """
+        try:
+            d=self._i64.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._i64) from None
+        self.index+=8
+        return d
     @i64.setter
     def i64(self,i64):
-        if self.littleEndian:
-            self.i64le=i64
-        else:
-            self.i64be=i64
+        self._write(self._i64,int(i64))
     @property
     def u64(self):
-        if self.littleEndian:
-            return self.i64le
-        return self.i64be
+        """
+        read the next uint64 and advance the index
+        """
+        try:
+            d=self._u64.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._u64) from None
+        self.index+=8
+        return d
     @u64.setter
     def u64(self,u64):
-        if self.littleEndian:
-            self.u64le=u64
-        else:
-            self.u64be=u64
+        self._write(self._u64,int(u64))
     @property
     def float32(self):
-        if self.littleEndian:
-            return self.float32le
-        return self.float32be
+        """
+        read the next 32 bit float and advance the index
+        """
+        try:
+            d=self._float32.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._float32) from None
+        self.index+=4
+        return d
     @float32.setter
     def float32(self,float32):
-        if self.littleEndian:
-            self.float32le=float32
-        else:
-            self.float32be=float32
+        self._write(self._float32,float32)
     @property
     def float64(self):
-        if self.littleEndian:
-            return self.float64le
-        return self.float64be
+        """
+        read the next 64 bit float and advance the index
+        """
+        try:
+            d=self._float64.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(self._float64) from None
+        self.index+=8
+        return d
     @float64.setter
     def float64(self,float64):
-        if self.littleEndian:
-            self.float64le=float64
-        else:
-            self.float64be=float64
+        self._write(self._float64,float64)
 
     @property
+    def i8be(self):
+        """
+        read the next signed int8 and advance the index
+        """
+        try:
+            d=_I8BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I8BE) from None
+        self.index+=1
+        return d
+    @i8be.setter
+    def i8be(self,i8be):
+        self._write(_I8BE,int(i8be))
+    @property
+    def i8le(self):
+        """
+        read the next signed int8 and advance the index
+        """
+        try:
+            d=_I8LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I8LE) from None
+        self.index+=1
+        return d
+    @i8le.setter
+    def i8le(self,i8le):
+        self._write(_I8LE,int(i8le))
+    @property
     def u8be(self):
         """
         read the next uint8 and advance the index
         """
-        d=struct.unpack('>B',self.data[self.index:self.index+1])[0]
+        try:
+            d=_U8BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U8BE) from None
         self.index+=1
         return d
     @u8be.setter
     def u8be(self,u8be):
-        self._write(1,'>B',u8be)
+        self._write(_U8BE,int(u8be))
     @property
     def u8le(self):
         """
         read the next uint8 and advance the index
         """
-        d=struct.unpack('<B',self.data[self.index:self.index+1])[0]
+        try:
+            d=_U8LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U8LE) from None
         self.index+=1
         return d
     @u8le.setter
     def u8le(self,u8le):
-        self._write(1,'<B',u8le)
+        self._write(_U8LE,int(u8le))
+
     @property
-    def i8le(self):
+    def i16be(self):
         """
-        read the next signed int8 and advance the index
+        read the next signed int16 and advance the index
         """
-        d=struct.unpack('<b',self.data[self.index:self.index+1])[0]
-        self.index+=1
+        try:
+            d=_I16BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I16BE) from None
+        self.index+=2
         return d
-    @i8le.setter
-    def i8le(self,i8le):
-        self._write(1,'<b',i8le)
+    @i16be.setter
+    def i16be(self,i16be):
+        self._write(_I16BE,int(i16be))
     @property
-    def i8be(self):
+    def i16le(self):
         """
-        read the next signed int8 and advance the index
+        read the next signed int16 and advance the index
         """
-        d=struct.unpack('>b',self.data[self.index:self.index+1])[0]
-        self.index+=1
+        try:
+            d=_I16LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I16LE) from None
+        self.index+=2
         return d
-    @i8be.setter
-    def i8be(self,i8be):
-        self._write(1,'>b',i8be)
-
+    @i16le.setter
+    def i16le(self,i16le):
+        self._write(_I16LE,int(i16le))
     @property
     def u16be(self):
         """
         read the next uint16 and advance the index
         """
-        d=struct.unpack('>H',self.data[self.index:self.index+2])[0]
+        try:
+            d=_U16BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U16BE) from None
         self.index+=2
         return d
     @u16be.setter
     def u16be(self,u16be):
-        self._write(2,'>H',u16be)
+        self._write(_U16BE,int(u16be))
     @property
     def u16le(self):
         """
         read the next uint16 and advance the index
         """
-        d=struct.unpack('<H',self.data[self.index:self.index+2])[0]
+        try:
+            d=_U16LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U16LE) from None
         self.index+=2
         return d
     @u16le.setter
     def u16le(self,u16le):
-        self._write(2,'<H',u16le)
+        self._write(_U16LE,int(u16le))
+
     @property
-    def i16le(self):
+    def i32be(self):
         """
-        read the next signed int16 and advance the index
+        read the next signed int32 and advance the index
         """
-        d=struct.unpack('<h',self.data[self.index:self.index+2])[0]
-        self.index+=2
+        try:
+            d=_I32BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I32BE) from None
+        self.index+=4
         return d
-    @i16le.setter
-    def i16le(self,i16le):
-        self._write(2,'<h',i16le)
+    @i32be.setter
+    def i32be(self,i32be):
+        self._write(_I32BE,int(i32be))
     @property
-    def i16be(self):
+    def i32le(self):
         """
-        read the next signed int16 and advance the index
+        read the next signed int32 and advance the index
         """
-        d=struct.unpack('>h',self.data[self.index:self.index+2])[0]
-        self.index+=2
+        try:
+            d=_I32LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I32LE) from None
+        self.index+=4
         return d
-    @i16be.setter
-    def i16be(self,i16be):
-        self._write(2,'>h',i16be)
-
+    @i32le.setter
+    def i32le(self,i32le):
+        self._write(_I32LE,int(i32le))
     @property
     def u32be(self):
         """
         read the next uint32 and advance the index
         """
-        d=struct.unpack('>I',self.data[self.index:self.index+4])[0]
+        try:
+            d=_U32BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U32BE) from None
         self.index+=4
         return d
     @u32be.setter
     def u32be(self,u32be):
-        self._write(4,'>I',int(u32be))
+        self._write(_U32BE,int(u32be))
     @property
     def u32le(self):
         """
         read the next uint32 and advance the index
         """
-        d=struct.unpack('<I',self.data[self.index:self.index+4])[0]
+        try:
+            d=_U32LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U32LE) from None
         self.index+=4
         return d
     @u32le.setter
     def u32le(self,u32le):
-        self._write(4,'<I',u32le)
+        self._write(_U32LE,int(u32le))
+
     @property
-    def i32le(self):
+    def i64be(self):
         """
-        read the next signed int32 and advance the index
+        read the next signed int64 and advance the index
         """
-        d=struct.unpack('<i',self.data[self.index:self.index+4])[0]
-        self.index+=4
+        try:
+            d=_I64BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I64BE) from None
+        self.index+=8
         return d
-    @i32le.setter
-    def i32le(self,i32le):
-        self._write(4,'<i',i32le)
+    @i64be.setter
+    def i64be(self,i64be):
+        self._write(_I64BE,int(i64be))
     @property
-    def i32be(self):
+    def i64le(self):
         """
-        read the next signed int32 and advance the index
+        read the next signed int64 and advance the index
         """
         try:
-            d=struct.unpack('>i',self.data[self.index:self.index+4])[0]
-        except Exception as e:
-            raise GimpIOException(self,'Err reading 4 bytes from array of %d'%(len(self.data[self.index:self.index+4])))
-        self.index+=4
+            d=_I64LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_I64LE) from None
+        self.index+=8
         return d
-    @i32be.setter
-    def i32be(self,i32be):
-        self._write(4,'>i',int(i32be))
-
+    @i64le.setter
+    def i64le(self,i64le):
+        self._write(_I64LE,int(i64le))
     @property
     def u64be(self):
         """
         read the next uint64 and advance the index
         """
-        d=struct.unpack('>Q',self.data[self.index:self.index+8])[0]
+        try:
+            d=_U64BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U64BE) from None
         self.index+=8
         return d
     @u64be.setter
     def u64be(self,u64be):
-        self._write(8,'>Q',u64be)
+        self._write(_U64BE,int(u64be))
     @property
     def u64le(self):
         """
         read the next uint64 and advance the index
         """
-        d=struct.unpack('<Q',self.data[self.index:self.index+8])[0]
+        try:
+            d=_U64LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_U64LE) from None
         self.index+=8
         return d
     @u64le.setter
     def u64le(self,u64le):
-        self._write(8,'<Q',u64le)
-    @property
-    def i64le(self):
-        """
-        read the next signed int64 and advance the index
-        """
-        d=struct.unpack('<q',self.data[self.index:self.index+8])[0]
-        self.index+=8
-        return d
-    @i64le.setter
-    def i64le(self,i64le):
-        self._write(8,'<q',i64le)
-        self.index+=8
-    @property
-    def i64be(self):
-        """
-        read the next signed int64 and advance the index
-        """
-        d=struct.unpack('>q',self.data[self.index:self.index+8])[0]
-        self.index+=8
-        return d
-    @i64be.setter
-    def i64be(self,i64be):
-        self._write(8,'>q',i64be)
+        self._write(_U64LE,int(u64le))
 
     @property
     def float(self):
@@ -489,45 +638,91 @@ class IO:
         """
         read the next 32 bit float and advance the index
         """
-        d=struct.unpack('>f',self.data[self.index:self.index+4])[0]
+        try:
+            d=_FLOAT32BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_FLOAT32BE) from None
         self.index+=4
         return d
     @float32be.setter
     def float32be(self,float32be):
-        self._write(4,'>f',float32be)
+        self._write(_FLOAT32BE,float32be)
     @property
     def float32le(self):
         """
         read the next 32 bit float and advance the index
         """
-        d=struct.unpack('<f',self.data[self.index:self.index+4])[0]
+        try:
+            d=_FLOAT32LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_FLOAT32LE) from None
         self.index+=4
         return d
     @float32le.setter
     def float32le(self,float32le):
-        self._write(4,'<f',float32le)
+        self._write(_FLOAT32LE,float32le)
     @property
     def float64be(self):
         """
         read the next 64 bit float and advance the index
         """
-        d=struct.unpack('>d',self.data[self.index:self.index+8])[0]
+        try:
+            d=_FLOAT64BE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_FLOAT64BE) from None
         self.index+=8
         return d
     @float64be.setter
     def float64be(self,float64be):
-        self._write(8,'>d',float64be)
+        self._write(_FLOAT64BE,float64be)
     @property
     def float64le(self):
         """
         read the next 64 bit float and advance the index
         """
-        d=struct.unpack('<d',self.data[self.index:self.index+8])[0]
+        try:
+            d=_FLOAT64LE.unpack_from(self._data,self.index)[0]
+        except struct.error:
+            raise self._readError(_FLOAT64LE) from None
         self.index+=8
         return d
     @float64le.setter
     def float64le(self,float64le):
-        self._write(8,'<d',float64le)
+        self._write(_FLOAT64LE,float64le)
+
+    def _readArray(self,typecode: str,count: int) -> array.array:
+        """
+        read count fixed-size values in one go and advance the index
+        """
+        ret=array.array(typecode)
+        nbytes=count*ret.itemsize
+        ret.frombytes(self._data[self.index:self.index+nbytes])
+        if len(ret)!=count:
+            raise GimpIOException(self,'Err reading %d values, only %d available'%(count,len(ret)))
+        if self._littleEndian!=_NATIVE_LITTLE_ENDIAN:
+            ret.byteswap()
+        self.index+=nbytes
+        return ret
+    def u32array(self,count: int) -> array.array:
+        """
+        read the next count uint32s and advance the index
+        """
+        return self._readArray(_U32_TYPECODE,count)
+    def u64array(self,count: int) -> array.array:
+        """
+        read the next count uint64s and advance the index
+        """
+        return self._readArray(_U64_TYPECODE,count)
+    def u8triples(self,count: int) -> List[Tuple[int,int,int]]:
+        """
+        read the next count (uint8,uint8,uint8) triples, such as rgb colors,
+        and advance the index
+        """
+        d=bytes(self._data[self.index:self.index+count*3])
+        if len(d)!=count*3:
+            raise GimpIOException(self,'Err reading %d triples, only %d bytes available'%(count,len(d)))
+        self.index+=count*3
+        return list(zip(d[0::3],d[1::3],d[2::3]))
 
     def getBytes(self,nbytes: int) -> bytes:
         """
@@ -556,17 +751,8 @@ class IO:
         if isinstance(data,IO):
             data=data.data
         if isinstance(data,str):
-            data=bytearray(data,encoding="utf-8")
-        if self.index>=len(self.data):
-            # if we're at the end, simply extend the buffer
-            self.data.extend(data)
-            self.index+=len(data)
-        else:
-            if self.index+len(data)>=len(self.data):
-                self.data.extend(bytearray((self.index+len(data))-len(self.data)))
-            for byte in data:
-                self.data[self.index]=byte
-                self.index+=1
+            data=data.encode("utf-8")
+        self._writeBytes(data)
 
     def _sz754(self,encoding: str) -> str:
         """
@@ -581,7 +767,7 @@ class IO:
         nchars=self.u32
         if nchars==0:
             return ''
-        d=self.data[self.index:self.index+nchars-1]
+        d=bytes(self.data[self.index:self.index+nchars-1])
         self.index+=nchars
         if encoding=='A':
             return d.decode('ascii',errors='replace')
@@ -591,7 +777,15 @@ class IO:
             return d.decode('UTF-16',errors='replace')
         raise Exception()
     def _sz754set(self,sz754,encoding):
-        self.u32=len(sz754)
+        if encoding=='A':
+            sz754=sz754.encode('ascii',errors='replace')
+        elif encoding=='U':
+            sz754=sz754.encode('UTF-8',errors='replace')
+        elif encoding=='W':
+            sz754=sz754.encode('UTF-16',errors='replace')
+        else:
+            raise Exception()
+        self.u32=len(sz754)+1 # the length includes the terminating zero
         self.setBytes(sz754)
         self.u8=0
     @property
@@ -0,0 +1,1099 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+"""
+A native layer compositor, so that flattening an xcf document
+does not need any outside libraries (other than numpy).
+
+Pixels are worked on as float32 arrays, with the layer stack kept in
+linear light and each layer blended and composited in whatever color
+spaces its blend mode calls for, the same as gimp 2.10 does.
+"""
+from typing import Union, List, Tuple, Dict, Callable, Any, Iterator, BinaryIO
+import struct
+import contextlib
+import zlib
+import PIL.Image
+from gimpFormats.gimpTileCache import GimpTileCache
+try:
+    import numpy as np
+    has_numpy=True
+except ImportError:
+    has_numpy=False
+
+
+# color spaces (the values gimp uses in PROP_BLEND_SPACE, PROP_COMPOSITE_SPACE)
+SPACE_LINEAR=1
+SPACE_PERCEPTUAL=2
+SPACE_LAB=3
+
+# composite modes (the values gimp uses in PROP_COMPOSITE_MODE)
+COMPOSITE_UNION=1
+COMPOSITE_CLIP_TO_BACKDROP=2
+COMPOSITE_CLIP_TO_LAYER=3
+COMPOSITE_INTERSECTION=4
+
+# luminance of linear srgb
+_LUMINANCE=(0.2126,0.7152,0.0722)
+
+# linear srgb to XYZ (D50 adapted, which is what cie lab is relative to)
+_RGB_TO_XYZ=[
+    [0.4360747,0.3850649,0.1430804],
+    [0.2225045,0.7168786,0.0606169],
+    [0.0139322,0.0971045,0.7141733]]
+_WHITE_POINT=(0.9642,1.0,0.8249)
+
+_EPSILON=1e-6
+
+# how much compressed png data to gather up before writing it out
+_PNG_CHUNK_SIZE=256*1024
+
+# how finely linear values are quantized when converting to 8-bit srgb
+_LUT_STEPS=65535
+
+
+def _toLinear(c:'np.ndarray')->'np.ndarray':
+    """
+    convert srgb (perceptual) values to linear light
+
+    values outside 0..1 are mirrored, so nothing is lost
+    """
+    a=np.abs(c)
+    ret=np.where(a<=0.04045,a/12.92,((a+0.055)/1.055)**2.4)
+    return np.copysign(ret,c).astype(np.float32,copy=False)
+
+def _toPerceptual(c:'np.ndarray')->'np.ndarray':
+    """
+    convert linear light values to srgb (perceptual)
+    """
+    a=np.abs(c)
+    ret=np.where(a<=0.0031308,a*12.92,1.055*a**(1/2.4)-0.055)
+    return np.copysign(ret,c).astype(np.float32,copy=False)
+
+if has_numpy:
+    # the power curves are slow, so 8-bit values go through lookup tables instead
+    _SRGB8_TO_LINEAR=_toLinear(np.arange(256,dtype=np.float32)/255.0)
+    _LINEAR_TO_SRGB8=np.clip(_toPerceptual(np.arange(_LUT_STEPS+1,dtype=np.float32)/_LUT_STEPS),0.0,1.0)
+    _LINEAR_TO_SRGB8=(_LINEAR_TO_SRGB8*255.0+0.5).astype(np.uint8)
+
+def _convert(c:'np.ndarray',fromSpace:int,toSpace:int)->'np.ndarray':
+    """
+    convert rgb values between linear and perceptual
+
+    (lab blending is done inside the lch blend functions,
+    which take linear values, so it counts as linear here)
+    """
+    if fromSpace==SPACE_LAB:
+        fromSpace=SPACE_LINEAR
+    if toSpace==SPACE_LAB:
+        toSpace=SPACE_LINEAR
+    if fromSpace==toSpace:
+        return c
+    if toSpace==SPACE_LINEAR:
+        return _toLinear(c)
+    return _toPerceptual(c)
+
+def _safeDiv(a:'np.ndarray',b:'np.ndarray')->'np.ndarray':
+    """
+    a/b without blowing up when b is zero
+    """
+    return a/np.where(np.abs(b)>_EPSILON,b,_EPSILON)
+
+def _luminance(c:'np.ndarray')->'np.ndarray':
+    return c[...,0]*_LUMINANCE[0]+c[...,1]*_LUMINANCE[1]+c[...,2]*_LUMINANCE[2]
+
+
+# ---- hue/saturation color models
+
+def _hue(c:'np.ndarray',mx:'np.ndarray',delta:'np.ndarray')->'np.ndarray':
+    """
+    the hue (0..1) shared by the hsv and hsl models
+    """
+    r,g,b=c[...,0],c[...,1],c[...,2]
+    d=np.where(delta>_EPSILON,delta,1.0)
+    h=np.where(mx==r,((g-b)/d)%6.0,np.where(mx==g,(b-r)/d+2.0,(r-g)/d+4.0))/6.0
+    return np.where(delta>_EPSILON,h,0.0)
+
+def _rgbToHsv(c:'np.ndarray')->Tuple['np.ndarray','np.ndarray','np.ndarray']:
+    mx=c.max(axis=-1)
+    delta=mx-c.min(axis=-1)
+    s=np.where(mx>_EPSILON,delta/np.where(mx>_EPSILON,mx,1.0),0.0)
+    return _hue(c,mx,delta),s,mx
+
+def _hsvToRgb(h:'np.ndarray',s:'np.ndarray',v:'np.ndarray')->'np.ndarray':
+    ret=[]
+    for n in (5.0,3.0,1.0):
+        k=(n+h*6.0)%6.0
+        ret.append(v-v*s*np.clip(np.minimum(k,4.0-k),0.0,1.0))
+    return np.stack(ret,axis=-1)
+
+def _rgbToHsl(c:'np.ndarray')->Tuple['np.ndarray','np.ndarray','np.ndarray']:
+    mx=c.max(axis=-1)
+    mn=c.min(axis=-1)
+    delta=mx-mn
+    l=(mx+mn)/2.0
+    d=1.0-np.abs(2.0*l-1.0)
+    s=np.where(d>_EPSILON,delta/np.where(d>_EPSILON,d,1.0),0.0)
+    return _hue(c,mx,delta),s,l
+
+def _hslToRgb(h:'np.ndarray',s:'np.ndarray',l:'np.ndarray')->'np.ndarray':
+    a=s*np.minimum(l,1.0-l)
+    ret=[]
+    for n in (0.0,8.0,4.0):
+        k=(n+h*12.0)%12.0
+        ret.append(l-a*np.clip(np.minimum(k-3.0,9.0-k),-1.0,1.0))
+    return np.stack(ret,axis=-1)
+
+
+# ---- cie lab
+
+def _labF(t:'np.ndarray')->'np.ndarray':
+    return np.where(t>(6/29)**3,np.cbrt(t),t/(3*(6/29)**2)+4/29)
+
+def _labFInverse(t:'np.ndarray')->'np.ndarray':
+    return np.where(t>6/29,t**3,3*(6/29)**2*(t-4/29))
+
+def _rgbToLab(c:'np.ndarray')->'np.ndarray':
+    """
+    linear rgb to cie lab
+    """
+    xyz=c@np.asarray(_RGB_TO_XYZ,dtype=np.float32).T
+    f=_labF(xyz/np.asarray(_WHITE_POINT,dtype=np.float32))
+    return np.stack((
+        116.0*f[...,1]-16.0,
+        500.0*(f[...,0]-f[...,1]),
+        200.0*(f[...,1]-f[...,2])),axis=-1)
+
+def _labToRgb(lab:'np.ndarray')->'np.ndarray':
+    """
+    cie lab to linear rgb
+    """
+    fy=(lab[...,0]+16.0)/116.0
+    f=np.stack((fy+lab[...,1]/500.0,fy,fy-lab[...,2]/200.0),axis=-1)
+    xyz=_labFInverse(f)*np.asarray(_WHITE_POINT,dtype=np.float32)
+    return xyz@np.linalg.inv(np.asarray(_RGB_TO_XYZ,dtype=np.float32)).T
+
+
+# ---- blend functions
+# each takes the backdrop and layer colors (in the blend space)
+# and returns the blended color
+
+def _blendNormal(a,b):
+    return b
+
+def _blendMultiply(a,b):
+    return a*b
+
+def _blendScreen(a,b):
+    return 1.0-(1.0-a)*(1.0-b)
+
+def _blendOverlay(a,b):
+    return np.where(a<0.5,2.0*a*b,1.0-2.0*(1.0-a)*(1.0-b))
+
+def _blendBrokenOverlay(a,b):
+    return a*(a+2.0*b*(1.0-a))
+
+def _blendDifference(a,b):
+    return np.abs(a-b)
+
+def _blendAddition(a,b):
+    return a+b
+
+def _blendSubtract(a,b):
+    return a-b
+
+def _blendDarken(a,b):
+    return np.minimum(a,b)
+
+def _blendLighten(a,b):
+    return np.maximum(a,b)
+
+def _blendHsvHue(a,b):
+    ha,sa,va=_rgbToHsv(a)
+    hb,sb,_=_rgbToHsv(b)
+    return np.where((sb>_EPSILON)[...,None],_hsvToRgb(hb,sa,va),a)
+
+def _blendHsvSaturation(a,b):
+    ha,_,va=_rgbToHsv(a)
+    _,sb,_=_rgbToHsv(b)
+    return _hsvToRgb(ha,sb,va)
+
+def _blendHslColor(a,b):
+    _,_,la=_rgbToHsl(a)
+    hb,sb,_=_rgbToHsl(b)
+    return _hslToRgb(hb,sb,la)
+
+def _blendHsvValue(a,b):
+    ha,sa,_=_rgbToHsv(a)
+    _,_,vb=_rgbToHsv(b)
+    return _hsvToRgb(ha,sa,vb)
+
+def _blendDivide(a,b):
+    return _safeDiv(a,b)
+
+def _blendDodge(a,b):
+    return np.minimum(_safeDiv(a,1.0-b),1.0)
+
+def _blendBurn(a,b):
+    return np.clip(1.0-_safeDiv(1.0-a,b),0.0,1.0)
+
+def _blendHardLight(a,b):
+    return np.where(b>0.5,1.0-(1.0-a)*(2.0-2.0*b),2.0*a*b)
+
+def _blendSoftLight(a,b):
+    return (1.0-a)*a*b+a*_blendScreen(a,b)
+
+def _blendGrainExtract(a,b):
+    return a-b+0.5
+
+def _blendGrainMerge(a,b):
+    return a+b-0.5
+
+def _blendVividLight(a,b):
+    return np.where(b<=0.5,_blendBurn(a,2.0*b),_blendDodge(a,2.0*b-1.0))
+
+def _blendPinLight(a,b):
+    return np.where(b>0.5,np.maximum(a,2.0*b-1.0),np.minimum(a,2.0*b))
+
+def _blendLinearLight(a,b):
+    return a+2.0*b-1.0
+
+def _blendHardMix(a,b):
+    return (a+b>=1.0).astype(np.float32)
+
+def _blendExclusion(a,b):
+    return a+b-2.0*a*b
+
+def _blendLinearBurn(a,b):
+    return a+b-1.0
+
+def _blendLumaDarken(a,b):
+    return np.where((_luminance(a)<=_luminance(b))[...,None],a,b)
+
+def _blendLumaLighten(a,b):
+    return np.where((_luminance(a)>=_luminance(b))[...,None],a,b)
+
+def _blendLuminance(a,b):
+    la=_luminance(a)[...,None]
+    lb=_luminance(b)[...,None]
+    return np.where(la>_EPSILON,a*_safeDiv(lb,la),lb)
+
+def _blendLchHue(a,b):
+    la=_rgbToLab(a)
+    lb=_rgbToLab(b)
+    chroma=np.hypot(la[...,1],la[...,2])
+    hue=np.arctan2(lb[...,2],lb[...,1])
+    hasHue=np.hypot(lb[...,1],lb[...,2])>_EPSILON
+    la[...,1]=np.where(hasHue,chroma*np.cos(hue),la[...,1])
+    la[...,2]=np.where(hasHue,chroma*np.sin(hue),la[...,2])
+    return _labToRgb(la)
+
+def _blendLchChroma(a,b):
+    la=_rgbToLab(a)
+    lb=_rgbToLab(b)
+    ca=np.hypot(la[...,1],la[...,2])
+    cb=np.hypot(lb[...,1],lb[...,2])
+    scale=np.where(ca>_EPSILON,cb/np.where(ca>_EPSILON,ca,1.0),0.0)
+    la[...,1:]*=scale[...,None]
+    return _labToRgb(la)
+
+def _blendLchColor(a,b):
+    la=_rgbToLab(a)
+    la[...,1:]=_rgbToLab(b)[...,1:]
+    return _labToRgb(la)
+
+def _blendLchLightness(a,b):
+    la=_rgbToLab(a)
+    la[...,0]=_rgbToLab(b)[...,0]
+    return _labToRgb(la)
+
+# gimp 2.8 integer math, kept by the legacy modes
+
+def _blendLegacyAddition(a,b):
+    return np.minimum(a+b,1.0)
+
+def _blendLegacySubtract(a,b):
+    return np.maximum(a-b,0.0)
+
+def _blendLegacyDivide(a,b):
+    return np.minimum((256.0/255.0*a)/(1.0/255.0+b),1.0)
+
+def _blendLegacyDodge(a,b):
+    return np.minimum((256.0/255.0*a)/(256.0/255.0-b),1.0)
+
+def _blendLegacyBurn(a,b):
+    return np.clip(1.0-(256.0/255.0*(1.0-a))/(1.0/255.0+b),0.0,1.0)
+
+def _blendLegacyHardLight(a,b):
+    return np.where(b>128.0/255.0,
+        1.0-(1.0-a)*(1.0-(b-128.0/255.0)*2.0),
+        np.minimum(a*b*2.0,1.0))
+
+def _blendLegacyGrainExtract(a,b):
+    return np.clip(a-b+0.5,0.0,1.0)
+
+def _blendLegacyGrainMerge(a,b):
+    return np.clip(a+b-0.5,0.0,1.0)
+
+
+# how each of GimpIOBase.BLEND_MODES works:
+#   (blend function,default blend space,default composite mode)
+# modes that are not a simple blend function have a name instead
+_LEGACY=None
+BLEND_MODE_INFO:List[Tuple[Union[str,Callable],int,Union[None,int]]]=[
+    (_blendNormal,SPACE_PERCEPTUAL,COMPOSITE_UNION), # Normal (legacy)
+    ('dissolve',SPACE_PERCEPTUAL,COMPOSITE_UNION),
+    ('behind',SPACE_PERCEPTUAL,COMPOSITE_UNION),
+    (_blendMultiply,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendScreen,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendBrokenOverlay,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendDifference,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacyAddition,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacySubtract,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendDarken,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLighten,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendHsvHue,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendHsvSaturation,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendHslColor,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendHsvValue,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacyDivide,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacyDodge,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacyBurn,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacyHardLight,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendSoftLight,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacyGrainExtract,SPACE_PERCEPTUAL,_LEGACY),
+    (_blendLegacyGrainMerge,SPACE_PERCEPTUAL,_LEGACY),
+    ('colorErase',SPACE_PERCEPTUAL,COMPOSITE_UNION), # Color erase (legacy)
+    (_blendOverlay,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLchHue,SPACE_LAB,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLchChroma,SPACE_LAB,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLchColor,SPACE_LAB,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLchLightness,SPACE_LAB,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendNormal,SPACE_LINEAR,COMPOSITE_UNION), # Normal
+    ('behind',SPACE_LINEAR,COMPOSITE_UNION),
+    (_blendMultiply,SPACE_LINEAR,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendScreen,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendDifference,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendAddition,SPACE_LINEAR,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendSubtract,SPACE_LINEAR,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendDarken,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLighten,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendHsvHue,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendHsvSaturation,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendHslColor,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendHsvValue,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendDivide,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendDodge,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendBurn,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendHardLight,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendSoftLight,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendGrainExtract,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendGrainMerge,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendVividLight,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendPinLight,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLinearLight,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendHardMix,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendExclusion,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLinearBurn,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLumaDarken,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLumaLighten,SPACE_PERCEPTUAL,COMPOSITE_CLIP_TO_BACKDROP),
+    (_blendLuminance,SPACE_LINEAR,COMPOSITE_CLIP_TO_BACKDROP),
+    ('colorErase',SPACE_PERCEPTUAL,COMPOSITE_UNION), # Color erase
+    ('erase',SPACE_LINEAR,COMPOSITE_UNION),
+    ('merge',SPACE_LINEAR,COMPOSITE_UNION),
+    ('split',SPACE_LINEAR,COMPOSITE_UNION),
+    (_blendNormal,SPACE_LINEAR,COMPOSITE_UNION)] # Pass through (for groups, see _compositeGroup)
+PASS_THROUGH=61
+
+
+def layerModeInfo(layer)->Tuple[Union[str,Callable],int,Union[None,int],int]:
+    """
+    work out how a layer is to be blended, taking into account
+    its blend space, composite space and composite mode properties
+
+    :return: (blend function,blend space,composite mode,composite space)
+        where a composite mode of None means the gimp 2.8 way
+    """
+    mode=layer.blendMode
+    if mode is None or not 0<=mode<len(BLEND_MODE_INFO):
+        mode=28 # Normal
+    blend,blendSpace,compositeMode=BLEND_MODE_INFO[mode]
+    if mode<23: # legacy modes ignore the newer properties
+        return blend,blendSpace,compositeMode,SPACE_PERCEPTUAL
+    if layer.blendSpace is not None and layer.blendSpace>0:
+        blendSpace=layer.blendSpace
+    if layer.compositeMode is not None and layer.compositeMode>0:
+        compositeMode=layer.compositeMode
+    compositeSpace=SPACE_LINEAR
+    if layer.compositeSpace is not None and layer.compositeSpace>0:
+        compositeSpace=layer.compositeSpace
+    return blend,blendSpace,compositeMode,compositeSpace
+
+def layerCanvasBounds(layer)->Union[None,Tuple[int,int,int,int]]:
+    """
+    the part of the canvas a layer can affect
+
+    :return: (x0,y0,x1,y1) or None if it can affect the whole canvas
+        (the clip to layer and intersection composite modes make
+        everything outside the layer transparent)
+    """
+    compositeMode=layerModeInfo(layer)[2]
+    if compositeMode in (COMPOSITE_CLIP_TO_LAYER,COMPOSITE_INTERSECTION):
+        return None
+    x,y=layer.xOffset or 0,layer.yOffset or 0
+    return (x,y,x+layer.width,y+layer.height)
+
+
+def _composite(a:'np.ndarray',aAlpha:'np.ndarray',
+    b:'np.ndarray',bAlpha:'np.ndarray',
+    comp:'np.ndarray',mode:int
+    )->Tuple['np.ndarray','np.ndarray']:
+    """
+    composite a blended color over the backdrop
+
+    :param a: backdrop color
+    :param aAlpha: backdrop alpha
+    :param b: layer color
+    :param bAlpha: layer alpha (with opacity and mask already applied)
+    :param comp: the blended color
+    :param mode: one of the COMPOSITE_ constants
+    :return: (color,alpha)
+    """
+    aA=aAlpha[...,None]
+    bA=bAlpha[...,None]
+    if mode==COMPOSITE_UNION:
+        alpha=aA+bA-aA*bA
+        color=_safeDiv(a*(aA-aA*bA)+b*(bA-aA*bA)+comp*(aA*bA),alpha)
+    elif mode==COMPOSITE_CLIP_TO_BACKDROP:
+        alpha=aA
+        color=a+(comp-a)*bA
+    elif mode==COMPOSITE_CLIP_TO_LAYER:
+        alpha=bA
+        color=b+(comp-b)*aA
+    elif mode==COMPOSITE_INTERSECTION:
+        alpha=aA*bA
+        color=comp
+    else:
+        raise Exception('ERR: unknown composite mode %s'%mode)
+    return color,alpha[...,0]
+
+def _compositeLegacy(a:'np.ndarray',aAlpha:'np.ndarray',
+    bAlpha:'np.ndarray',comp:'np.ndarray'
+    )->Tuple['np.ndarray','np.ndarray']:
+    """
+    the gimp 2.8 way of compositing (used by most legacy modes)
+
+    The backdrop alpha is never changed, and the layer only shows
+    as much as the backdrop is opaque.
+    """
+    compAlpha=np.minimum(aAlpha,bAlpha)
+    newAlpha=aAlpha+(1.0-aAlpha)*compAlpha
+    ratio=_safeDiv(compAlpha,newAlpha)[...,None]
+    return a+(comp-a)*ratio,aAlpha
+
+def _mix(a:'np.ndarray',aAlpha:'np.ndarray',
+    b:'np.ndarray',bAlpha:'np.ndarray',amount:'np.ndarray'
+    )->Tuple['np.ndarray','np.ndarray']:
+    """
+    cross-fade from a to b (with premultiplied alpha)
+    """
+    aW=aAlpha*(1.0-amount)
+    bW=bAlpha*amount
+    alpha=aW+bW
+    color=_safeDiv(a*aW[...,None]+b*bW[...,None],alpha[...,None])
+    return color,alpha
+
+def _colorErase(a:'np.ndarray',aAlpha:'np.ndarray',
+    b:'np.ndarray'
+    )->Tuple['np.ndarray','np.ndarray']:
+    """
+    remove the color b from a, making it transparent
+    (like the color to alpha filter)
+    """
+    alpha=np.where(a>b,_safeDiv(a-b,1.0-b),_safeDiv(b-a,b))
+    alpha=np.clip(alpha,0.0,1.0).max(axis=-1)
+    color=_safeDiv(a-b,alpha[...,None])+b
+    return color,aAlpha*alpha
+
+def _dissolveNoise(x0:int,y0:int,w:int,h:int)->'np.ndarray':
+    """
+    a fixed pseudo-random value (0..1) for every canvas pixel
+
+    It depends only on the pixel position, so a dissolve
+    looks the same no matter what part of the canvas is drawn.
+    """
+    y,x=np.mgrid[y0:y0+h,x0:x0+w].astype(np.uint32)
+    n=x*np.uint32(0x9E3779B1)^y*np.uint32(0x85EBCA77)
+    n^=n>>np.uint32(15)
+    n*=np.uint32(0x2C1B3C6D)
+    n^=n>>np.uint32(12)
+    return (n&np.uint32(0xFFFF)).astype(np.float32)/65536.0
+
+
+class GimpCompositor:
+    """
+    Flattens the layers of a GimpDocument into a single image.
+
+    Handles visibility, opacity, offsets, layer masks, layer groups
+    (including pass-through groups), every blend mode in
+    GimpIOBase.BLEND_MODES, and both the legacy (perceptual)
+    and the gimp 2.10 (linear) ways of blending.
+
+    Any part of the canvas can be composited on its own (see composite())
+    and only the layer and mask tiles that touch it are decoded, so
+    tiles() and save() can flatten a huge document a piece at a time.
+
+    It can also flatten a shrunken copy of the document (see reduction),
+    in which case all coordinates are in the shrunken pixels.
+
+    NOTE: requires numpy
+    """
+
+    def __init__(self,doc,tileSize:int=64,cacheBytes:int=32*1024*1024,
+        reduction:int=1):
+        """
+        :param doc: the GimpDocument to flatten
+        :param tileSize: how big a piece of the canvas tiles() and
+            save() work on at a time
+        :param cacheBytes: memory budget for keeping decoded layer tiles
+            around while working through the tiles (only used if the
+            document does not have its own tileCache)
+        :param reduction: shrink everything by this factor (1,2,4..64).
+            Each layer tile is block-averaged as it is decoded, so
+            full size layers are never in memory.  (Layers not on the
+            block grid get nudged up to half a shrunken pixel.)
+        """
+        if not has_numpy:
+            raise ImportError('GimpCompositor requires numpy')
+        if reduction not in (1,2,4,8,16,32,64):
+            raise Exception('ERR: reduction must be a power of 2, up to the 64 pixel tile size')
+        self.doc=doc
+        self.tileSize:int=tileSize
+        self.cacheBytes:int=cacheBytes
+        self.reduction:int=reduction
+        # what render() keeps around between calls, all keyed by tile (x,y)
+        self._renderedTiles:Dict[Tuple[int,int],'np.ndarray']={}
+        self._renderedBelow:Dict[Tuple[int,int],Tuple['np.ndarray','np.ndarray']]={}
+        self._renderedStack:Any=None # the layer stack they were rendered from
+        self._splitLayer:Any=None # the top-level layer _renderedBelow is beneath
+
+    @property
+    def layerTree(self)->List[Tuple[Any,list]]:
+        """
+        the layers as a tree of (layer,[children]), topmost first
+
+        In the file, group layers are followed directly by their
+        children, with each child's itemPath giving how deep it is.
+        """
+        root:List[Tuple[Any,list]]=[]
+        stack=[root]
+        for layer in self.doc.layers:
+            depth=len(layer.itemPath)-1 if layer.itemPath else 0
+            depth=min(depth,len(stack)-1)
+            del stack[depth+1:]
+            node=(layer,[])
+            stack[depth].append(node)
+            if layer.isGroup:
+                stack.append(node[1])
+        return root
+
+    @property
+    def width(self)->int:
+        """
+        width of the flattened image
+        """
+        return (self.doc.width+self.reduction-1)//self.reduction
+
+    @property
+    def height(self)->int:
+        """
+        height of the flattened image
+        """
+        return (self.doc.height+self.reduction-1)//self.reduction
+
+    def _layerRect(self,layer)->Tuple[int,int,int,int]:
+        """
+        (x,y,w,h) of a layer on the (possibly shrunken) canvas
+        """
+        f=self.reduction
+        lx,ly=layer.xOffset or 0,layer.yOffset or 0
+        if f==1:
+            return lx,ly,layer.width,layer.height
+        return (lx+f//2)//f,(ly+f//2)//f,(layer.width+f-1)//f,(layer.height+f-1)//f
+
+    def _scaleRect(self,rect:Union[None,Tuple[int,int,int,int]]
+        )->Union[None,Tuple[int,int,int,int]]:
+        """
+        convert a rectangle in document pixels to the shrunken canvas
+        """
+        f=self.reduction
+        if rect is None or f==1:
+            return rect
+        return (rect[0]//f,rect[1]//f,-(-rect[2]//f),-(-rect[3]//f))
+
+    def composite(self,bounds:Union[None,Tuple[int,int,int,int]]=None,
+        layerTree:Union[None,List[Tuple[Any,list]]]=None
+        )->Tuple['np.ndarray','np.ndarray']:
+        """
+        flatten all the layers
+
+        :param bounds: only composite this (x0,y0,x1,y1) part of the
+            canvas (if None, the whole canvas)
+        :param layerTree: the layerTree, if you already have it
+        :return: (color,alpha) float32 arrays of shape (height,width,3)
+            and (height,width), with the color in linear light and
+            not premultiplied
+        """
+        if bounds is None:
+            bounds=(0,0,self.width,self.height)
+        if layerTree is None:
+            layerTree=self.layerTree
+        x0,y0,x1,y1=bounds
+        color=np.zeros((y1-y0,x1-x0,3),dtype=np.float32)
+        alpha=np.zeros((y1-y0,x1-x0),dtype=np.float32)
+        self._compositeLayers(layerTree,color,alpha,x0,y0)
+        return color,alpha
+
+    def _toOutput(self,color:'np.ndarray',alpha:'np.ndarray')->'np.ndarray':
+        """
+        convert composite() results to 8-bit srgb
+        """
+        if self.doc.baseColorMode==1: # grayscale
+            color=color[...,:1]
+        ret=np.empty(color.shape[:-1]+(color.shape[-1]+1,),dtype=np.uint8)
+        ret[...,:-1]=_LINEAR_TO_SRGB8[(np.clip(color,0.0,1.0)*_LUT_STEPS+0.5).astype(np.uint16)]
+        ret[...,-1]=np.clip(alpha,0.0,1.0)*255.0+0.5
+        return ret
+
+    def asArray(self,bounds:Union[None,Tuple[int,int,int,int]]=None)->'np.ndarray':
+        """
+        flatten all the layers into an 8-bit srgb array
+
+        :param bounds: only this (x0,y0,x1,y1) part of the canvas
+        :return: uint8 array of shape (height,width,4)
+            (or (height,width,2) for grayscale documents)
+        """
+        return self._toOutput(*self.composite(bounds))
+
+    @property
+    def image(self)->'PIL.Image':
+        """
+        the flattened image
+        """
+        pixels=self.asArray()
+        return PIL.Image.fromarray(pixels,'LA' if pixels.shape[-1]==2 else 'RGBA')
+
+    def tiles(self)->Iterator[Tuple[Tuple[int,int,int,int],'np.ndarray']]:
+        """
+        flatten the canvas one tile at a time, left to right, top to bottom
+
+        Only one tile of output (plus one tile per level of group
+        nesting) is in memory at once, no matter how big the document is.
+
+        :return: generator of ((x0,y0,x1,y1),pixels), where pixels is
+            as returned by asArray()
+        """
+        layerTree=self.layerTree
+        with self._scratchTileCache():
+            for bounds in self._tileBounds():
+                yield bounds,self._toOutput(*self.composite(bounds,layerTree))
+
+    def _tileBounds(self,area:Union[None,Tuple[int,int,int,int]]=None
+        )->Iterator[Tuple[int,int,int,int]]:
+        """
+        the (x0,y0,x1,y1) of every tile, left to right, top to bottom
+
+        :param area: only the tiles touching this part of the canvas
+        """
+        width,height=self.width,self.height
+        tileSize=self.tileSize
+        x0,y0,x1,y1=area if area is not None else (0,0,width,height)
+        x0,y0=max(x0,0)//tileSize*tileSize,max(y0,0)//tileSize*tileSize
+        for y in range(y0,min(y1,height),tileSize):
+            for x in range(x0,min(x1,width),tileSize):
+                yield (x,y,min(x+tileSize,width),min(y+tileSize,height))
+
+    @contextlib.contextmanager
+    def _scratchTileCache(self)->Iterator[None]:
+        """
+        unless layers line up with the tile grid, neighbouring
+        output tiles need the same layer tiles, so while working through
+        tiles, keep them around (if the document isn't already)
+        """
+        doc=self.doc
+        if doc.tileCache is not None:
+            yield
+            return
+        doc.tileCache=GimpTileCache(self.cacheBytes)
+        try:
+            yield
+        finally:
+            doc.tileCache=None
+
+    def invalidate(self,bounds:Union[None,Tuple[int,int,int,int]]=None)->None:
+        """
+        forget what render() has cached for part of the canvas
+
+        :param bounds: (x0,y0,x1,y1) on the canvas (if None, everything)
+        """
+        if bounds is None:
+            self._renderedTiles.clear()
+            self._renderedBelow.clear()
+            return
+        for x,y,_,_ in self._tileBounds(bounds):
+            self._renderedTiles.pop((x,y),None)
+            self._renderedBelow.pop((x,y),None)
+
+    def render(self)->'np.ndarray':
+        """
+        like asArray(), but for calling over and over as layers change
+
+        Each tile of the result is kept, so the next call only
+        re-renders the tiles that have changed since (see
+        GimpLayer.markDirty()).  Also, when the changes are all in one
+        (top-level) layer or group, everything below it is kept as well,
+        so those tiles only need the layers from there up re-rendered.
+
+        :return: uint8 array of shape (height,width,4)
+            (or (height,width,2) for grayscale documents)
+        """
+        doc=self.doc
+        nodes=self.layerTree
+        self._collectDirty(nodes)
+        numChannels=2 if doc.baseColorMode==1 else 4
+        ret=np.empty((self.height,self.width,numChannels),dtype=np.uint8)
+        split=self._splitIndex(nodes)
+        with self._scratchTileCache():
+            for x0,y0,x1,y1 in self._tileBounds():
+                tile=self._renderedTiles.get((x0,y0))
+                if tile is None:
+                    tile=self._renderTile((x0,y0,x1,y1),nodes,split)
+                    self._renderedTiles[(x0,y0)]=tile
+                ret[y0:y1,x0:x1]=tile
+        return ret
+
+    def _renderTile(self,bounds:Tuple[int,int,int,int],
+        nodes:List[Tuple[Any,list]],split:Union[None,int])->'np.ndarray':
+        """
+        render one tile for render()
+
+        :param split: the top-level layer everything below which
+            gets cached in _renderedBelow (if None, don't)
+        """
+        if split is None:
+            return self._toOutput(*self.composite(bounds,nodes))
+        x0,y0,x1,y1=bounds
+        below=self._renderedBelow.get((x0,y0))
+        if below is None:
+            below=self.composite(bounds,nodes[split+1:])
+            self._renderedBelow[(x0,y0)]=below
+        color,alpha=below[0].copy(),below[1].copy()
+        self._compositeLayers(nodes[:split+1],color,alpha,x0,y0)
+        return self._toOutput(color,alpha)
+
+    def _splitIndex(self,nodes:List[Tuple[Any,list]])->Union[None,int]:
+        """
+        where _splitLayer is in the top level of the layerTree
+        """
+        for i,(layer,_) in enumerate(nodes):
+            if layer is self._splitLayer:
+                return i
+        return None
+
+    def _collectDirty(self,nodes:List[Tuple[Any,list]])->None:
+        """
+        gather up what has changed in the layers since the last render(),
+        and forget the cached tiles that are affected
+        """
+        doc=self.doc
+        stack=(doc.width,doc.height,doc.baseColorMode,
+            tuple((layer,tuple(layer.itemPath or ()),bool(layer.isGroup)) for layer in doc.layers))
+        if stack!=self._renderedStack: # layers added, removed, moved around, grouped...
+            self.invalidate()
+            self._renderedStack=stack
+            self._splitLayer=None
+        # which top-level layer each layer is under, and which of those changed
+        dirty:Dict[int,List[Union[None,Tuple[int,int,int,int]]]]={}
+        def gather(nodes,topLevel):
+            for layer,children in nodes:
+                if layer._dirtyRects:
+                    dirty.setdefault(topLevel,[]).extend(
+                        self._scaleRect(rect) for rect in layer._dirtyRects)
+                    layer._dirtyRects=[]
+                gather(children,topLevel)
+        for i,node in enumerate(nodes):
+            gather([node],i)
+        if not dirty:
+            return
+        if len(dirty)==1: # keep everything below the layer being changed
+            split=next(iter(dirty))
+            if nodes[split][0] is not self._splitLayer:
+                self._splitLayer=nodes[split][0]
+                self._renderedBelow.clear()
+        else:
+            self._splitLayer=None
+            self._renderedBelow.clear()
+        split=self._splitIndex(nodes)
+        for i,rects in dirty.items():
+            for rect in rects:
+                if split is not None and i<=split: # only above what is kept
+                    if rect is None:
+                        self._renderedTiles.clear()
+                    else:
+                        for x,y,_,_ in self._tileBounds(rect):
+                            self._renderedTiles.pop((x,y),None)
+                else:
+                    self.invalidate(rect)
+
+    def save(self,filename:Union[str,BinaryIO])->None:
+        """
+        flatten the document straight into a png file, a strip of
+        tiles at a time, so the whole image is never in memory
+
+        :param filename: filename or a binary file-like object
+        """
+        if hasattr(filename,'write'):
+            self._writePng(filename)
+        else:
+            with open(filename,'wb') as f:
+                self._writePng(f)
+
+    def _writePng(self,f:BinaryIO)->None:
+        """
+        write the flattened image as a png
+        """
+        def chunk(chunkType:bytes,data:bytes)->None:
+            f.write(struct.pack('>I',len(data)))
+            f.write(chunkType)
+            f.write(data)
+            f.write(struct.pack('>I',zlib.crc32(data,zlib.crc32(chunkType))))
+        width,height=self.width,self.height
+        grayscale=self.doc.baseColorMode==1
+        numChannels=2 if grayscale else 4
+        f.write(b'\x89PNG\r\n\x1a\n')
+        colorType=4 if grayscale else 6 # gray+alpha or rgba
+        chunk(b'IHDR',struct.pack('>IIBBBBB',width,height,8,colorType,0,0,0))
+        compressor=zlib.compressobj()
+        pending=bytearray()
+        strip=np.zeros((self.tileSize,width,numChannels),dtype=np.uint8)
+        # every row starts with a filter type byte (0=none)
+        filterBytes=np.zeros((self.tileSize,1),dtype=np.uint8)
+        for (x0,y0,x1,y1),pixels in self.tiles():
+            strip[0:y1-y0,x0:x1]=pixels
+            if x1==width: # finished a strip
+                rows=strip[0:y1-y0].reshape(y1-y0,width*numChannels)
+                rows=np.concatenate((filterBytes[0:y1-y0],rows),axis=1)
+                pending.extend(compressor.compress(rows.tobytes()))
+                if len(pending)>=_PNG_CHUNK_SIZE:
+                    chunk(b'IDAT',bytes(pending))
+                    pending.clear()
+        pending.extend(compressor.flush())
+        chunk(b'IDAT',bytes(pending))
+        chunk(b'IEND',b'')
+
+    def _compositeLayers(self,nodes:List[Tuple[Any,list]],
+        color:'np.ndarray',alpha:'np.ndarray',x:int,y:int)->None:
+        """
+        composite layers (bottom first) onto the backdrop, in place
+
+        :param x: where the backdrop is on the canvas
+        :param y: where the backdrop is on the canvas
+        """
+        for layer,children in reversed(nodes):
+            if layer.visible is False:
+                continue
+            if layer.isGroup:
+                self._compositeGroup(layer,children,color,alpha,x,y)
+            else:
+                self._compositeLayer(layer,None,color,alpha,x,y)
+
+    def _compositeGroup(self,layer,children:List[Tuple[Any,list]],
+        color:'np.ndarray',alpha:'np.ndarray',x:int,y:int)->None:
+        """
+        composite a layer group onto the backdrop, in place
+        """
+        h,w=alpha.shape
+        if layer.blendMode==PASS_THROUGH:
+            # children go straight onto the backdrop, then
+            # the group's opacity and mask fade that back in
+            groupColor=color.copy()
+            groupAlpha=alpha.copy()
+            self._compositeLayers(children,groupColor,groupAlpha,x,y)
+            amount=np.full((h,w),self._opacity(layer),dtype=np.float32)
+            mask=self._maskPixels(layer,x,y,w,h)
+            if mask is not None:
+                amount*=mask
+            color[...],alpha[...]=_mix(color,alpha,groupColor,groupAlpha,amount)
+            return
+        groupColor=np.zeros((h,w,3),dtype=np.float32)
+        groupAlpha=np.zeros((h,w),dtype=np.float32)
+        self._compositeLayers(children,groupColor,groupAlpha,x,y)
+        self._compositeLayer(layer,(groupColor,groupAlpha,x,y),color,alpha,x,y)
+
+    def _opacity(self,layer)->float:
+        """
+        layer opacity 0..1 (it can be stored either as a float or 0..255)
+        """
+        if layer.opacity is None:
+            return 1.0
+        if isinstance(layer.opacity,float):
+            return layer.opacity
+        return layer.opacity/255.0
+
+    def _toFloat(self,pixels:'np.ndarray')->'np.ndarray':
+        """
+        normalize pixel values to float32 0..1
+        """
+        if pixels.dtype.kind=='f':
+            return pixels.astype(np.float32)
+        return pixels.astype(np.float32)/np.float32(np.iinfo(pixels.dtype).max)
+
+    def _layerPixels(self,layer,bounds:Tuple[int,int,int,int]
+        )->Union[None,Tuple['np.ndarray','np.ndarray',int,int]]:
+        """
+        get the part of a layer covering a canvas rectangle,
+        as linear rgb and alpha
+
+        :param bounds: (x0,y0,x1,y1) on the canvas
+        :return: (color,alpha,x,y) where x,y is the canvas position
+            of the pixels returned (or None if there is nothing there)
+        """
+        lx,ly,_,_=self._layerRect(layer)
+        x0,y0=max(bounds[0],lx),max(bounds[1],ly)
+        pixels=layer.asArray((x0-lx,y0-ly,bounds[2]-lx,bounds[3]-ly),self.reduction)
+        if pixels is None:
+            return None
+        hasAlpha=pixels.shape[-1] in (2,4)
+        precision=self.doc.precision
+        gamma=precision is None or precision.gamma
+        if layer.colorMode in (4,5): # indexed
+            colormap=_SRGB8_TO_LINEAR[np.asarray(self.doc.colorMap,dtype=np.uint8)]
+            color=colormap[pixels[...,0]]
+        else:
+            color=pixels[...,:-1] if hasAlpha else pixels
+            if gamma and color.dtype==np.uint8:
+                color=_SRGB8_TO_LINEAR[color]
+            elif gamma:
+                color=_toLinear(self._toFloat(color))
+            else:
+                color=self._toFloat(color)
+            if color.shape[-1]==1:
+                color=np.repeat(color,3,axis=-1)
+        if hasAlpha:
+            alpha=self._toFloat(pixels[...,-1])
+        else:
+            alpha=np.ones(pixels.shape[:2],dtype=np.float32)
+        return color,alpha,x0,y0
+
+    def _maskPixels(self,layer,x:int,y:int,w:int,h:int)->Union[None,'np.ndarray']:
+        """
+        get the part of a layer mask covering a canvas rectangle
+
+        :return: float32 array of shape (h,w) or None if no mask applies
+        """
+        if not layer.applyMask:
+            return None
+        mask=layer.mask
+        if mask is None:
+            return None
+        lx,ly,_,_=self._layerRect(layer)
+        x0,y0=max(x,lx),max(y,ly)
+        maskPixels=mask.asArray((x0-lx,y0-ly,x+w-lx,y+h-ly),self.reduction)
+        if maskPixels is None:
+            return None
+        ret=np.zeros((h,w),dtype=np.float32)
+        mh,mw=maskPixels.shape[:2]
+        ret[y0-y:y0-y+mh,x0-x:x0-x+mw]=self._toFloat(maskPixels[...,0])
+        return ret
+
+    def _compositeLayer(self,layer,
+        pixels:Union[None,Tuple['np.ndarray','np.ndarray',int,int]],
+        color:'np.ndarray',alpha:'np.ndarray',x:int,y:int)->None:
+        """
+        composite a single layer onto the backdrop, in place
+
+        :param pixels: (color,alpha,x,y) of the layer
+            (if None, get them from the layer itself)
+        :param x: where the backdrop is on the canvas
+        :param y: where the backdrop is on the canvas
+        """
+        blend,blendSpace,compositeMode,compositeSpace=layerModeInfo(layer)
+        # work out what part of the backdrop this touches
+        h,w=alpha.shape
+        if pixels is None:
+            lx,ly,lw,lh=self._layerRect(layer)
+            lx-=x
+            ly-=y
+        else:
+            lh,lw=pixels[1].shape
+            lx,ly=pixels[2]-x,pixels[3]-y
+        if compositeMode in (COMPOSITE_CLIP_TO_LAYER,COMPOSITE_INTERSECTION):
+            x0,y0,x1,y1=0,0,w,h # clears everything outside the layer too
+        else:
+            x0,y0=max(lx,0),max(ly,0)
+            x1,y1=min(lx+lw,w),min(ly+lh,h)
+        if x1<=x0 or y1<=y0:
+            return
+        if pixels is None:
+            pixels=self._layerPixels(layer,(x0+x,y0+y,x1+x,y1+y))
+            if pixels is None:
+                return
+        layerColor,layerAlpha,lx,ly=pixels
+        lx-=x
+        ly-=y
+        lh,lw=layerAlpha.shape
+        # line the layer up with the backdrop
+        if (x0,y0,x1,y1)==(lx,ly,lx+lw,ly+lh):
+            b=layerColor
+            bAlpha=layerAlpha*np.float32(self._opacity(layer))
+        else:
+            b=np.zeros((y1-y0,x1-x0,3),dtype=np.float32)
+            bAlpha=np.zeros((y1-y0,x1-x0),dtype=np.float32)
+            sx0,sy0=max(x0,lx),max(y0,ly)
+            sx1,sy1=min(x1,lx+lw),min(y1,ly+lh)
+            if sx1>sx0 and sy1>sy0:
+                b[sy0-y0:sy1-y0,sx0-x0:sx1-x0]=layerColor[sy0-ly:sy1-ly,sx0-lx:sx1-lx]
+                bAlpha[sy0-y0:sy1-y0,sx0-x0:sx1-x0]=layerAlpha[sy0-ly:sy1-ly,sx0-lx:sx1-lx]
+            bAlpha*=np.float32(self._opacity(layer))
+        mask=self._maskPixels(layer,x0+x,y0+y,x1-x0,y1-y0)
+        if mask is not None:
+            bAlpha=bAlpha*mask
+        a=color[y0:y1,x0:x1]
+        aAlpha=alpha[y0:y1,x0:x1]
+        with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+            if blend=='dissolve':
+                noise=_dissolveNoise(x0+x,y0+y,x1-x0,y1-y0)
+                bAlpha=(noise<bAlpha).astype(np.float32)
+                blend=_blendNormal
+            if blend=='behind':
+                a2=_convert(a,SPACE_LINEAR,compositeSpace)
+                b2=_convert(b,SPACE_LINEAR,compositeSpace)
+                outColor,outAlpha=_composite(b2,bAlpha,a2,aAlpha,a2,COMPOSITE_UNION)
+            elif blend=='colorErase':
+                a2=_convert(a,SPACE_LINEAR,blendSpace)
+                b2=_convert(b,SPACE_LINEAR,blendSpace)
+                erased,erasedAlpha=_colorErase(a2,aAlpha,b2)
+                outColor,outAlpha=_mix(a2,aAlpha,erased,erasedAlpha,bAlpha)
+                outColor=_convert(outColor,blendSpace,compositeSpace)
+            elif blend=='erase':
+                outColor,outAlpha=_convert(a,SPACE_LINEAR,compositeSpace),aAlpha*(1.0-bAlpha)
+            elif blend=='merge':
+                aW=np.minimum(aAlpha,1.0-bAlpha)
+                outAlpha=aW+bAlpha
+                a2=_convert(a,SPACE_LINEAR,compositeSpace)
+                b2=_convert(b,SPACE_LINEAR,compositeSpace)
+                outColor=_safeDiv(a2*aW[...,None]+b2*bAlpha[...,None],outAlpha[...,None])
+            elif blend=='split':
+                outColor,outAlpha=_convert(a,SPACE_LINEAR,compositeSpace),np.maximum(aAlpha-bAlpha,0.0)
+            else:
+                comp=blend(_convert(a,SPACE_LINEAR,blendSpace),_convert(b,SPACE_LINEAR,blendSpace))
+                comp=_convert(comp,blendSpace,compositeSpace)
+                a2=_convert(a,SPACE_LINEAR,compositeSpace)
+                if compositeMode is _LEGACY:
+                    outColor,outAlpha=_compositeLegacy(a2,aAlpha,bAlpha,comp)
+                else:
+                    b2=_convert(b,SPACE_LINEAR,compositeSpace)
+                    outColor,outAlpha=_composite(a2,aAlpha,b2,bAlpha,comp,compositeMode)
+            outColor=_convert(outColor,compositeSpace,SPACE_LINEAR)
+        # fully transparent pixels have no color
+        color[y0:y1,x0:x1]=np.where((outAlpha>0.0)[...,None],outColor,0.0)
+        alpha[y0:y1,x0:x1]=outAlpha
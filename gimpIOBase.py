@@ -3,12 +3,166 @@
 """
 A specialized binary file base for Gimp files
 """
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Dict, Callable, Any, BinaryIO
 import struct
+import array
+import itertools
 from gimpFormats.binaryIO import IO
 from gimpFormats.gimpParasites import GimpParasite
 
 
+# hands out a unique number to every object
+_CACHE_TOKENS=itertools.count()
+# a guideline is an int32 position followed by an int8 orientation
+_GUIDE_STRUCT=struct.Struct('>ib')
+# every property starts with a uint32 type and a uint32 payload length
+_PROPERTY_HEADER=struct.Struct('>II')
+_U32=struct.Struct('>I')
+# file pointers are 32-bit before gimp version 11 and 64-bit since
+_POINTER32=struct.Struct('>I')
+_POINTER64=struct.Struct('>Q')
+
+
+def _valueDecoder(name:str,fmt:str,convert:Union[None,Callable]=None)->Callable:
+    """
+    create a decoder that unpacks a single value into an attribute
+    """
+    unpack=struct.Struct(fmt).unpack_from
+    if convert is None:
+        def decode(item,data,index,length):
+            setattr(item,name,unpack(data,index)[0])
+    else:
+        def decode(item,data,index,length):
+            setattr(item,name,convert(unpack(data,index)[0]))
+    return decode
+
+def _tupleDecoder(name:str,fmt:str)->Callable:
+    """
+    create a decoder that unpacks several values into a tuple attribute
+    """
+    unpack=struct.Struct(fmt).unpack_from
+    def decode(item,data,index,length):
+        setattr(item,name,unpack(data,index))
+    return decode
+
+def _pairDecoder(name1:str,name2:str,fmt:str)->Callable:
+    """
+    create a decoder that unpacks two values into two attributes
+    """
+    unpack=struct.Struct(fmt).unpack_from
+    def decode(item,data,index,length):
+        v1,v2=unpack(data,index)
+        setattr(item,name1,v1)
+        setattr(item,name2,v2)
+    return decode
+
+def _flagDecoder(name:str)->Callable:
+    """
+    create a decoder for a property whose presence alone means True
+    """
+    def decode(item,data,index,length):
+        setattr(item,name,True)
+    return decode
+
+def _bufferDecoder(methodName:str)->Callable:
+    """
+    create a decoder that hands a (zero-copy) view of the payload
+    to one of the item's _xxxDecode_ methods
+    """
+    def decode(item,data,index,length):
+        getattr(item,methodName)(data[index:index+length])
+    return decode
+
+def _tattooDecode(item,data,index,length):
+    item.uniqueId=data[index:index+length].hex()
+
+def _oldSamplePointsDecode(item,data,index,length):
+    raise Exception("ERR: old sample points structure not supported")
+
+
+def _valueEncoder(name:str,fmt:str,onlyIfSet:bool=False)->Callable:
+    """
+    create an encoder that packs a single attribute
+
+    :param onlyIfSet: skip the property when the value is False/0/empty,
+        not only when it is None
+    """
+    pack=struct.Struct(fmt).pack
+    def encode(item,propertyType):
+        value=getattr(item,name)
+        if value is None or (onlyIfSet and not value):
+            return None
+        return pack(value)
+    return encode
+
+def _pairEncoder(name1:str,name2:str,fmt:str)->Callable:
+    """
+    create an encoder that packs two attributes
+    """
+    pack=struct.Struct(fmt).pack
+    def encode(item,propertyType):
+        v1=getattr(item,name1)
+        v2=getattr(item,name2)
+        if v1 is None or v2 is None:
+            return None
+        return pack(v1,v2)
+    return encode
+
+def _flagEncoder(name:str)->Callable:
+    """
+    create an encoder for a property whose presence alone means True
+    """
+    def encode(item,propertyType):
+        if getattr(item,name):
+            return b''
+        return None
+    return encode
+
+def _bufferEncoder(name:str,methodName:str,onlyIfSet:bool=True)->Callable:
+    """
+    create an encoder that calls one of the item's _xxxEncode_ methods
+
+    :param name: the attribute that must be set for the property to be saved
+    """
+    def encode(item,propertyType):
+        value=getattr(item,name)
+        if value is None or (onlyIfSet and not value):
+            return None
+        return getattr(item,methodName)()
+    return encode
+
+def _selectedEncode(item,propertyType):
+    # layers and channels are both "selected", but they save it differently
+    if item.selected and item._SELECTED_PROPERTY_==propertyType:
+        return b''
+    return None
+
+def _tattooEncode(item,propertyType):
+    if item.uniqueId is None:
+        return None
+    return _U32.pack(int(item.uniqueId,16))
+
+def _opacityEncode(item,propertyType):
+    if item.opacity is None or isinstance(item.opacity,float):
+        return None
+    return _U32.pack(item.opacity)
+
+def _floatOpacityEncode(item,propertyType):
+    if not isinstance(item.opacity,float):
+        return None
+    return struct.pack('>f',item.opacity)
+
+def _colorEncode(item,propertyType):
+    if item.color is None or item.isFloatColor(item.color):
+        return None
+    return bytes(item.color[0:3])
+
+def _floatColorEncode(item,propertyType):
+    if item.color is None or not item.isFloatColor(item.color):
+        return None
+    return struct.pack('>3f',*item.color[0:3])
+
+
 class GimpIOBase:
     """
     A specialized binary file base for Gimp files
@@ -128,47 +282,76 @@ class GimpIOBase:
     PROP_SAMPLE_POINTS      = 39
     PROP_NUM_PROPS          = 40
 
+    _SELECTED_PROPERTY_=PROP_ACTIVE_LAYER # how self.selected gets saved
+
+    # Any item can carry any of the gimp properties, but most only
+    # carry a handful, so they are kept in slots that cost nothing
+    # beyond a pointer until they are set.  Until then, reading one
+    # gives its default from here.
+    _DEFAULTS_:Dict[str,Any]={
+        'itemPath':None, # Union[List[int],None]
+        'userUnits':None, # Union[GimpUserUnits,None]
+        'selected':False,
+        'isSelection':False,
+        'selectionAttachedTo':None, # Union[int,None]
+        'blendMode':None, # Union[int,None] one of self.BLEND_MODES
+        'visible':None, # Union[bool,None]
+        'isLinked':None, # Union[bool,None]
+        'lockAlpha':None, # Union[bool,None]
+        'applyMask':None, # Union[bool,None]
+        'editingMask':None, # Union[bool,None]
+        'showMask':None, # Union[bool,None]
+        'showMasked':None, # Union[bool,None]
+        'xOffset':None, # Union[int,None]
+        'yOffset':None, # Union[int,None]
+        'compression':None, # Union[int,None] one of self.COMPRESSION_MODES
+        'horizontalResolution':None, # Union[float,None]
+        'verticalResolution':None, # Union[float,None]
+        'uniqueId':None, # Union[str,None]
+        'units':None, # Union[int,None] one of self.UNITS
+        'textLayerFlags':None, # Union[int,None]
+        'locked':None, # Union[bool,None]
+        'isGroup':None, # Union[bool,None]
+        'groupItemFlags':None, # Union[int,None]
+        'positionLocked':None, # Union[bool,None]
+        'opacity':None, # Union[int,float,None]
+        'colorTag':None, # Union[int,None] one of self.TAG_COLORS
+        'compositeMode':None, # Union[int,None] one of self.COMPOSITE_MODES
+        'compositeSpace':None, # Union[int,None] one of self.COMPOSITE_SPACES
+        'blendSpace':None, # Union[int,None]
+        'color':None, # Union[Tuple[int,int,int],Tuple[float,float,float],None]
+        'vectorsVersion':0,
+        'activeVectorIndex':0,
+        'activePathIndex':0,
+        '_doc':None} # Union['GimpDocument',None] (see self.doc)
+    # these default to a new, empty list, created when first used
+    _LIST_DEFAULTS_:Tuple[str,...]=(
+        'parasites', # List[GimpParasite]
+        'guidelines', # List[Tuple[bool,int]]
+        'vectors', # List[GimpVector]
+        'colorMap', # List[Tuple[int,int,int]]
+        'samplePoints', # List[Tuple[int,int]]
+        'paths') # List[GimpOldPath]
+
+    __slots__=('parent','_cacheToken')+_LIST_DEFAULTS_+tuple(_DEFAULTS_)
+
     def __init__(self,parent: Union['GimpDocument', 'GimpImageHierarchy', 'GimpLayer']) -> None:
         self.parent=parent
-        self.parasites:List[GimpParasite]=[]
-        self.guidelines:List[Tuple[bool,int]]=[]
-        self.itemPath:Union[str,None]=None
-        self.vectors:List['GimpVector']=[]
-        self.colorMap:List[Tuple[int,int,int]]=[]
-        self.userUnits:Union[GimpUserUnits,None]=None
-        self.samplePoints:List[Tuple[int,int]]=[]
-        self.selected:bool=False
-        self.isSelection:bool=False
-        self.selectionAttachedTo:Union[str,None]=None
-        self.blendMode:Union[int,None]=None # one of self.BLEND_MODES
-        self.visible:Union[bool,None]=None
-        self.isLinked:Union[bool,None]=None
-        self.lockAlpha:Union[bool,None]=None
-        self.applyMask:Union[bool,None]=None
-        self.editingMask:Union[bool,None]=None
-        self.showMask:Union[bool,None]=None
-        self.showMasked:Union[bool,None]=None
-        self.xOffset:Union[int,None]=None
-        self.yOffset:Union[int,None]=None
-        self.compression:Union[int,None]=None # one of self.COMPRESSION_MODES
-        self.horizontalResolution:Union[int,None]=None
-        self.verticalResolution:Union[int,None]=None
-        self.uniqueId:Union[int,None]=None
-        self.units:Union[int,None]=None # one of self.UNITS
-        self.textLayerFlags:Union[int,None]=None
-        self.locked:Union[bool,None]=None
-        self.isGroup:Union[bool,None]=None
-        self.groupItemFlags:Union[int,None]=None
-        self.positionLocked:Union[bool,None]=None
-        self.opacity:Union[float,None]=None
-        self.colorTag:Union[int,None]=None # one of self.TAG_COLORS
-        self.compositeMode:Union[int,None]=None # one of self.COMPOSITE_MODES
-        self.compositeSpace:Union[int,None]=None # one of self.COMPOSITE_SPACES
-        self.blendSpace:Union[int,None]=None
-        self.color:Union[Tuple[int,int,int],None]=None
-        self.vectorsVersion:Union[float,None]=0
-        self.activeVectorIndex:Union[int,None]=0
-        self.paths:List[List[float]]=[]
+        self._cacheToken:int=next(_CACHE_TOKENS) # unlike id(), never reused (see GimpTileCache)
+
+    def __getattr__(self,name:str)->Any:
+        """
+        only called for attributes that have not been set yet,
+        so hand back the default
+        """
+        if name in self._LIST_DEFAULTS_:
+            value:list=[]
+            setattr(self,name,value)
+            return value
+        try:
+            return self._DEFAULTS_[name]
+        except KeyError:
+            raise AttributeError("'%s' object has no attribute '%s'"%(self.__class__.__name__,name)) from None
 
     @property
     def _POINTER_SIZE_(self) -> int:
@@ -180,33 +363,62 @@ class GimpIOBase:
             since then it is 64-bit, thus supporting
             larger image files
         """
-        if self.doc.version>=11:
-            return 64
-        return 32
+        return self.doc._pointerStruct.size*8
     def _pointerDecode_(self,io: IO) -> int:
-        if self._POINTER_SIZE_==64:
-            return io.u64
-        return io.u32
+        pointerStruct=self.doc._pointerStruct
+        ptr=pointerStruct.unpack_from(io.data,io.index)[0]
+        io.index+=pointerStruct.size
+        return ptr
+    def _pointersDecode_(self,io: IO,count: int) -> array.array:
+        """
+        decode a whole table of pointers at once
+        """
+        if self.doc._pointerStruct is _POINTER64:
+            return io.u64array(count)
+        return io.u32array(count)
     def _pointerEncode_(self,ptr,io=None)->bytearray:
         if not isinstance(ptr,int):
             raise Exception('pointer is wrong type = '+str(type(ptr)))
         if io is None:
             io=IO()
-        if self._POINTER_SIZE_==64:
-            io.u64=ptr
-        else:
-            io.u32=ptr
+        io.addBytes(self.doc._pointerStruct.pack(ptr))
         return io.data
+    def _pointersEncode_(self,ptrs:List[int])->bytes:
+        """
+        encode a whole table of pointers at once
+        """
+        if self.doc._pointerStruct is _POINTER64:
+            return struct.pack('>%dQ'%len(ptrs),*ptrs)
+        return struct.pack('>%dI'%len(ptrs),*ptrs)
+    def _pointersPatch_(self,f:BinaryIO,tableIndex:int,ptrs:List[int])->None:
+        """
+        go back and fill in a pointer table that was written
+        out as a placeholder, then return to the end of the file
+
+        :param f: the file being written
+        :param tableIndex: where the table is in the file
+        :param ptrs: the pointers to write there
+        """
+        endIndex=f.tell()
+        f.seek(tableIndex)
+        f.write(self._pointersEncode_(ptrs))
+        f.seek(endIndex)
 
     @property
     def doc(self) -> 'GimpDocument':
         """
         Get the main document object
+
+        (Items never move between documents, so this is only
+        looked up once.)
         """
-        item=self
-        while item.parent!=item:
-            item=item.parent
-        return item
+        doc=self._doc
+        if doc is None:
+            doc=self
+            while doc.parent is not doc:
+                doc=doc.parent
+            self._doc=doc
+        return doc
     @property
     def root(self):
         """
@@ -248,28 +460,39 @@ class GimpIOBase:
             io.addBytes(parasite.toBytes())
         return io.data
 
+    def _guidelinesEncode_(self):
+        """
+        encode guidelines
+        """
+        io=IO()
+        for isVertical,position in self.guidelines:
+            io.addBytes(_GUIDE_STRUCT.pack(position,2 if isVertical else 1))
+        return io.data
+
     def _guidelinesDecode_(self,data):
         """
         decode guidelines
         """
-        index=0
-        while index<len(data):
-            position=struct.unpack('>I',data[index:index+4])[0]; index+=4
-            isVertical=data[index]==2; index+=1
-            self.guidelines.append((isVertical,position))
+        for position,orientation in _GUIDE_STRUCT.iter_unpack(data):
+            self.guidelines.append((orientation==2,position))
 
     def _itemPathDecode_(self,data):
         """
         decode item path
         """
-        index=0
-        path=[]
-        while index<len(data):
-            p=struct.unpack('>I',data[index:index+4])[0]; index+=4
-            path.append(p)
+        path=IO(data).u32array(len(data)//4).tolist()
         self.itemPath=path
         return path
 
+    def _itemPathEncode_(self):
+        """
+        encode item path
+        """
+        io=IO()
+        for p in self.itemPath:
+            io.u32=p
+        return io.data
+
     def _vectorsDecode_(self,data):
         """
         decode vectors
@@ -284,6 +507,18 @@ class GimpIOBase:
             index=gv.fromBytes(data,index)
             self.vectors.append(gv)
 
+    def _vectorsEncode_(self):
+        """
+        encode vectors
+        """
+        io=IO()
+        io.u32=self.vectorsVersion
+        io.u32=self.activeVectorIndex
+        io.u32=len(self.vectors)
+        for gv in self.vectors:
+            io.addBytes(gv.toBytes())
+        return io.data
+
     @property
     def activeVector(self):
         """
@@ -313,22 +548,22 @@ class GimpIOBase:
 
         decode colormap/palette
         """
-        ioObj=None
         if isinstance(data,IO):
-            ioObj=data
-            index=data.index
-            data=data.data
-        _=struct.unpack('>I',data[0:4])[0] # number of colors
-        index+=4
-        colors=[]
-        while index<len(data):
-            r=data[index]; index+=1
-            g=data[index]; index+=1
-            b=data[index]; index+=1
-            colors.append((r,g,b))
-        self.colorMap=colors
-        if ioObj is not None:
-            ioObj.index=index
+            io=data
+        else:
+            io=IO(data,index or 0)
+        numColors=io.u32
+        self.colorMap=io.u8triples(numColors)
+
+    def _colormapEncode_(self):
+        """
+        encode colormap/palette
+        """
+        io=IO()
+        io.u32=len(self.colorMap)
+        for r,g,b in self.colorMap:
+            io.addBytes(bytes((r,g,b)))
+        return io.data
 
     def _userUnitsDecode_(self,data):
         """
@@ -338,117 +573,68 @@ class GimpIOBase:
         u.fromBytes(data)
         self.userUnits=u
 
+    def _userUnitsEncode_(self):
+        """
+        encode a set of user-defined measurement units
+        """
+        return self.userUnits.toBytes()
+
     def _samplePointsDecode_(self,data):
         """
         decode a series of points
         """
-        index=0
-        samplePoints=[]
-        while index<len(data):
-            x=struct.unpack('>I',data[index:index+4])[0]; index+=4
-            y=struct.unpack('>I',data[index:index+4])[0]; index+=4
-            samplePoints.append((x,y))
-        self.samplePoints=samplePoints
+        coords=IO(data).u32array(len(data)//4)
+        self.samplePoints=list(zip(coords[0::2],coords[1::2]))
+
+    def _samplePointsEncode_(self):
+        """
+        encode a series of points
+        """
+        io=IO()
+        for x,y in self.samplePoints:
+            io.u32=x
+            io.u32=y
+        return io.data
+
+    def _pathsDecode_(self,data):
+        """
+        decode the old-style list of paths
+        """
+        import gimpFormats.gimpVectors
+        io=IO(data)
+        self.activePathIndex=io.u32
+        numPaths=io.u32
+        for _ in range(numPaths):
+            path=gimpFormats.gimpVectors.GimpOldPath(self)
+            io.index=path.fromBytes(io.data,io.index)
+            self.paths.append(path)
+
+    def _pathsEncode_(self):
+        """
+        encode the old-style list of paths
+        """
+        io=IO()
+        io.u32=self.activePathIndex
+        io.u32=len(self.paths)
+        for path in self.paths:
+            io.addBytes(path.toBytes())
+        return io.data
 
     def _propertyDecode_(self,propertyType: int,data: bytearray) -> int:
         """
         decode a single property
+
+        :param propertyType: one of the PROP_ values
+        :param data: the property payload
+        :return: the number of bytes used
         """
-        io=IO(data,boolSize=32)
-        #print('DECODING PROPERTY',propertyType,len(data))
-        if propertyType==self.PROP_COLORMAP:
-            self._colormapDecode_(io)
-        elif propertyType==self.PROP_ACTIVE_LAYER:
-            self.selected=True
-        elif propertyType==self.PROP_ACTIVE_CHANNEL:
-            self.selected=True
-        elif propertyType==self.PROP_SELECTION:
-            self.isSelection=True
-        elif propertyType==self.PROP_FLOATING_SELECTION:
-            self.selectionAttachedTo=io.u32
-        elif propertyType==self.PROP_OPACITY:
-            self.opacity=io.u32
-        elif propertyType==self.PROP_MODE:
-            self.blendMode=io.u32
-        elif propertyType==self.PROP_VISIBLE:
-            self.visible=True
-        elif propertyType==self.PROP_LINKED:
-            self.isLinked=io.bool
-        elif propertyType==self.PROP_LOCK_ALPHA:
-            self.lockAlpha=io.bool
-        elif propertyType==self.PROP_APPLY_MASK:
-            self.applyMask=io.bool
-        elif propertyType==self.PROP_EDIT_MASK:
-            self.editingMask=io.bool
-        elif propertyType==self.PROP_SHOW_MASK:
-            self.showMask=io.bool
-        elif propertyType==self.PROP_SHOW_MASKED:
-            self.showMasked=io.bool
-        elif propertyType==self.PROP_OFFSETS:
-            self.xOffset=io.i32
-            self.yOffset=io.i32
-        elif propertyType==self.PROP_COLOR:
-            r=io.byte
-            g=io.byte
-            b=io.byte
-            self.color=(r,g,b)
-        elif propertyType==self.PROP_COMPRESSION:
-            self.compression=io.byte
-        elif propertyType==self.PROP_GUIDES:
-            self._guidelinesDecode_(data)
-        elif propertyType==self.PROP_RESOLUTION:
-            self.horizontalResolution=io.float32
-            self.verticalResolution=io.float32
-        elif propertyType==self.PROP_TATTOO:
-            self.uniqueId=data.hex()
-        elif propertyType==self.PROP_PARASITES:
-            self._parasitesDecode_(data)
-        elif propertyType==self.PROP_UNIT:
-            self.units=io.u32
-        elif propertyType==self.PROP_PATHS:
-            numPaths=io.u32
-            for _ in range(numPaths):
-                nRead,path=self._itemPathDecode_(data[io.index:])
-                self.paths.append(path)
-                io.index+=nRead
-        elif propertyType==self.PROP_USER_UNIT:
-            self._userUnitsDecode_(data)
-        elif propertyType==self.PROP_VECTORS:
-            self._vectorsDecode_(data)
-        elif propertyType==self.PROP_TEXT_LAYER_FLAGS:
-            self.textLayerFlags=int(data)
-        elif propertyType==self.PROP_OLD_SAMPLE_POINTS:
-            raise Exception("ERR: old sample points structure not supported")
-        elif propertyType==self.PROP_LOCK_CONTENT:
-            self.locked=io.bool
-        elif propertyType==self.PROP_GROUP_ITEM:
-            self.isGroup=True
-        elif propertyType==self.PROP_ITEM_PATH:
-            self._itemPathDecode_(data)
-        elif propertyType==self.PROP_GROUP_ITEM_FLAGS:
-            self.groupItemFlags=io.u32
-        elif propertyType==self.PROP_LOCK_POSITION:
-            self.positionLocked=io.bool
-        elif propertyType==self.PROP_FLOAT_OPACITY:
-            self.opacity=io.float32
-        elif propertyType==self.PROP_COLOR_TAG:
-            self.colorTag=io.u32
-        elif propertyType==self.PROP_COMPOSITE_MODE:
-            self.compositeMode=io.i32
-        elif propertyType==self.PROP_COMPOSITE_SPACE:
-            self.compositeSpace=io.i32
-        elif propertyType==self.PROP_BLEND_SPACE:
-            self.blendSpace=io.u32
-        elif propertyType==self.PROP_FLOAT_COLOR:
-            r=io.float32
-            g=io.float32
-            b=io.float32
-            self.color=(r,g,b)
-        elif propertyType==self.PROP_SAMPLE_POINTS:
-            self._samplePointsDecode_(data)
-        else:
+        decoder=_PROPERTY_DECODERS.get(propertyType)
+        if decoder is None:
             raise Exception('Unknown property id '+str(propertyType))
-        return io.index
+        if not isinstance(data,memoryview):
+            data=memoryview(data)
+        decoder(self,data,0,len(data))
+        return len(data)
 
     def isFloatColor(self,color):
         """
@@ -464,192 +650,56 @@ class GimpIOBase:
         encode a single property
 
         If the property is the same as the default, or not specified, returns empty array
+        otherwise returns the property type followed by its payload
         """
-        io=IO(boolSize=32)
-        if propertyType==self.PROP_COLORMAP:
-            if self.colorMap is not None and self.colorMap:
-                io.u32=self.PROP_COLORMAP
-                io.addBytes(self._colormapEncode_())
-        elif propertyType==self.PROP_ACTIVE_LAYER:
-            if self.selected is not None and self.selected:
-                io.u32=self.PROP_ACTIVE_LAYER
-        elif propertyType==self.PROP_ACTIVE_CHANNEL:
-            if self.selected is not None and self.selected:
-                io.u32=self.PROP_ACTIVE_LAYER
-        elif propertyType==self.PROP_SELECTION:
-            if self.isSelection is not None and self.isSelection:
-                io.u32=self.PROP_SELECTION
-        elif propertyType==self.PROP_FLOATING_SELECTION:
-            if self.selectionAttachedTo is not None:
-                io.u32=self.PROP_FLOATING_SELECTION
-                io.u32=self.selectionAttachedTo
-        elif propertyType==self.PROP_OPACITY:
-            if self.opacity is not None and not isinstance(self.opacity,float):
-                io.u32=self.PROP_OPACITY
-                io.u32=self.opacity
-        elif propertyType==self.PROP_MODE:
-            if self.blendMode is not None:
-                io.u32=self.PROP_MODE
-                io.u32=self.blendMode
-        elif propertyType==self.PROP_VISIBLE:
-            if self.visible is not None and self.visible:
-                io.u32=self.PROP_VISIBLE
-        elif propertyType==self.PROP_LINKED:
-            if self.isLinked is not None and self.isLinked:
-                io.u32=self.PROP_LINKED
-                io.bool=self.isLinked
-        elif propertyType==self.PROP_LOCK_ALPHA:
-            if self.lockAlpha is not None and self.lockAlpha:
-                io.u32=self.PROP_LOCK_ALPHA
-                io.bool=self.lockAlpha
-        elif propertyType==self.PROP_APPLY_MASK:
-            if self.applyMask is not None:
-                io.u32=self.PROP_APPLY_MASK
-                io.bool=self.applyMask
-        elif propertyType==self.PROP_EDIT_MASK:
-            if self.editingMask is not None and self.editingMask:
-                io.u32=self.PROP_EDIT_MASK
-                io.bool=self.editingMask
-        elif propertyType==self.PROP_SHOW_MASK:
-            if self.showMask is not None and self.showMask:
-                io.u32=self.PROP_SHOW_MASK
-                io.bool=self.showMask
-        elif propertyType==self.PROP_SHOW_MASKED:
-            if self.showMasked is not None:
-                io.u32=self.PROP_SHOW_MASKED
-                io.bool=self.showMasked
-        elif propertyType==self.PROP_OFFSETS:
-            if self.xOffset is not None and self.yOffset is not None:
-                io.u32=self.PROP_OFFSETS
-                io.i32=self.xOffset
-                io.i32=self.yOffset
-        elif propertyType==self.PROP_COLOR:
-            if self.color is not None and not self.isFloatColor(self.color):
-                io.u32=self.PROP_COLOR
-                io.byte=self.color[0]
-                io.byte=self.color[1]
-                io.byte=self.color[2]
-        elif propertyType==self.PROP_COMPRESSION:
-            if self.compression is not None:
-                io.u32=self.PROP_COMPRESSION
-                io.u32=self.compression
-        elif propertyType==self.PROP_GUIDES:
-            if self.guidelines is not None and self.guidelines:
-                io.u32=self.PROP_GUIDES
-                io.addBytes(self._guidelinesEncode_())
-        elif propertyType==self.PROP_RESOLUTION:
-            if self.horizontalResolution is not None and self.verticalResolution is not None:
-                io.u32=self.PROP_RESOLUTION
-                io.u32=self.horizontalResolution
-                io.i32=self.verticalResolution
-        elif propertyType==self.PROP_TATTOO:
-            if self.uniqueId is not None:
-                io.u32=int(self.uniqueId,16)
-        elif propertyType==self.PROP_PARASITES:
-            if self.parasites is not None and self.parasites:
-                io.u32=self.PROP_PARASITES
-                io.addBytes(self._parasitesEncode_())
-        elif propertyType==self.PROP_UNIT:
-            if self.units is not None:
-                io.u32=self.PROP_UNIT
-                io.u32=self.units
-        elif propertyType==self.PROP_PATHS:
-            if self.paths is not None and self.paths:
-                io.u32=self.PROP_PATHS
-                io.u32=len(self.paths)
-                for path in self.paths:
-                    io.addBytes(self._pathEncode_(path))
-        elif propertyType==self.PROP_USER_UNIT:
-            if self.userUnits is not None:
-                io.u32=self.PROP_USER_UNIT
-                io.addBytes(self._userUnitsEncode_())
-        elif propertyType==self.PROP_VECTORS:
-            if self.vectors is not None and self.vectors:
-                io.u32=self.PROP_VECTORS
-                io.addBytes(self._vectorsEncode_())
-        elif propertyType==self.PROP_TEXT_LAYER_FLAGS:
-            if self.textLayerFlags is not None:
-                io.u32=self.PROP_TEXT_LAYER_FLAGS
-                io.u32=self.textLayerFlags
-        elif propertyType==self.PROP_OLD_SAMPLE_POINTS:
-            pass
-        elif propertyType==self.PROP_LOCK_CONTENT:
-            if self.locked is not None and self.locked:
-                io.u32=self.PROP_LOCK_CONTENT
-                io.bool=self.locked
-        elif propertyType==self.PROP_GROUP_ITEM:
-            if self.isGroup is not None and self.isGroup:
-                io.u32=self.PROP_GROUP_ITEM
-        elif propertyType==self.PROP_ITEM_PATH:
-            if self.itemPath is not None:
-                io.u32=self.PROP_ITEM_PATH
-                io.addBytes(self._itemPathEncode_())
-        elif propertyType==self.PROP_GROUP_ITEM_FLAGS:
-            if self.groupItemFlags is not None:
-                io.u32=self.PROP_GROUP_ITEM_FLAGS
-                io.u32=self.groupItemFlags
-        elif propertyType==self.PROP_LOCK_POSITION:
-            if self.positionLocked is not None and self.positionLocked:
-                io.u32=self.PROP_LOCK_POSITION
-                io.bool=self.positionLocked
-        elif propertyType==self.PROP_FLOAT_OPACITY:
-            if self.opacity is not None and isinstance(self.opacity,float):
-                io.u32=self.PROP_FLOAT_OPACITY
-                io.float32=self.opacity
-        elif propertyType==self.PROP_COLOR_TAG:
-            if self.colorTag is not None:
-                io.u32=self.PROP_COLOR_TAG
-                io.u32=self.colorTag
-        elif propertyType==self.PROP_COMPOSITE_MODE:
-            if self.compositeMode is not None:
-                io.u32=self.PROP_COMPOSITE_MODE
-                io.i32=self.compositeMode
-        elif propertyType==self.PROP_COMPOSITE_SPACE:
-            if self.compositeSpace is not None:
-                io.u32=self.PROP_COMPOSITE_SPACE
-                io.i32=self.compositeSpace
-        elif propertyType==self.PROP_BLEND_SPACE:
-            if self.blendSpace is not None:
-                io.u32=self.PROP_BLEND_SPACE
-                io.u32=self.blendSpace
-        elif propertyType==self.PROP_FLOAT_COLOR:
-            if self.color is not None and self.isFloatColor(self.color):
-                io.u32=self.PROP_FLOAT_COLOR
-                io.float32=self.color[0]
-                io.float32=self.color[1]
-                io.float32=self.color[2]
-        elif propertyType==self.PROP_SAMPLE_POINTS:
-            if self.samplePoints is not None and self.samplePoints:
-                io.u32=self.PROP_SAMPLE_POINTS
-                io.addBytes(self._samplePointsEncode_())
-        else:
+        encoder=_PROPERTY_ENCODERS.get(propertyType)
+        if encoder is None:
+            if propertyType==self.PROP_OLD_SAMPLE_POINTS:
+                return bytearray()
             raise Exception('Unknown property id '+str(propertyType))
-        return io.data
+        payload=encoder(self,propertyType)
+        if payload is None:
+            return bytearray()
+        return bytearray(_U32.pack(propertyType))+payload
 
     def _propertiesDecode_(self,io: IO) -> int:
         """
         decode a list of properties
-        """
-        while True:
-            try:
-                propertyType=io.u32
-                dataLength=io.u32
-            except struct.error: # end of data, so that's that.
-                break
+
+        Works directly on the io buffer.  Fixed-size properties are
+        unpacked in place and larger ones are handed a memoryview,
+        so no payload is copied along the way.
+        """
+        data=io.data
+        if not isinstance(data,memoryview):
+            data=memoryview(data)
+        index=io.index
+        end=len(data)-8
+        decoders=_PROPERTY_DECODERS
+        while index<=end: # if we run out of data, that's that.
+            propertyType,dataLength=_PROPERTY_HEADER.unpack_from(data,index)
+            index+=8
             if propertyType==0:
                 break
-            self._propertyDecode_(propertyType,io.getBytes(dataLength))
-        return io.index
+            decoder=decoders.get(propertyType)
+            if decoder is None:
+                raise Exception('Unknown property id '+str(propertyType))
+            decoder(self,data,index,dataLength)
+            index+=dataLength
+        io.index=index
+        return index
     def _propertiesEncode_(self):
         """
         encode a list of properties
         """
-        io=IO()
-        for propertyType in range(1,self.PROP_NUM_PROPS):
-            moData=self._propertyEncode_(propertyType)
-            if moData:
-                io.addBytes(moData)
-        return io.data
+        ret=[]
+        for propertyType,encoder in _PROPERTY_ENCODERS.items():
+            payload=encoder(self,propertyType)
+            if payload is not None:
+                ret.append(_PROPERTY_HEADER.pack(propertyType,len(payload)))
+                ret.append(payload)
+        ret.append(_PROPERTY_HEADER.pack(self.PROP_END,0))
+        return bytearray(b''.join(ret))
 
     def __repr__(self,indent=''):
         """
@@ -742,6 +792,97 @@ class GimpIOBase:
         return indent+(('\n'+indent).join(ret))
 
 
+# the decoder for each property type, called as
+#   decoder(item,data,index,length)
+# where the payload is data[index:index+length]
+_PROPERTY_DECODERS:Dict[int,Callable]={
+    GimpIOBase.PROP_COLORMAP:_bufferDecoder('_colormapDecode_'),
+    GimpIOBase.PROP_ACTIVE_LAYER:_flagDecoder('selected'),
+    GimpIOBase.PROP_ACTIVE_CHANNEL:_flagDecoder('selected'),
+    GimpIOBase.PROP_SELECTION:_flagDecoder('isSelection'),
+    GimpIOBase.PROP_FLOATING_SELECTION:_valueDecoder('selectionAttachedTo','>I'),
+    GimpIOBase.PROP_OPACITY:_valueDecoder('opacity','>I'),
+    GimpIOBase.PROP_MODE:_valueDecoder('blendMode','>I'),
+    GimpIOBase.PROP_VISIBLE:_valueDecoder('visible','>I',bool),
+    GimpIOBase.PROP_LINKED:_valueDecoder('isLinked','>I',bool),
+    GimpIOBase.PROP_LOCK_ALPHA:_valueDecoder('lockAlpha','>I',bool),
+    GimpIOBase.PROP_APPLY_MASK:_valueDecoder('applyMask','>I',bool),
+    GimpIOBase.PROP_EDIT_MASK:_valueDecoder('editingMask','>I',bool),
+    GimpIOBase.PROP_SHOW_MASK:_valueDecoder('showMask','>I',bool),
+    GimpIOBase.PROP_SHOW_MASKED:_valueDecoder('showMasked','>I',bool),
+    GimpIOBase.PROP_OFFSETS:_pairDecoder('xOffset','yOffset','>2i'),
+    GimpIOBase.PROP_COLOR:_tupleDecoder('color','>3B'),
+    GimpIOBase.PROP_COMPRESSION:_valueDecoder('compression','>b'),
+    GimpIOBase.PROP_GUIDES:_bufferDecoder('_guidelinesDecode_'),
+    GimpIOBase.PROP_RESOLUTION:_pairDecoder('horizontalResolution','verticalResolution','>2f'),
+    GimpIOBase.PROP_TATTOO:_tattooDecode,
+    GimpIOBase.PROP_PARASITES:_bufferDecoder('_parasitesDecode_'),
+    GimpIOBase.PROP_UNIT:_valueDecoder('units','>I'),
+    GimpIOBase.PROP_PATHS:_bufferDecoder('_pathsDecode_'),
+    GimpIOBase.PROP_USER_UNIT:_bufferDecoder('_userUnitsDecode_'),
+    GimpIOBase.PROP_VECTORS:_bufferDecoder('_vectorsDecode_'),
+    GimpIOBase.PROP_TEXT_LAYER_FLAGS:_valueDecoder('textLayerFlags','>I'),
+    GimpIOBase.PROP_OLD_SAMPLE_POINTS:_oldSamplePointsDecode,
+    GimpIOBase.PROP_LOCK_CONTENT:_valueDecoder('locked','>I',bool),
+    GimpIOBase.PROP_GROUP_ITEM:_flagDecoder('isGroup'),
+    GimpIOBase.PROP_ITEM_PATH:_bufferDecoder('_itemPathDecode_'),
+    GimpIOBase.PROP_GROUP_ITEM_FLAGS:_valueDecoder('groupItemFlags','>I'),
+    GimpIOBase.PROP_LOCK_POSITION:_valueDecoder('positionLocked','>I',bool),
+    GimpIOBase.PROP_FLOAT_OPACITY:_valueDecoder('opacity','>f'),
+    GimpIOBase.PROP_COLOR_TAG:_valueDecoder('colorTag','>I'),
+    GimpIOBase.PROP_COMPOSITE_MODE:_valueDecoder('compositeMode','>i'),
+    GimpIOBase.PROP_COMPOSITE_SPACE:_valueDecoder('compositeSpace','>i'),
+    GimpIOBase.PROP_BLEND_SPACE:_valueDecoder('blendSpace','>I'),
+    GimpIOBase.PROP_FLOAT_COLOR:_tupleDecoder('color','>3f'),
+    GimpIOBase.PROP_SAMPLE_POINTS:_bufferDecoder('_samplePointsDecode_'),
+}
+
+# the encoder for each property type, in the order they are saved, called as
+#   encoder(item,propertyType)
+# and returning the payload, or None if the property is not to be saved
+# (PROP_OLD_SAMPLE_POINTS is never saved)
+_PROPERTY_ENCODERS:Dict[int,Callable]={
+    GimpIOBase.PROP_COLORMAP:_bufferEncoder('colorMap','_colormapEncode_'),
+    GimpIOBase.PROP_ACTIVE_LAYER:_selectedEncode,
+    GimpIOBase.PROP_ACTIVE_CHANNEL:_selectedEncode,
+    GimpIOBase.PROP_SELECTION:_flagEncoder('isSelection'),
+    GimpIOBase.PROP_FLOATING_SELECTION:_valueEncoder('selectionAttachedTo','>I'),
+    GimpIOBase.PROP_OPACITY:_opacityEncode,
+    GimpIOBase.PROP_MODE:_valueEncoder('blendMode','>I'),
+    GimpIOBase.PROP_VISIBLE:_valueEncoder('visible','>I'),
+    GimpIOBase.PROP_LINKED:_valueEncoder('isLinked','>I',True),
+    GimpIOBase.PROP_LOCK_ALPHA:_valueEncoder('lockAlpha','>I',True),
+    GimpIOBase.PROP_APPLY_MASK:_valueEncoder('applyMask','>I'),
+    GimpIOBase.PROP_EDIT_MASK:_valueEncoder('editingMask','>I',True),
+    GimpIOBase.PROP_SHOW_MASK:_valueEncoder('showMask','>I',True),
+    GimpIOBase.PROP_SHOW_MASKED:_valueEncoder('showMasked','>I'),
+    GimpIOBase.PROP_OFFSETS:_pairEncoder('xOffset','yOffset','>2i'),
+    GimpIOBase.PROP_COLOR:_colorEncode,
+    GimpIOBase.PROP_COMPRESSION:_valueEncoder('compression','>B'),
+    GimpIOBase.PROP_GUIDES:_bufferEncoder('guidelines','_guidelinesEncode_'),
+    GimpIOBase.PROP_RESOLUTION:_pairEncoder('horizontalResolution','verticalResolution','>2f'),
+    GimpIOBase.PROP_TATTOO:_tattooEncode,
+    GimpIOBase.PROP_PARASITES:_bufferEncoder('parasites','_parasitesEncode_'),
+    GimpIOBase.PROP_UNIT:_valueEncoder('units','>I'),
+    GimpIOBase.PROP_PATHS:_bufferEncoder('paths','_pathsEncode_'),
+    GimpIOBase.PROP_USER_UNIT:_bufferEncoder('userUnits','_userUnitsEncode_',False),
+    GimpIOBase.PROP_VECTORS:_bufferEncoder('vectors','_vectorsEncode_'),
+    GimpIOBase.PROP_TEXT_LAYER_FLAGS:_valueEncoder('textLayerFlags','>I'),
+    GimpIOBase.PROP_LOCK_CONTENT:_valueEncoder('locked','>I',True),
+    GimpIOBase.PROP_GROUP_ITEM:_flagEncoder('isGroup'),
+    GimpIOBase.PROP_ITEM_PATH:_bufferEncoder('itemPath','_itemPathEncode_',False),
+    GimpIOBase.PROP_GROUP_ITEM_FLAGS:_valueEncoder('groupItemFlags','>I'),
+    GimpIOBase.PROP_LOCK_POSITION:_valueEncoder('positionLocked','>I',True),
+    GimpIOBase.PROP_FLOAT_OPACITY:_floatOpacityEncode,
+    GimpIOBase.PROP_COLOR_TAG:_valueEncoder('colorTag','>I'),
+    GimpIOBase.PROP_COMPOSITE_MODE:_valueEncoder('compositeMode','>i'),
+    GimpIOBase.PROP_COMPOSITE_SPACE:_valueEncoder('compositeSpace','>i'),
+    GimpIOBase.PROP_BLEND_SPACE:_valueEncoder('blendSpace','>I'),
+    GimpIOBase.PROP_FLOAT_COLOR:_floatColorEncode,
+    GimpIOBase.PROP_SAMPLE_POINTS:_bufferEncoder('samplePoints','_samplePointsEncode_'),
+}
+
+
 class GimpUserUnits:
     """
     user-defined measurement units
@@ -7,18 +7,240 @@ of gimp files.
 Generally speaking, the user should not care about anything
 in this file.
 """
-from typing import Union, List
+from typing import Union, List, Tuple, BinaryIO, Iterator, Dict, Any
 import zlib
+import re
+import warnings
 import PIL.Image
 from gimpFormats.binaryIO import IO
+try:
+    import numpy as np
+    has_numpy=True
+except ImportError:
+    has_numpy=False
 from gimpFormats.gimpIOBase import GimpIOBase
 
 
+# every possible byte value, ready to be multiplied into a run
+_SINGLE_BYTES=[bytes((value,)) for value in range(256)]
+# finds runs of identical bytes that are long enough to be worth encoding as a run
+_IDENTICAL_BYTES=re.compile(rb'(.)\1{2,}',re.DOTALL)
+# how many tiles at a time to hand to a pool when compressing in parallel
+_ENCODE_BATCH_TILES=64
+# how many tiles at a time to hand to a pool when decompressing in parallel
+_DECODE_BATCH_TILES=256
+
+
+def _rleEndedEarly(chan:int,pixel:int,index:int,end:int)->Exception:
+    """
+    the error for RLE data that runs out before the tile is complete
+    """
+    return Exception('ERR: RLE data ended early (channel %d, pixel %d, run at offset %d of %d bytes)'%(
+        chan,pixel,index,end))
+
+def _decodeRLE(data:bytes,pixels:int,bpp:int,index:int=0)->bytearray:
+    """
+    decode RLE encoded image data
+
+    Each channel is stored as its own stream of runs, so every run
+    is expanded with a single slice assignment and the channels are
+    then woven together with one strided copy per channel.
+
+    Raises an exception if the data ends before every pixel is filled.
+    """
+    flat=bytearray(pixels*bpp)
+    end=len(data)
+    for chan in range(bpp):
+        chanData=bytearray(pixels)
+        n=0
+        while n<pixels:
+            if index>=end:
+                raise _rleEndedEarly(chan,n,index,end)
+            opcode=data[index]
+            if opcode<=126: # a short run of identical bytes
+                if index+2>end:
+                    raise _rleEndedEarly(chan,n,index,end)
+                amt=min(opcode+1,pixels-n)
+                chanData[n:n+amt]=_SINGLE_BYTES[data[index+1]]*amt
+                index+=2
+            elif opcode==127: # A long run of identical bytes
+                if index+4>end:
+                    raise _rleEndedEarly(chan,n,index,end)
+                amt=min(data[index+1]*256+data[index+2],pixels-n)
+                chanData[n:n+amt]=_SINGLE_BYTES[data[index+3]]*amt
+                index+=4
+            elif opcode==128: # A long run of different bytes
+                if index+3>end:
+                    raise _rleEndedEarly(chan,n,index,end)
+                amt=data[index+1]*256+data[index+2]
+                take=min(amt,pixels-n)
+                if index+3+take>end:
+                    raise _rleEndedEarly(chan,n,index,end)
+                chanData[n:n+take]=data[index+3:index+3+take]
+                index+=3+amt
+                amt=take
+            else: # a short run of different bytes
+                amt=256-opcode
+                take=min(amt,pixels-n)
+                if index+1+take>end:
+                    raise _rleEndedEarly(chan,n,index,end)
+                chanData[n:n+take]=data[index+1:index+1+take]
+                index+=1+amt
+                amt=take
+            n+=amt
+        if bpp==1:
+            return chanData
+        # flatten/weave this channel into the output stream
+        flat[chan::bpp]=chanData
+    return flat
+
+
+def _decodeTile(data:bytes,compression:int,pixels:int,bpp:int)->bytes:
+    """
+    decompress the raw pixel data of a single tile from the file
+
+    This is a plain function (rather than a method) so that it
+    can be handed off to a process pool.
+
+    :param data: the compressed tile, starting at its first byte
+        (may run on past the end of the tile)
+    """
+    totalBytes=pixels*bpp
+    if compression==0: # none
+        data=data[0:totalBytes]
+    elif compression==1: # RLE
+        data=_decodeRLE(data,pixels,bpp)
+    elif compression==2: # zip
+        # the stream knows where it ends, so anything after it is simply left over
+        decompressor=zlib.decompressobj()
+        data=decompressor.decompress(data,totalBytes)
+        if len(data)<totalBytes:
+            raise Exception('ERR: zlib tile ended early (%d of %d bytes)'%(len(data),totalBytes))
+    else:
+        raise Exception('ERR: unsupported compression mode %s'%compression)
+    return data
+
+
+def _encodeRLE(data:Union[bytes,bytearray],bpp:int)->bytearray:
+    """
+    encode image to RLE  image data
+    """
+    ret=bytearray()
+    for chan in range(bpp):
+        ret.extend(_encodeRLEChannel(bytes(data[chan::bpp])))
+    return ret
+
+
+def _encodeRLEChannel(data:bytes)->bytearray:
+    """
+    rle encode a single channel of data
+
+    Runs of identical bytes long enough to be worth it are found
+    by a regex (so in C) and whatever lies between them is stored
+    as runs of different bytes.
+    """
+    ret=bytearray()
+    literalStart=0
+    for match in _IDENTICAL_BYTES.finditer(data):
+        start,end=match.span()
+        if literalStart<start:
+            _encodeRLEDifferent(ret,data,literalStart,start)
+        literalStart=end
+        val=data[start]
+        while start<end:
+            amt=min(end-start,0xffff)
+            if amt<=127: # a short run of identical bytes
+                ret.extend((amt-1,val))
+            else: # A long run of identical bytes
+                ret.extend((127,amt>>8,amt&0xff,val))
+            start+=amt
+    if literalStart<len(data):
+        _encodeRLEDifferent(ret,data,literalStart,len(data))
+    return ret
+
+
+def _encodeRLEDifferent(ret:bytearray,data:bytes,start:int,end:int)->None:
+    """
+    append RLE runs of different bytes covering data[start:end]
+    """
+    while start<end:
+        amt=min(end-start,0xffff)
+        if amt<=127: # a short run of different bytes
+            ret.append(256-amt)
+        else: # A long run of different bytes
+            ret.extend((128,amt>>8,amt&0xff))
+        ret.extend(data[start:start+amt])
+        start+=amt
+
+
+def _reducePixels(pixels:'np.ndarray',factor:int,average:bool=True)->'np.ndarray':
+    """
+    shrink an image by a whole factor
+
+    :param pixels: (h,w,channels) array
+    :param factor: how many pixels across and down become one
+        (partial blocks on the right and bottom are averaged too)
+    :param average: average each block (weighted by alpha, if the
+        last channel is alpha) rather than just taking its first pixel
+    :return: array of the same dtype, shape (ceil(h/factor),ceil(w/factor),channels)
+    """
+    if factor==1:
+        return pixels
+    if not average:
+        return pixels[::factor,::factor]
+    h,w,numChannels=pixels.shape
+    values=pixels.astype(np.float64 if pixels.dtype.itemsize>2 else np.float32)
+    hasAlpha=numChannels in (2,4)
+    if hasAlpha: # premultiply, so transparent pixels don't bleed their color
+        values[...,:-1]*=values[...,-1:]
+    if h%factor==0 and w%factor==0: # whole blocks (nearly every tile)
+        sums=values.reshape(h//factor,factor,w,numChannels).sum(axis=1)
+        sums=sums.reshape(h//factor,w//factor,factor,numChannels).sum(axis=2)
+        counts=factor*factor
+    else:
+        rows=np.arange(0,h,factor)
+        cols=np.arange(0,w,factor)
+        sums=np.add.reduceat(np.add.reduceat(values,rows,axis=0),cols,axis=1)
+        counts=np.minimum(factor,h-rows)[:,None,None]*np.minimum(factor,w-cols)[None,:,None]
+    if hasAlpha:
+        alphaSums=sums[...,-1:]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            sums[...,:-1]=np.where(alphaSums>0,sums[...,:-1]/alphaSums,0.0)
+        sums[...,-1:]=alphaSums/counts
+    else:
+        sums/=counts
+    if pixels.dtype.kind=='f':
+        return sums.astype(pixels.dtype)
+    return np.rint(sums).astype(pixels.dtype)
+
+
+def _encodeTile(data:bytes,compression:int,bpp:int)->bytes:
+    """
+    compress the raw pixel data of a single tile for the file
+
+    This is a plain function (rather than a method) so that it
+    can be handed off to a process pool.
+    """
+    if compression==0: # none
+        pass
+    elif compression==1: # RLE
+        data=_encodeRLE(data,bpp)
+    elif compression==2: # zip
+        data=zlib.compress(data)
+    else:
+        raise Exception('ERR: unsupported compression mode '+str(compression))
+    return data
+
+
 class GimpChannel(GimpIOBase):
     """
     Represents a single channel or mask in a gimp image
     """
 
+    _SELECTED_PROPERTY_=GimpIOBase.PROP_ACTIVE_CHANNEL
+
+    __slots__=('width','height','name','_data','_imageHierarchy','_imageHierarchyPtr')
+
     def __init__(self,parent,name:str='',image:Union['PIL.Image',None]=None):
         GimpIOBase.__init__(self,parent)
         self.width:int=0
@@ -47,21 +269,52 @@ class GimpChannel(GimpIOBase):
         self._data=io.data
         return io.index
 
-    def toBytes(self)->bytes:
+    def toBytes(self,baseIndex:int=0)->bytes:
         """
         encode this object to a byte buffer
+
+        :param baseIndex: where in the file this will be written
+            (needed because pointers are absolute file positions)
         """
         io=IO()
         io.u32=self.width
         io.u32=self.height
         io.sz754=self.name
         io.addBytes(self._propertiesEncode_())
-        ih=self._imageHierarchyPtr
-        if ih is None:
-            ih=0
-        io.addBytes(self._pointerEncode_(ih))
+        imageHierarchy=self.imageHierarchy
+        if imageHierarchy is None:
+            io.addBytes(self._pointerEncode_(0))
+        else:
+            dataIndex=baseIndex+io.index+self._POINTER_SIZE_//8
+            io.addBytes(self._pointerEncode_(dataIndex))
+            io.addBytes(imageHierarchy.toBytes(dataIndex))
         return io.data
 
+    def toFile(self,f:BinaryIO,fileStart:int=0)->None:
+        """
+        stream this object out to a file at the current position
+
+        Rather than building everything in memory, pointers are written
+        as placeholders and filled in once the data they point to is written.
+
+        :param f: the file to write to
+        :param fileStart: where in f the xcf file begins
+            (pointers are relative to that)
+        """
+        io=IO()
+        io.u32=self.width
+        io.u32=self.height
+        io.sz754=self.name
+        io.addBytes(self._propertiesEncode_())
+        f.write(io.data)
+        imageHierarchy=self.imageHierarchy
+        tableIndex=f.tell()
+        f.write(self._pointerEncode_(0))
+        if imageHierarchy is not None:
+            ptr=f.tell()-fileStart
+            imageHierarchy.toFile(f,fileStart)
+            self._pointersPatch_(f,tableIndex,[ptr])
+
     @property
     def image(self)->Union[None,'PIL.Image']:
         """
@@ -81,6 +334,33 @@ class GimpChannel(GimpIOBase):
             # try to use a filename as the name
             self.name=image.rsplit('\\',1)[-1].rsplit('/',1)[-1]
         self._imageHierarchy=GimpImageHierarchy(self,image)
+        markDirty=getattr(self.parent,'markDirty',None)
+        if markDirty is not None: # a layer mask, so the layer needs re-rendering
+            markDirty()
+
+    def getRegion(self,bounds:Tuple[int,int,int,int])->Union[None,'PIL.Image']:
+        """
+        get a portion of the image without decoding all of it
+
+        :param bounds: (x0,y0,x1,y1) in channel pixels, x1 and y1 are exclusive
+        """
+        if self.imageHierarchy is None:
+            return None
+        return self.imageHierarchy.getRegion(bounds)
+
+    def asArray(self,bounds:Union[None,Tuple[int,int,int,int]]=None,reduction:int=1
+        )->Union[None,'np.ndarray']:
+        """
+        get the channel as a numpy array, skipping PIL entirely
+
+        :param bounds: only get this (x0,y0,x1,y1) part of the channel,
+            decoding just the tiles it touches
+        :param reduction: shrink the channel by this factor (see GimpImageLevel.asArray())
+        :return: array of shape (height,width,1) (can return None!)
+        """
+        if self.imageHierarchy is None:
+            return None
+        return self.imageHierarchy.asArray(bounds,reduction)
 
     def _forceFullyLoaded(self)->None:
         """
@@ -123,6 +403,8 @@ class GimpImageHierarchy(GimpIOBase):
         top level of the pyramid (64x64) and ignore the rest.
     """
 
+    __slots__=('width','height','bpp','_levelPtrs','_levels','_data')
+
     def __init__(self,parent,image:'PIL.Image'=None):
         GimpIOBase.__init__(self,parent)
         self.width:int=0
@@ -142,15 +424,14 @@ class GimpImageHierarchy(GimpIOBase):
         :param index: index within the buffer to start at
         """
         if not data:
-            #raise Exception('No data!')
-            print("WARN: No image data!")
+            warnings.warn('no image data')
             return 0
         io=IO(data,index)
         #print('Decoding channel at',index)
         self.width=io.u32
         self.height=io.u32
         self.bpp=io.u32
-        if self.bpp<1 or self.bpp>4:
+        if self.bpp<1 or self.bpp>32: # up to 4 channels of 64-bit floats
             msg="""'Unespected bytes-per-pixel for image data ("""+str(self.bpp)+""").
                 Probably means file corruption."""
             raise Exception(msg)
@@ -161,12 +442,15 @@ class GimpImageHierarchy(GimpIOBase):
             self._levelPtrs.append(ptr)
         if self._levelPtrs: # remove "dummy" level pointers
             self._levelPtrs=[self._levelPtrs[0]]
-        self._data=bytearray(data)
+        self._data=io.data # shared with the document, not a copy
         return io.index
 
-    def toBytes(self)->bytearray:
+    def toBytes(self,baseIndex:int=0)->bytearray:
         """
         encode this object to a byte buffer
+
+        :param baseIndex: where in the file this will be written
+            (needed because pointers are absolute file positions)
         """
         dataIO=IO()
         io=IO()
@@ -175,14 +459,70 @@ class GimpImageHierarchy(GimpIOBase):
         io.u32=self.bpp
         levels=self.levels
         if levels is not None:
-            dataIndex=io.index+self._POINTER_SIZE_*(len(levels)+1)
+            dataIndex=baseIndex+io.index+(self._POINTER_SIZE_//8)*(len(levels)+1)
             for level in levels:
-                io.addBytes(self._pointerEncode_(dataIndex+io.index))
-                dataIO.addBytes(level.toBytes())
+                io.addBytes(self._pointerEncode_(dataIndex+dataIO.index))
+                dataIO.addBytes(level.toBytes(dataIndex+dataIO.index))
         io.addBytes(self._pointerEncode_(0))
         io.addBytes(dataIO.data)
         return io.data
 
+    def toFile(self,f:BinaryIO,fileStart:int=0)->None:
+        """
+        stream this object out to a file at the current position
+
+        :param f: the file to write to
+        :param fileStart: where in f the xcf file begins
+            (pointers are relative to that)
+        """
+        io=IO()
+        io.u32=self.width
+        io.u32=self.height
+        io.u32=self.bpp
+        f.write(io.data)
+        levels=self.levels or []
+        tableIndex=f.tell()
+        f.write(self._pointersEncode_([0]*(len(levels)+1)))
+        levelPtrs=[]
+        for level in levels:
+            levelPtrs.append(f.tell()-fileStart)
+            level.toFile(f,fileStart)
+        self._pointersPatch_(f,tableIndex,levelPtrs)
+
+    def toIndex(self,index:'GimpXcfIndex')->Dict[str,Any]:
+        """
+        where everything in this hierarchy lives in the file
+
+        :param index: the index this entry is going into
+        """
+        levels=self.levels
+        return {
+            'width':self.width,
+            'height':self.height,
+            'bpp':self.bpp,
+            'levelPtrs':list(self._levelPtrs),
+            'level':levels[0].toIndex(index) if levels else None}
+
+    def fromIndex(self,index:'GimpXcfIndex',entry:Dict[str,Any],
+        data:Union[bytes,bytearray,memoryview])->None:
+        """
+        set up this hierarchy from an index rather than decoding it
+
+        :param index: the index this entry came from
+        :param entry: the result of toIndex()
+        :param data: the whole file data the pointers refer to
+        """
+        self.width=entry['width']
+        self.height=entry['height']
+        self.bpp=entry['bpp']
+        self._levelPtrs=entry['levelPtrs']
+        self._data=data
+        self._levels=None
+        if entry['level'] is not None:
+            level=GimpImageLevel(self)
+            level.fromIndex(index,entry['level'],data)
+            self._levels=[level]
+
     @property
     def levels(self)->Union[None,List['GimpImageLevel']]:
         """
@@ -219,6 +559,46 @@ class GimpImageHierarchy(GimpIOBase):
         self._levelPtrs=[]
         self._levels=[GimpImageLevel(self,image)]
 
+    def fromArray(self,pixels:'np.ndarray')->None:
+        """
+        set the image from a numpy array, keeping its full precision
+
+        :param pixels: array of shape (height,width,numChannels)
+            (see GimpImageLevel.fromArray())
+        """
+        if not has_numpy:
+            raise ImportError('fromArray() requires numpy')
+        if pixels.ndim!=3 or pixels.shape[-1] not in (1,2,3,4):
+            raise Exception('ERR: pixels must be an array of shape (height,width,1 to 4 channels)')
+        self.height,self.width,numChannels=pixels.shape
+        level=GimpImageLevel(self)
+        self.bpp=numChannels*level.bytesPerSample
+        level.fromArray(pixels)
+        self._levelPtrs=[]
+        self._levels=[level]
+
+    def getRegion(self,bounds:Tuple[int,int,int,int])->Union[None,'PIL.Image']:
+        """
+        get a portion of the image, decoding only the tiles it touches
+
+        :param bounds: (x0,y0,x1,y1) in pixels, x1 and y1 are exclusive
+        """
+        if not self.levels:
+            return None
+        return self.levels[0].getRegion(bounds)
+
+    def asArray(self,bounds:Union[None,Tuple[int,int,int,int]]=None,reduction:int=1
+        )->Union[None,'np.ndarray']:
+        """
+        get the pixels as a numpy array of shape (height,width,numChannels)
+
+        :param bounds: only get this (x0,y0,x1,y1) part of the image
+        :param reduction: shrink the image by this factor (see GimpImageLevel.asArray())
+        """
+        if not self.levels:
+            return None
+        return self.levels[0].asArray(bounds,reduction)
+
     def __repr__(self,indent:str='')->str:
         """
         Get a textual representation of this object
@@ -236,11 +616,16 @@ class GimpImageLevel(GimpIOBase):
     This represents a single level in an imageHierarchy
     """
 
+    __slots__=('width','height','_tiles','_tilePtrs','_data','_compression','_image')
+
     def __init__(self,parent,image:Union[None,'PIL.Image']=None):
         GimpIOBase.__init__(self,parent)
         self.width:int=0
         self.height:int=0
         self._tiles:Union[None,List['PIL.Image']]=None # tile PIL images
+        self._tilePtrs:Union[None,List[int],'array.array']=None # where each tile lives in self._data
+        self._data:Union[None,bytearray]=None
+        self._compression:int=0 # what the tiles in _data are compressed with
         self._image:Union[None,'PIL.Image']=None
         if image is not None:
             self.image=image
@@ -261,177 +646,124 @@ class GimpImageLevel(GimpIOBase):
             expectedSize='('+str(self.parent.width)+','+str(self.parent.height)+')'
             msg=' Usually this implies file corruption.'
             raise Exception('Image data size mismatch. '+currentSize+'!='+expectedSize+msg)
-        self._tiles=[]
+        self._tiles=None
         self._image=None
-        for y in range(0,self.height,64):
-            for x in range(0,self.width,64):
-                ptr=self._pointerDecode_(io)
-                size=(min(self.width-x,64),min(self.height-y,64))
-                totalBytes=size[0]*size[1]*self.bpp
-                if self.doc.compression==0: # none
-                    data=io.data[ptr:ptr+totalBytes]
-                elif self.doc.compression==1: # RLE
-                    data=self._decodeRLE(io.data,size[0]*size[1],self.bpp,ptr)
-                elif self.doc.compression==2: # zip
-                    # guess how many bytes are needed
-                    data=zlib.decompress(io.data[ptr:ptr+totalBytes+24])
-                else:
-                    raise Exception('ERR: unsupported compression mode %s'%self.doc.compression)
-                subImage=PIL.Image.frombytes(self.mode,size,bytes(data),decoder_name='raw')
-                self._tiles.append(subImage)
+        self._tilePtrs=self._pointersDecode_(io,self.numTiles)
         _=self._pointerDecode_(io) # list ends with nul character
+        self._data=io.data
+        self._compression=self.doc._fileCompression
         return io.index
 
-    def toBytes(self)->bytearray:
+    def toBytes(self,baseIndex:int=0)->bytearray:
         """
         encode this object to a byte buffer
+
+        :param baseIndex: where in the file this will be written
+            (needed because pointers are absolute file positions)
         """
         dataIO=IO()
         io=IO()
         io.u32=self.width
         io.u32=self.height
-        tiles=self.tiles
-        if tiles is not None:
-            dataIndex=io.index+self._POINTER_SIZE_*(len(tiles)+1)
-            for tile in tiles:
-                io.addBytes(self._pointerEncode_(dataIndex+dataIO.index))
-                data=tile.tobytes()
-                if self.doc.compression==0: # none
-                    pass
-                elif self.doc.compression==1: # RLE
-                    data=self._encodeRLE(data,self.bpp)
-                elif self.doc.compression==2: # zip
-                    data=zlib.compress(data)
-                else:
-                    raise Exception('ERR: unsupported compression mode '+str(self.doc.compression))
-                dataIO.addBytes(data)
+        numTiles=self.numTiles if self._hasPixels else 0
+        dataIndex=baseIndex+io.index+(self._POINTER_SIZE_//8)*(numTiles+1)
+        for tile in self._encodeTiles():
+            io.addBytes(self._pointerEncode_(dataIndex+dataIO.index))
+            dataIO.addBytes(tile)
         io.addBytes(self._pointerEncode_(0))
         io.addBytes(dataIO.data)
         return io.data
 
-    def _decodeRLE(self,data:bytes,pixels:int,bpp:int,index:int=0)->bytearray:
+    def toIndex(self,index:'GimpXcfIndex')->Dict[str,Any]:
         """
-        decode RLE encoded image data
+        where the tiles of this level live in the file
+
+        :param index: the index this entry is going into
         """
-        ret:List[List[int]]=[[] for chan in range(bpp)]
-        for chan in range(bpp):
-            n=0
-            while n<pixels:
-                opcode=data[index]; index+=1
-                if 0<=opcode<=126: # a short run of identical bytes
-                    val=data[index]; index+=1
-                    for _ in range(opcode+1):
-                        ret[chan].append(val)
-                        n+=1
-                elif opcode==127: # A long run of identical bytes
-                    m=data[index]; index+=1
-                    b=data[index]; index+=1
-                    val=data[index]; index+=1
-                    amt=m*256+b
-                    for _ in range(amt):
-                        ret[chan].append(val)
-                        n+=1
-                elif opcode==128: # A long run of different bytes
-                    m=data[index]; index+=1
-                    b=data[index]; index+=1
-                    amt=m*256+b
-                    for _ in range(amt):
-                        val=data[index]; index+=1
-                        ret[chan].append(val)
-                        n+=1
-                elif 129<=opcode<=255: # a short run of different bytes
-                    amt=256-opcode
-                    for _ in range(amt):
-                        val=data[index]; index+=1
-                        ret[chan].append(val)
-                        n+=1
-                else:
-                    print('Unreachable branch',opcode)
-                    raise Exception()
-        # flatten/weave the individual channels into one strream
-        flat=bytearray()
-        for i in range(pixels):
-            for chan in range(bpp):
-                flat.append(ret[chan][i])
-        return flat
+        tilePtrs=self._tilePtrs
+        return {
+            'width':self.width,
+            'height':self.height,
+            'tilePtrs':None if tilePtrs is None else index.addTable(tilePtrs)}
+
+    def fromIndex(self,index:'GimpXcfIndex',entry:Dict[str,Any],
+        data:Union[bytes,bytearray,memoryview])->None:
+        """
+        set up this level from an index rather than decoding it
+
+        :param index: the index this entry came from
+        :param entry: the result of toIndex()
+        :param data: the whole file data the pointers refer to
+        """
+        self.width=entry['width']
+        self.height=entry['height']
+        self._tiles=None
+        self._image=None
+        if entry['tilePtrs'] is None:
+            self._tilePtrs=None
+        else:
+            self._tilePtrs=index.getTable(entry['tilePtrs'])
+        self._data=data
+        self._compression=self.doc._fileCompression
+
+    def toFile(self,f:BinaryIO,fileStart:int=0)->None:
+        """
+        stream this object out to a file at the current position
+
+        Tiles are fetched, compressed, and written one at a time
+        (or one batch at a time when compressing in parallel),
+        so only a little pixel data is ever held in memory.
+
+        :param f: the file to write to
+        :param fileStart: where in f the xcf file begins
+            (pointers are relative to that)
+        """
+        io=IO()
+        io.u32=self.width
+        io.u32=self.height
+        f.write(io.data)
+        numTiles=self.numTiles if self._hasPixels else 0
+        tableIndex=f.tell()
+        f.write(self._pointersEncode_([0]*(numTiles+1)))
+        tilePtrs=[]
+        for tile in self._encodeTiles():
+            tilePtrs.append(f.tell()-fileStart)
+            f.write(tile)
+        self._pointersPatch_(f,tableIndex,tilePtrs)
+
+    def _encodeTiles(self)->Iterator[bytes]:
+        """
+        compress every tile in this level, in order
+
+        If the document is saving with workers (see GimpDocument.save())
+        the tiles are handed out to its pool a batch at a time, so they
+        are compressed in parallel but still come back in file order.
+        """
+        if not self._hasPixels:
+            return
+        compression=self.doc.compression or 0
+        bpp=self.bpp
+        pool=self.doc._encodePool
+        if pool is None or compression==0:
+            for tileNum in range(self.numTiles):
+                yield _encodeTile(self._tileRaw(tileNum),compression,bpp)
+            return
+        for batchStart in range(0,self.numTiles,_ENCODE_BATCH_TILES):
+            batch=range(batchStart,min(batchStart+_ENCODE_BATCH_TILES,self.numTiles))
+            tiles=[self._tileRaw(tileNum) for tileNum in batch]
+            yield from pool.map(_encodeTile,tiles,[compression]*len(tiles),[bpp]*len(tiles))
 
     def _encodeRLE(self,data:Union[bytes,bytearray],bpp:int)->bytearray:
         """
         encode image to RLE  image data
         """
-        def countSame(data:Union[bytes,bytearray],startIdx:int)->int:
-            """
-            count how many times bytes are identical
-            """
-            l=len(data)
-            idx=startIdx
-            if idx>=l:
-                return 0
-            c=data[idx]
-            idx=startIdx+1
-            while idx<l and data[idx]==c:
-                idx+=1
-            return idx-startIdx
-        def countDifferent(data:Union[bytes,bytearray],startIdx:int=0)->int:
-            """
-            count how many times bytes are different
-            """
-            l=len(data)
-            idx=startIdx
-            if idx>=l:
-                return 0
-            c=data[idx]
-            idx=startIdx+1
-            while idx<l and data[idx]!=c:
-                idx+=1
-                c=data[idx]
-            return idx-startIdx
-        def rleEncodeChan(data:Union[bytes,bytearray])->bytearray:
-            """
-            rle encode a single channel of data
-            """
-            ret=bytearray()
-            idx=0
-            while idx<len(data):
-                nRepeats=countSame(data,0)
-                if nRepeats==1: # different bytes
-                    nDifferences=countDifferent(data,1)
-                    if nDifferences<=127: # short run of different bytes
-                        ret.append(129+nRepeats-1)
-                        ret.append(data[idx])
-                        idx+=nDifferences
-                    else: # long run of different bytes
-                        ret.append(128)
-                        ret.append(int(nDifferences/256.0))
-                        ret.append(nDifferences%256)
-                        ret.append(data[idx])
-                        idx+=nDifferences
-                elif nRepeats<=127: # short run of same bytes
-                    ret.append(nRepeats-1)
-                    ret.append(data[idx])
-                    idx+=nRepeats
-                else: # long run of same bytes
-                    ret.append(127)
-                    ret.append(int(nRepeats/256.0))
-                    ret.append(nRepeats%256)
-                    ret.append(data[idx])
-                    idx+=nRepeats
-            return ret
-        # if there is only one channel, encode and return it directly
-        if bpp==1:
-            return rleEncodeChan(data)
-        # split into channels
-        dataByChannel=[]
-        for chan in range(bpp):
-            chanData=bytearray()
-            for index in range(chan,bpp,len(data)):
-                chanData.append(data[index])
-            dataByChannel.append(chanData)
-        # encode and join each channel
-        ret=bytearray()
-        for chan in dataByChannel:
-            ret.extend(rleEncodeChan(chan))
-        return ret
+        return _encodeRLE(data,bpp)
+
+    def _decodeRLE(self,data:bytes,pixels:int,bpp:int,index:int=0)->bytearray:
+        """
+        decode RLE encoded image data
+        """
+        return _decodeRLE(data,pixels,bpp,index)
 
     @property
     def bpp(self)->int:
@@ -440,58 +772,453 @@ class GimpImageLevel(GimpIOBase):
         """
         return self.parent.bpp
 
+    @property
+    def bytesPerSample(self)->int:
+        """
+        how many bytes each channel of each pixel takes up
+        (anything above 1 is a high bit depth image)
+        """
+        precision=self.doc.precision
+        if precision is None:
+            return 1
+        return precision.bytesPerSample
+
+    @property
+    def numChannels(self)->int:
+        """
+        how many channels each pixel has
+        """
+        return self.bpp//self.bytesPerSample
+
     @property
     def mode(self)->Union[None,str]:
         """
         Get the color mode in PIL standard form
+
+        NOTE: high bit depth images are reduced to 8 bits per
+            channel when converted to PIL, so this is that mode
         """
         MODES=[None,'L','LA','RGB','RGBA']
-        return MODES[self.bpp]
+        return MODES[self.numChannels]
 
     @property
-    def tiles(self)->Union[None,'PIL.Image']:
+    def dtype(self)->str:
         """
-        Get individual tiles for this image
+        the numpy dtype of a sample, as stored in the file (big endian)
+        """
+        precision=self.doc.precision
+        if precision is None:
+            return '>u1'
+        return precision.dtype
+
+    def _rawToArray(self,data:bytes,w:int,h:int)->'np.ndarray':
+        """
+        turn raw (decompressed) pixel data into a correctly typed
+        numpy array of shape (h,w,numChannels)
+
+        The file is big endian, so this byteswaps the whole lot
+        at once into native order.
+        """
+        dtype=np.dtype(self.dtype)
+        pixels=np.frombuffer(data,dtype=dtype).reshape(h,w,self.numChannels)
+        return pixels.astype(dtype.newbyteorder('='),copy=False)
+
+    def _rawToImage(self,data:bytes,w:int,h:int)->'PIL.Image':
+        """
+        turn raw (decompressed) pixel data into a PIL image
+
+        High bit depth data gets reduced to 8 bits per channel.
+        (Floating point values are assumed to be 0.0 to 1.0 and
+        are clipped to that.)
+        """
+        if self.bytesPerSample==1:
+            return PIL.Image.frombytes(self.mode,(w,h),bytes(data),decoder_name='raw')
+        if not has_numpy:
+            raise ImportError('high bit depth images require numpy')
+        pixels=self._rawToArray(data,w,h)
+        if pixels.dtype.kind=='f':
+            pixels=np.clip(pixels,0.0,1.0)*255.0+0.5
+        else:
+            pixels=pixels>>(pixels.dtype.itemsize*8-8) # keep the most significant byte
+        pixels=pixels.astype(np.uint8)
+        if pixels.shape[2]==1:
+            pixels=pixels[:,:,0]
+        return PIL.Image.fromarray(pixels,self.mode)
+
+    @property
+    def numTiles(self)->int:
+        """
+        how many 64x64 tiles it takes to cover this level
+        """
+        return ((self.width+63)//64)*((self.height+63)//64)
+
+    def _tileBounds(self,tileNum:int)->Tuple[int,int,int,int]:
+        """
+        get the area a tile covers
+
+        :return: (x,y,w,h) in pixels
+        """
+        tilesAcross=(self.width+63)//64
+        x=(tileNum%tilesAcross)*64
+        y=(tileNum//tilesAcross)*64
+        return (x,y,min(self.width-x,64),min(self.height-y,64))
+
+    def _tileData(self,tileNum:int)->Union[bytes,memoryview]:
+        """
+        get the still-compressed data for a tile
+
+        The length is not stored in the file, but tiles are written
+        one after the other, so a tile ends where the next one starts.
+        Failing that (the last tile, or an oddly ordered file) this
+        is a generous upper bound on the size.
+
+        NOTE: this is a view onto the file data, not a copy
+        """
+        ptr=self._tilePtrs[tileNum]
+        _,_,w,h=self._tileBounds(tileNum)
+        # no encoding can more than double the size of a tile
+        end=ptr+w*h*self.bpp*2+64
+        if tileNum+1<len(self._tilePtrs):
+            nextPtr=self._tilePtrs[tileNum+1]
+            if ptr<nextPtr<end:
+                end=nextPtr
+        return self._data[ptr:end]
+
+    def _decodeTile(self,tileNum:int)->bytes:
+        """
+        decompress the raw pixel data of a single tile from the file
+
+        If the document has a tileCache, that is checked first.
+        """
+        cache=self.doc.tileCache
+        if cache is not None:
+            key=self._tileCacheKey(tileNum)
+            data=cache.get(key)
+            if data is not None:
+                return data
+        _,_,w,h=self._tileBounds(tileNum)
+        data=_decodeTile(self._tileData(tileNum),self._compression,w*h,self.bpp)
+        if cache is not None:
+            data=bytes(data) # don't hold onto a view of the file or a mutable buffer
+            cache.put(key,data)
+        return data
+
+    def _tileCacheKey(self,tileNum:int)->Tuple[int,int,int,int]:
+        """
+        what a tile of this level is called in the document's tileCache
+        """
+        return (self.doc._cacheToken,self.parent.parent._cacheToken,self._levelNum,tileNum)
+
+    @property
+    def _levelNum(self)->int:
+        """
+        which level of the hierarchy this is
+        """
+        levels=self.parent._levels
+        if levels:
+            for levelNum,level in enumerate(levels):
+                if level is self:
+                    return levelNum
+        return 0
+
+    def _decodeTilesData(self)->Iterator[bytes]:
+        """
+        decompress the raw pixel data of every tile in this level, in order
+
+        If the document was opened with workers (see GimpDocument.load())
+        the tiles are handed out to a pool a batch at a time, so they
+        are decompressed in parallel but still come back in order.
+        Tiles already in the document's tileCache are not decompressed
+        again, and the rest are added to it.
+        """
+        compression=self._compression
+        pool=self.doc._decodeExecutor() if compression!=0 and self.numTiles>1 else None
+        if pool is None:
+            for tileNum in range(self.numTiles):
+                yield self._decodeTile(tileNum)
+            return
+        bpp=self.bpp
+        cache=self.doc.tileCache
+        for batchStart in range(0,self.numTiles,_DECODE_BATCH_TILES):
+            batch=range(batchStart,min(batchStart+_DECODE_BATCH_TILES,self.numTiles))
+            decoded:List[Union[None,bytes]]=[None]*len(batch)
+            if cache is not None:
+                keys=[self._tileCacheKey(tileNum) for tileNum in batch]
+                decoded=[cache.get(key) for key in keys]
+            todo=[tileNum for tileNum,data in zip(batch,decoded) if data is None]
+            tileData=[self._tileData(tileNum) for tileNum in todo]
+            if compression==1: # can't pickle a memoryview
+                tileData=[bytes(data) for data in tileData]
+            pixels=[w*h for _,_,w,h in (self._tileBounds(tileNum) for tileNum in todo)]
+            results=pool.map(_decodeTile,tileData,[compression]*len(todo),pixels,[bpp]*len(todo))
+            for tileNum,data in zip(todo,results):
+                if cache is not None:
+                    data=bytes(data) # don't hold onto a view of the file or a mutable buffer
+                    cache.put(keys[tileNum-batchStart],data)
+                decoded[tileNum-batchStart]=data
+            yield from decoded
+
+    def _decodeTiles(self)->Iterator['PIL.Image']:
+        """
+        decompress every tile in this level, in order, as PIL images
+        """
+        for tileNum,data in enumerate(self._decodeTilesData()):
+            _,_,w,h=self._tileBounds(tileNum)
+            yield self._rawToImage(data,w,h)
+
+    def _tileImage(self,tileNum:int)->'PIL.Image':
+        """
+        get a single tile as a PIL image
         """
         if self._tiles is not None:
-            return self._tiles
-        if self.image is not None:
-            return self._imgToTiles(self.image)
-        return None
+            return self._tiles[tileNum]
+        x,y,w,h=self._tileBounds(tileNum)
+        if self._image is not None:
+            return self._image.crop((x,y,x+w,y+h))
+        data=self._decodeTile(tileNum)
+        return self._rawToImage(data,w,h)
 
-    def _imgToTiles(self,image:'PIL.Image')->'PIL.Image':
+    def _tileRaw(self,tileNum:int)->bytes:
+        """
+        get the raw (uncompressed) pixel data of a single tile
+
+        This comes straight from the file if it can, which keeps
+        high bit depth data intact.
+        """
+        if self._tiles is None and self._image is None:
+            return self._decodeTile(tileNum)
+        return self._tileImage(tileNum).tobytes()
+
+    @property
+    def tiles(self)->Union[None,List['PIL.Image']]:
+        """
+        Get individual tiles for this image
+        """
+        if self._tiles is None:
+            if self._tilePtrs is not None:
+                if self.bytesPerSample>1: # don't lose the original high bit depth data
+                    return list(self._decodeTiles())
+                self._tiles=list(self._decodeTiles())
+            elif self._image is not None:
+                return self._imgToTiles(self._image)
+        return self._tiles
+
+    @property
+    def _hasPixels(self)->bool:
+        """
+        is there any image data (decoded or not) for this level
+        """
+        return self._tiles is not None or self._tilePtrs is not None or self._image is not None
+
+    def _imgToTiles(self,image:'PIL.Image')->List['PIL.Image']:
         """
         break an image into a series of tiles, each<=64x64
         """
         ret=[]
         for y in range(0,self.height,64):
             for x in range(0,self.width,64):
-                bounds=(x,y,min(self.width-x,64),min(self.height-y,64))
+                bounds=(x,y,min(self.width,x+64),min(self.height,y+64))
                 ret.append(image.crop(bounds))
         return ret
 
+    def getRegion(self,bounds:Tuple[int,int,int,int])->Union[None,'PIL.Image']:
+        """
+        get a portion of the image, decoding only the tiles it touches
+
+        :param bounds: (x0,y0,x1,y1) in pixels, x1 and y1 are exclusive.
+            Gets clipped to the size of this level.
+        """
+        x0,y0=max(bounds[0],0),max(bounds[1],0)
+        x1,y1=min(bounds[2],self.width),min(bounds[3],self.height)
+        if x1<=x0 or y1<=y0:
+            return PIL.Image.new(self.mode,(max(x1-x0,0),max(y1-y0,0)))
+        if self._image is not None:
+            return self._image.crop((x0,y0,x1,y1))
+        if self._tiles is None and self._tilePtrs is None:
+            return None
+        region=PIL.Image.new(self.mode,(x1-x0,y1-y0),color=None)
+        tilesAcross=(self.width+63)//64
+        for tileY in range(y0//64,(y1-1)//64+1):
+            for tileX in range(x0//64,(x1-1)//64+1):
+                tile=self._tileImage(tileY*tilesAcross+tileX)
+                left,top=tileX*64,tileY*64
+                crop=(max(x0,left)-left,max(y0,top)-top,
+                    min(x1,left+tile.width)-left,min(y1,top+tile.height)-top)
+                region.paste(tile.crop(crop),(left+crop[0]-x0,top+crop[1]-y0))
+        return region
+
+    def asArray(self,bounds:Union[None,Tuple[int,int,int,int]]=None,reduction:int=1
+        )->Union[None,'np.ndarray']:
+        """
+        get the pixels as a numpy array, without going through PIL
+
+        Each tile is decoded straight into its place in the array.
+        High bit depth images keep their full precision.
+
+        :param bounds: only get this (x0,y0,x1,y1) part of the image,
+            decoding just the tiles it touches.  Gets clipped to the
+            size of this level.
+        :param reduction: shrink the image by this factor (1,2,4..64)
+            as each tile is decoded, averaging each block of pixels,
+            so the full size image never exists.  Bounds are then
+            in the shrunken pixels.  (Indexed images are sampled
+            instead, since averaging palette indices means nothing.)
+        :return: array of shape (height,width,numChannels) whose dtype
+            matches the document precision (uint8, uint16, uint32,
+            float16, float32, or float64) in native byte order
+            (can return None!)
+        """
+        if not has_numpy:
+            raise ImportError('asArray() requires numpy')
+        if reduction!=1:
+            return self._reducedArray(reduction,bounds)
+        if bounds is not None:
+            return self._regionArray(bounds)
+        if self._image is not None:
+            return np.array(self._image,dtype=np.uint8).reshape(self.height,self.width,self.numChannels)
+        if self._tiles is not None:
+            tiles=(tile.tobytes() for tile in self._tiles)
+        elif self._tilePtrs is not None:
+            tiles=self._decodeTilesData()
+        else:
+            return None
+        dtype=np.dtype(self.dtype).newbyteorder('=')
+        ret=np.empty((self.height,self.width,self.numChannels),dtype=dtype)
+        for tileNum,data in enumerate(tiles):
+            x,y,w,h=self._tileBounds(tileNum)
+            ret[y:y+h,x:x+w]=self._rawToArray(data,w,h)
+        return ret
+
+    def _regionArray(self,bounds:Tuple[int,int,int,int])->Union[None,'np.ndarray']:
+        """
+        the asArray() of just part of the image (see getRegion())
+        """
+        x0,y0=max(bounds[0],0),max(bounds[1],0)
+        x1,y1=max(min(bounds[2],self.width),x0),max(min(bounds[3],self.height),y0)
+        if self._image is not None:
+            region=self._image.crop((x0,y0,x1,y1))
+            return np.array(region,dtype=np.uint8).reshape(y1-y0,x1-x0,self.numChannels)
+        if self._tiles is None and self._tilePtrs is None:
+            return None
+        dtype=np.dtype(self.dtype).newbyteorder('=')
+        ret=np.empty((y1-y0,x1-x0,self.numChannels),dtype=dtype)
+        if x1<=x0 or y1<=y0:
+            return ret
+        tilesAcross=(self.width+63)//64
+        for tileY in range(y0//64,(y1-1)//64+1):
+            for tileX in range(x0//64,(x1-1)//64+1):
+                tileNum=tileY*tilesAcross+tileX
+                left,top,w,h=self._tileBounds(tileNum)
+                tile=self._rawToArray(self._tileRaw(tileNum),w,h)
+                cx0,cy0=max(x0,left),max(y0,top)
+                cx1,cy1=min(x1,left+w),min(y1,top+h)
+                ret[cy0-y0:cy1-y0,cx0-x0:cx1-x0]=tile[cy0-top:cy1-top,cx0-left:cx1-left]
+        return ret
+
+    def _reducedArray(self,reduction:int,bounds:Union[None,Tuple[int,int,int,int]]=None
+        )->Union[None,'np.ndarray']:
+        """
+        the asArray() of the image shrunk by a factor, a tile at a time
+        """
+        if reduction not in (1,2,4,8,16,32,64):
+            raise Exception('ERR: reduction must be a power of 2, up to the 64 pixel tile size')
+        average=self.doc.baseColorMode!=2 # not indexed
+        width=(self.width+reduction-1)//reduction
+        height=(self.height+reduction-1)//reduction
+        if bounds is None:
+            bounds=(0,0,width,height)
+        x0,y0=max(bounds[0],0),max(bounds[1],0)
+        x1,y1=max(min(bounds[2],width),x0),max(min(bounds[3],height),y0)
+        if self._image is not None:
+            # already in memory, so just shrink the part needed
+            full=self._regionArray((x0*reduction,y0*reduction,x1*reduction,y1*reduction))
+            return _reducePixels(full,reduction,average)
+        if self._tiles is None and self._tilePtrs is None:
+            return None
+        dtype=np.dtype(self.dtype).newbyteorder('=')
+        ret=np.empty((y1-y0,x1-x0,self.numChannels),dtype=dtype)
+        if x1<=x0 or y1<=y0:
+            return ret
+        tileSize=64//reduction # how big each tile is once shrunk
+        tilesAcross=(self.width+63)//64
+        for tileY in range(y0//tileSize,(y1-1)//tileSize+1):
+            for tileX in range(x0//tileSize,(x1-1)//tileSize+1):
+                tileNum=tileY*tilesAcross+tileX
+                _,_,w,h=self._tileBounds(tileNum)
+                if self._tiles is not None:
+                    data=self._tiles[tileNum].tobytes()
+                else:
+                    data=self._tileRaw(tileNum)
+                tile=_reducePixels(self._rawToArray(data,w,h),reduction,average)
+                left,top=tileX*tileSize,tileY*tileSize
+                cx0,cy0=max(x0,left),max(y0,top)
+                cx1,cy1=min(x1,left+tile.shape[1]),min(y1,top+tile.shape[0])
+                ret[cy0-y0:cy1-y0,cx0-x0:cx1-x0]=tile[cy0-top:cy1-top,cx0-left:cx1-left]
+        return ret
+
+    def fromArray(self,pixels:'np.ndarray')->None:
+        """
+        set the pixels from a numpy array, keeping their full precision
+
+        They are kept as uncompressed tiles, laid out just as though
+        they had been loaded from a file, so high bit depth data goes
+        through asArray() and toBytes() untouched.
+
+        :param pixels: array of shape (height,width,numChannels) whose
+            dtype matches the document precision (in any byte order)
+        """
+        if not has_numpy:
+            raise ImportError('fromArray() requires numpy')
+        dtype=np.dtype(self.dtype)
+        if (pixels.dtype.kind,pixels.dtype.itemsize)!=(dtype.kind,dtype.itemsize):
+            raise Exception('ERR: pixels are %s, but the document precision needs %s'%(
+                pixels.dtype.name,dtype.newbyteorder('=').name))
+        if pixels.ndim!=3 or pixels.shape[-1]!=self.numChannels:
+            raise Exception('ERR: pixels must be an array of shape (height,width,%d)'%self.numChannels)
+        self.height,self.width=pixels.shape[:2]
+        pixels=pixels.astype(dtype,copy=False) # the file is big endian
+        data=bytearray()
+        tilePtrs=[]
+        for y in range(0,self.height,64):
+            for x in range(0,self.width,64):
+                tilePtrs.append(len(data))
+                data.extend(pixels[y:y+64,x:x+64].tobytes())
+        self._image=None
+        self._tiles=None
+        self._tilePtrs=tilePtrs
+        self._data=memoryview(bytes(data))
+        self._compression=0
+
     @property
     def image(self)->Union['PIL.Image',None]:
         """
         get a final, compiled image
         """
         if self._image is None:
-            tiles=self.tiles
-            if tiles is None:
+            if self._tiles is not None:
+                tiles=iter(self._tiles)
+            elif self._tilePtrs is not None:
+                tiles=self._decodeTiles() # paste each tile as it is decoded
+            else:
                 return None
-            self._image=PIL.Image.new(self.mode,(self.width,self.height),color=None)
-            tileNum=0
+            image=PIL.Image.new(self.mode,(self.width,self.height),color=None)
             for y in range(0,self.height,64):
                 for x in range(0,self.width,64):
-                    subImage=tiles[tileNum]
-                    tileNum+=1
-                    self._image.paste(subImage,(x,y))
+                    image.paste(next(tiles),(x,y))
+            if self.bytesPerSample>1:
+                # the 8-bit image loses precision, so hang onto the file data instead
+                return image
+            self._image=image
             self._tiles=None # TODO: do I want to keep the tiles for any reason??
+            self._tilePtrs=None
+            self._data=None
         return self._image
     @image.setter
     def image(self,image:'PIL.Image'):
         self._image=image
         self._tiles=None
+        self._tilePtrs=None
+        self._data=None
         self.width=image.width
         self.height=image.height
 
@@ -8,6 +8,10 @@ They are used to store things like last-used plugin settings, gamma adjuetments,
 Format of known parasites:
     https://gitlab.gnome.org/GNOME/gimp/blob/master/devel-docs/parasites.txt
 """
+import struct
+import re
+import base64
+import binascii
 from gimpFormats.binaryIO import *
 
 
@@ -44,6 +48,17 @@ KNOWN_LAYER_PARASITES=[
     "gimp-text-layer",
     "gfig"]
 
+# parasites that can carry a thumbnail (see GimpParasite.thumbnailData)
+THUMBNAIL_PARASITES=[
+    "exif-data",
+    "jpeg-exif-data",
+    "gimp-metadata"]
+
+# base64 jpeg inside xmp, either as plain xmp or gimp's own xml of tags
+_XMP_THUMBNAIL=re.compile(
+    rb'<xmpGImg:image>([^<]*)</xmpGImg:image>'
+    rb'|<tag\s+name="Xmp\.xmp\.Thumbnails[^"]*xmpGImg:image">([^<]*)</tag>')
+
 
 class GimpParasite:
     """
@@ -71,7 +86,7 @@ class GimpParasite:
         self.name=io.sz754
         self.flags=io.u32
         dataLength=io.u32
-        self.data=io.getBytes(dataLength)
+        self.data=bytes(io.getBytes(dataLength)) # do not hold onto the whole file
         return io.index
 
     def toBytes(self):
@@ -88,6 +103,58 @@ class GimpParasite:
         io.addBytes(self.data)
         return io.data
 
+    @property
+    def thumbnailData(self)->Union[None,bytes]:
+        """
+        the jpeg thumbnail embedded in this parasite, if there is one
+
+        Looks in exif (the IFD1 thumbnail) and xmp (xmpGImg:image).
+
+        :return: jpeg file data or None
+        """
+        if not self.data:
+            return None
+        data=self.data
+        try:
+            if data.startswith(b'Exif\0\0'):
+                data=data[6:]
+            if data[0:4] in (b'II*\0',b'MM\0*'):
+                return self._exifThumbnail(data)
+            match=_XMP_THUMBNAIL.search(data)
+            if match is not None:
+                encoded=match.group(1) or match.group(2)
+                encoded=encoded.replace(b'&#xA;',b'').replace(b'&#10;',b'')
+                return base64.b64decode(b''.join(encoded.split()))
+        except (struct.error,IndexError,ValueError,binascii.Error):
+            pass
+        return None
+
+    @staticmethod
+    def _exifThumbnail(tiff:bytes)->Union[None,bytes]:
+        """
+        get the jpeg thumbnail out of exif (tiff) data
+
+        the thumbnail is the JPEGInterchangeFormat (0x0201) and
+        JPEGInterchangeFormatLength (0x0202) tags of the second IFD
+        """
+        endian='<' if tiff[0:2]==b'II' else '>'
+        ifd=struct.unpack_from(endian+'I',tiff,4)[0]
+        numEntries=struct.unpack_from(endian+'H',tiff,ifd)[0]
+        ifd=struct.unpack_from(endian+'I',tiff,ifd+2+numEntries*12)[0]
+        if ifd==0: # no second IFD
+            return None
+        numEntries=struct.unpack_from(endian+'H',tiff,ifd)[0]
+        offset=length=None
+        for i in range(numEntries):
+            tag,_,_,value=struct.unpack_from(endian+'HHII',tiff,ifd+2+i*12)
+            if tag==0x0201:
+                offset=value
+            elif tag==0x0202:
+                length=value
+        if offset is None or not length or offset+length>len(tiff):
+            return None
+        return bytes(tiff[offset:offset+length])
+
     def __repr__(self,indent=''):
         """
         Get a textual representation of this object
@@ -0,0 +1,106 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+"""
+A shared cache of decoded tiles, so that reading the same parts
+of the same images over and over does not mean decompressing
+them over and over.
+"""
+from typing import Union, Dict, Hashable
+import threading
+from collections import OrderedDict
+
+
+class GimpTileCache:
+    """
+    A thread-safe, least-recently-used cache of decoded tile data
+    with a memory budget.
+
+    The same cache can be shared by any number of documents (and
+    threads).  To use it, set document.tileCache=cache
+
+    Tiles are keyed by (document, layer, level, tile number)
+    """
+
+    def __init__(self,maxBytes:int=256*1024*1024):
+        """
+        :param maxBytes: the memory budget.  Once the cached tiles
+            add up to more than this, the least recently used are dropped.
+        """
+        self.maxBytes:int=maxBytes
+        self._tiles:'OrderedDict[Hashable,bytes]'=OrderedDict()
+        self._lock:threading.Lock=threading.Lock()
+        self.numBytes:int=0 # how much is cached right now
+        self.hits:int=0
+        self.misses:int=0
+        self.evictions:int=0
+
+    def get(self,key:Hashable)->Union[None,bytes]:
+        """
+        get a tile, if it is cached
+
+        :return: the tile data or None
+        """
+        with self._lock:
+            data=self._tiles.get(key)
+            if data is None:
+                self.misses+=1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits+=1
+            return data
+
+    def put(self,key:Hashable,data:bytes)->None:
+        """
+        add a tile to the cache, dropping older tiles to make room
+
+        (if the tile alone is over budget, it is simply not cached)
+        """
+        size=len(data)
+        if size>self.maxBytes:
+            return
+        with self._lock:
+            old=self._tiles.pop(key,None)
+            if old is not None:
+                self.numBytes-=len(old)
+            self._tiles[key]=data
+            self.numBytes+=size
+            while self.numBytes>self.maxBytes:
+                _,evicted=self._tiles.popitem(last=False)
+                self.numBytes-=len(evicted)
+                self.evictions+=1
+
+    def clear(self)->None:
+        """
+        empty the cache (the statistics are kept)
+        """
+        with self._lock:
+            self._tiles.clear()
+            self.numBytes=0
+
+    def __len__(self)->int:
+        return len(self._tiles)
+
+    @property
+    def stats(self)->Dict[str,Union[int,float]]:
+        """
+        how well the cache is doing
+        """
+        with self._lock:
+            lookups=self.hits+self.misses
+            return {
+                'tiles':len(self._tiles),
+                'bytes':self.numBytes,
+                'maxBytes':self.maxBytes,
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'hitRate':self.hits/lookups if lookups else 0.0}
+
+    def __repr__(self,indent:str='')->str:
+        """
+        Get a textual representation of this object
+        """
+        ret=[]
+        for k,v in self.stats.items():
+            ret.append(k+': '+str(v))
+        return indent+(('\n'+indent).join(ret))
@@ -3,10 +3,201 @@
 """
 Stuff related to vectors/paths within a gimp document
 """
-from typing import List
+from typing import Union, List, Tuple, Iterator
+import struct
+import math
+import PIL.Image
 from gimpFormats.gimpIOBase import GimpIOBase
 from gimpFormats.binaryIO import IO
 from gimpFormats.gimpParasites import GimpParasite
+try:
+    import numpy as np
+    has_numpy=True
+except ImportError:
+    has_numpy=False
+
+
+# each point is a uint32 type followed by up to 6 floats,
+# of which all but x and y are optional
+_POINT_FIELDS=('pointType','x','y','pressure','xTilt','yTilt','wheel')
+_POINT_DEFAULTS=(0,0.0,0.0,1.0,0.5,0.5,0.5)
+_STROKE_HEADER=struct.Struct('>IIII')
+if has_numpy:
+    # how GimpStroke.pointArray is laid out in memory
+    POINT_DTYPE=np.dtype([(name,np.uint32 if name=='pointType' else np.float32) for name in _POINT_FIELDS])
+    # how points are stored in the file, by number of floats per point
+    _FILE_POINT_DTYPES=[None,None]+[
+        np.dtype([(name,'>u4' if name=='pointType' else '>f4') for name in _POINT_FIELDS[:numFloats+1]])
+        for numFloats in range(2,7)]
+
+# keeps a single crazy curve from turning into millions of points
+_MAX_SEGMENT_STEPS=4096
+# roughly how many samples to rasterize at a time
+_RASTER_BAND_SAMPLES=1<<22
+
+
+def _strokeSegments(stroke:'GimpStroke')->Tuple['np.ndarray','np.ndarray']:
+    """
+    the cubic bezier segments of a stroke
+
+    Gimp stores a bezier stroke as (control in, anchor, control out)
+    triples, so each segment runs from an anchor, through its control out
+    and the next anchor's control in, to the next anchor.
+    (Anything not in triples is taken to be a plain polyline.)
+
+    :return: (segments,start) where segments is (n,4,2) control points,
+        and start is the first point, for strokes with no segments
+    """
+    points=stroke.pointArray
+    xy=np.stack((points['x'],points['y']),axis=1).astype(np.float64)
+    if len(xy)%3!=0 or stroke.strokeType!=1:
+        # a polyline, so straight segments with the controls on the ends
+        ends=xy[1:]
+        if stroke.closedShape and len(xy)>1:
+            ends=np.concatenate((ends,xy[:1]))
+        starts=xy[:len(ends)]
+        return np.stack((starts,starts,ends,ends),axis=1),xy[:1]
+    anchors=xy[1::3]
+    controlIn=xy[0::3]
+    controlOut=xy[2::3]
+    numSegments=len(anchors) if stroke.closedShape else len(anchors)-1
+    segments=np.stack((anchors,controlOut,np.roll(controlIn,-1,axis=0),np.roll(anchors,-1,axis=0)),axis=1)
+    return segments[:numSegments],anchors[:1]
+
+
+def flattenStrokes(strokes:List['GimpStroke'],tolerance:float=0.25)->List['np.ndarray']:
+    """
+    turn bezier strokes into polylines
+
+    All the segments of all the strokes are done together.  Each one is
+    cut into n even steps, where n is just enough that the polyline never
+    strays more than tolerance from the curve:
+        n=ceil(sqrt(3*L/(4*tolerance)))
+    where L is the larger second difference of the control points.
+
+    :param strokes: the strokes to flatten
+    :param tolerance: how far (in pixels) the polyline may be from the curve
+    :return: an (n,2) array of x,y points for each stroke
+    """
+    if not has_numpy:
+        raise ImportError('flattening paths requires numpy')
+    allSegments=[]
+    starts=[]
+    for stroke in strokes:
+        segments,start=_strokeSegments(stroke)
+        allSegments.append(segments)
+        starts.append(start)
+    segments=np.concatenate(allSegments) if allSegments else np.zeros((0,4,2))
+    p0,p1,p2,p3=segments[:,0],segments[:,1],segments[:,2],segments[:,3]
+    secondDifference=np.maximum(
+        np.hypot(*(p0-2*p1+p2).T),
+        np.hypot(*(p1-2*p2+p3).T))
+    steps=np.ceil(np.sqrt(3.0*secondDifference/(4.0*max(tolerance,1e-6))))
+    steps=np.clip(steps,1,_MAX_SEGMENT_STEPS).astype(np.int64)
+    # t=0,1/n,..(n-1)/n for every segment, all in one array
+    segmentOf=np.repeat(np.arange(len(segments)),steps)
+    firstStep=np.cumsum(steps)-steps
+    t=(np.arange(len(segmentOf))-firstStep[segmentOf])/steps[segmentOf]
+    t=t[:,np.newaxis]
+    mt=1.0-t
+    points=(mt*mt*mt)*p0[segmentOf]+(3.0*mt*mt*t)*p1[segmentOf]\
+        +(3.0*mt*t*t)*p2[segmentOf]+(t*t*t)*p3[segmentOf]
+    # split them back up by stroke, and finish each with its last point
+    ret=[]
+    pointIndex=0
+    segmentIndex=0
+    for segments,start in zip(allSegments,starts):
+        if not len(segments):
+            ret.append(start)
+            continue
+        numPoints=int(steps[segmentIndex:segmentIndex+len(segments)].sum())
+        segmentIndex+=len(segments)
+        ret.append(np.concatenate((points[pointIndex:pointIndex+numPoints],segments[-1:,3])))
+        pointIndex+=numPoints
+    return ret
+
+
+def rasterizePolylines(polylines:List['np.ndarray'],width:int,height:int,
+    antialias:bool=True,fillRule:str='nonzero')->'np.ndarray':
+    """
+    fill a set of polylines (each one closed back to its start) as a mask
+
+    The edges are all intersected with every scanline they cross at once,
+    then each scanline is filled by summing up the crossings.  Anti-aliasing
+    takes 4x4 samples per pixel.
+
+    :param polylines: (n,2) arrays of x,y points
+    :param width: mask width
+    :param height: mask height
+    :param antialias: give edge pixels partial coverage
+    :param fillRule: 'nonzero' or 'evenodd'
+    :return: a (height,width) uint8 mask
+    """
+    if not has_numpy:
+        raise ImportError('rasterizing paths requires numpy')
+    if fillRule not in ('nonzero','evenodd'):
+        raise Exception('ERR: unknown fill rule "%s"'%fillRule)
+    mask=np.zeros((height,width),np.uint8)
+    polylines=[p for p in polylines if len(p)>2]
+    if not polylines or width<=0 or height<=0:
+        return mask
+    samples=4 if antialias else 1
+    # every edge, including the one that closes each polyline
+    starts=np.concatenate(polylines)
+    ends=np.concatenate([np.roll(p,-1,axis=0) for p in polylines])
+    # only bother with the area the path covers
+    x0=max(int(math.floor(starts[:,0].min())),0)
+    y0=max(int(math.floor(starts[:,1].min())),0)
+    x1=min(int(math.ceil(starts[:,0].max())),width)
+    y1=min(int(math.ceil(starts[:,1].max())),height)
+    if x1<=x0 or y1<=y0:
+        return mask
+    w=(x1-x0)*samples
+    h=(y1-y0)*samples
+    # in sample units, so sample centers are at k+0.5
+    sx=(starts[:,0]-x0)*samples
+    sy=(starts[:,1]-y0)*samples
+    ex=(ends[:,0]-x0)*samples
+    ey=(ends[:,1]-y0)*samples
+    direction=np.where(ey>sy,1,-1)
+    firstRow=np.clip(np.ceil(np.minimum(sy,ey)-0.5),0,h).astype(np.int64)
+    lastRow=np.clip(np.ceil(np.maximum(sy,ey)-0.5),0,h).astype(np.int64)
+    numRows=np.maximum(lastRow-firstRow,0) # horizontal edges cross nothing
+    edgeOf=np.repeat(np.arange(len(numRows)),numRows)
+    rows=np.arange(len(edgeOf))-(np.cumsum(numRows)-numRows)[edgeOf]+firstRow[edgeOf]
+    slope=(ex-sx)/np.where(ey!=sy,ey-sy,1.0)
+    crossX=sx[edgeOf]+(rows+0.5-sy[edgeOf])*slope[edgeOf]
+    # the crossing flips the winding of every sample to its right
+    columns=np.clip(np.ceil(crossX-0.5),0,w).astype(np.int64)
+    directions=direction[edgeOf]
+    order=np.argsort(rows,kind='stable')
+    rows=rows[order]
+    columns=columns[order]
+    directions=directions[order]
+    # fill a band of pixel rows at a time, to keep memory down
+    bandPixelRows=max(1,_RASTER_BAND_SAMPLES//((w+1)*samples*samples))
+    for bandStart in range(0,y1-y0,bandPixelRows):
+        bandEnd=min(bandStart+bandPixelRows,y1-y0)
+        lo,hi=np.searchsorted(rows,(bandStart*samples,bandEnd*samples))
+        bandRows=(bandEnd-bandStart)*samples
+        index=(rows[lo:hi]-bandStart*samples)*(w+1)+columns[lo:hi]
+        winding=np.bincount(index,directions[lo:hi],bandRows*(w+1))
+        winding=np.cumsum(winding.reshape(bandRows,w+1),axis=1)[:,:w]
+        if fillRule=='nonzero':
+            inside=winding!=0
+        else:
+            inside=(np.rint(winding).astype(np.int64)&1)!=0
+        # count the samples inside each pixel (adding up slices
+        # is much faster here than a multi-axis sum())
+        inside=inside.view(np.uint8).reshape(bandEnd-bandStart,samples,x1-x0,samples)
+        rowSum=inside[:,0].copy()
+        for i in range(1,samples):
+            rowSum+=inside[:,i]
+        coverage=rowSum[...,0].astype(np.uint16)
+        for i in range(1,samples):
+            coverage+=rowSum[...,i]
+        mask[y0+bandStart:y0+bandEnd,x0:x1]=(coverage*255+samples*samples//2)//(samples*samples)
+    return mask
 
 
 class GimpVector(GimpIOBase):
@@ -14,6 +205,8 @@ class GimpVector(GimpIOBase):
     A gimp brush stroke vector
     """
 
+    __slots__=('name','linked','strokes')
+
     def __init__(self,parent):
         GimpIOBase.__init__(self,parent)
         self.name:str=''
@@ -28,15 +221,49 @@ class GimpVector(GimpIOBase):
         """
         this vector converted to an svg path string
         """
-        svg=[]
-        for stroke in self.strokes:
-            svg.append(stroke.svgPath)
-        print('STROKES=%d %s'%(len(self.strokes),svg))
-        return ' '.join(svg)
+        return ' '.join(stroke.svgPath for stroke in self.strokes if stroke.numPoints)
     @svgPath.setter
     def svgPath(self,svgPath:str):
         raise NotImplementedError()
 
+    def polylines(self,tolerance:float=0.25)->List['np.ndarray']:
+        """
+        all the strokes, flattened to polylines (see flattenStrokes())
+
+        :param tolerance: how far (in pixels) the polylines may be from the curves
+        :return: an (n,2) array of x,y points for each stroke
+        """
+        return flattenStrokes(self.strokes,tolerance)
+
+    def maskArray(self,width:Union[None,int]=None,height:Union[None,int]=None,
+        tolerance:float=0.25,antialias:bool=True,fillRule:str='nonzero')->'np.ndarray':
+        """
+        fill the vector, as if it were turned into a selection
+
+        (Every stroke is closed back to its start.)
+
+        :param width: mask width (default is the document width)
+        :param height: mask height (default is the document height)
+        :param tolerance: how far (in pixels) the outline may be from the curves
+        :param antialias: give edge pixels partial coverage
+        :param fillRule: 'nonzero' or 'evenodd'
+        :return: a (height,width) uint8 array
+        """
+        if width is None:
+            width=self.doc.width
+        if height is None:
+            height=self.doc.height
+        return rasterizePolylines(self.polylines(tolerance),width,height,antialias,fillRule)
+
+    def mask(self,width:Union[None,int]=None,height:Union[None,int]=None,
+        tolerance:float=0.25,antialias:bool=True,fillRule:str='nonzero')->PIL.Image.Image:
+        """
+        fill the vector, as if it were turned into a selection
+
+        Same as maskArray(), but as an 'L' image
+        """
+        return PIL.Image.fromarray(self.maskArray(width,height,tolerance,antialias,fillRule),'L')
+
     def fromBytes(self,data,index=0):
         """
         decode a byte buffer
@@ -45,14 +272,12 @@ class GimpVector(GimpIOBase):
         :param index: index within the buffer to start at
         """
         io=IO(data,index,boolSize=32)
-        print(io.data[0:50])
         self.name=io.sz754
         self.uniqueId=io.u32
         self.visible=io.bool
         self.linked=io.bool
         numParasites=io.u32
         numStrokes=io.u32
-        raise Exception('Parasites=%d Strokes=%d'%(numParasites,numStrokes))
         for _ in range(numParasites):
             p=GimpParasite()
             io.index=p.fromBytes(io.data,io.index)
@@ -60,7 +285,7 @@ class GimpVector(GimpIOBase):
         for _ in range(numStrokes):
             gs=GimpStroke(self)
             io.index=gs.fromBytes(io.data,io.index)
-            self.strokes.append(p)
+            self.strokes.append(gs)
         return io.index
 
     def toBytes(self):
@@ -100,80 +325,185 @@ class GimpVector(GimpIOBase):
         return indent+(('\n'+indent).join(ret))
 
 
-class GimpStroke(GimpIOBase):
+class GimpStroke:
     """
     A single stroke within a vector
+
+    The points are kept as a numpy structured array (see pointArray)
+    and only turned into GimpPoint objects if you ask for self.points.
+    Without numpy, they are always GimpPoint objects.
+
+    (Strokes and points do not carry gimp item properties,
+    so they are plain, compact objects.)
     """
 
     STROKE_TYPES=['None','Bezier']
 
-    def __init__(self,parent):
-        GimpIOBase.__init__(self,parent)
+    __slots__=('parent','strokeType','closedShape','numFloatsPerPoint','_pointArray','_points')
+
+    def __init__(self,parent:GimpVector):
+        self.parent:GimpVector=parent
         self.strokeType:int=1 # one of self.STROKE_TYPES
         self.closedShape:bool=True
-        self.points:List[GimpPoint]=[]
-        self.numFloatsPerPoint:int=1
-        self.numPoints:int=0
+        self.numFloatsPerPoint:int=6 # x, y, pressure, xTilt, yTilt, wheel
+        self._pointArray:Union[None,'np.ndarray']=None
+        self._points:Union[None,List[GimpPoint]]=[]
+
+    @property
+    def points(self)->List['GimpPoint']:
+        """
+        the points as a list of GimpPoint objects
+
+        NOTE: the objects are created the first time this is called,
+            and from then on they (not pointArray) are what gets saved
+        """
+        if self._points is None:
+            self._points=list(self._pointObjects())
+            self._pointArray=None
+        return self._points
+    @points.setter
+    def points(self,points:List['GimpPoint']):
+        self._points=points
+        self._pointArray=None
+
+    @property
+    def pointArray(self)->'np.ndarray':
+        """
+        the points as a numpy structured array of POINT_DTYPE
+        with fields (pointType,x,y,pressure,xTilt,yTilt,wheel)
+
+        NOTE: if the points have been turned into objects (see self.points)
+            this is a fresh copy made from them
+        """
+        if not has_numpy:
+            raise ImportError('pointArray requires numpy')
+        if self._pointArray is not None:
+            return self._pointArray
+        ret=np.zeros(len(self._points),POINT_DTYPE)
+        for i,point in enumerate(self._points):
+            ret[i]=tuple(_POINT_DEFAULTS[j] if v is None else v
+                for j,v in enumerate(getattr(point,name) for name in _POINT_FIELDS))
+        return ret
+    @pointArray.setter
+    def pointArray(self,pointArray:'np.ndarray'):
+        self._pointArray=np.asarray(pointArray,POINT_DTYPE)
+        self._points=None
+
+    @property
+    def numPoints(self)->int:
+        """
+        how many points are in the stroke
+        """
+        if self._points is None:
+            return len(self._pointArray)
+        return len(self._points)
+
+    def _pointObjects(self)->Iterator['GimpPoint']:
+        """
+        GimpPoint objects for the points, without keeping them
+        """
+        if self._points is not None:
+            yield from self._points
+            return
+        for values in self._pointArray.tolist():
+            gp=GimpPoint(self)
+            gp.pointType,gp.x,gp.y,gp.pressure,gp.xTilt,gp.yTilt,gp.wheel=values
+            yield gp
+
+    @property
+    def _fileNumFloats(self)->int:
+        """
+        how many floats per point are actually in the file (always 2..6)
+        """
+        return max(2,min(6,self.numFloatsPerPoint))
 
     @property
     def svgPath(self)->str:
         """
-        this vector converted to an svg path string
+        this stroke converted to an svg path string
         """
-        svg=[]
-        for point in self.points:
-            if not svg:
-                # initial move
-                svg.append('M%d %d'%(point.x,point.y))
-            elif self.strokeType==0:
-                # line
-                svg.append('L%d %d'%(point.x,point.y))
-            elif self.strokeType==1:
-                # bezier
-                if point.pointType==0:
-                    # anchor point
-                    svg.append('%d %d Q'%(point.x,point.y))
-                else:
-                    # control point
-                    svg.append('%d %d,'%(point.x,point.y))
-                    svg.append(point)
-            else:
-                raise Exception('Unknown stroke type')
-            svg.append(stroke.svgPath)
+        points=[(point.x,point.y) for point in self._pointObjects()]
+        if not points:
+            return ''
+        if len(points)%3!=0 or self.strokeType!=1:
+            # a plain polyline
+            svg=['M%g %g'%points[0]]
+            svg.extend('L%g %g'%point for point in points[1:])
+        else:
+            # (control in, anchor, control out) triples
+            svg=['M%g %g'%points[1]]
+            numAnchors=len(points)//3
+            numSegments=numAnchors if self.closedShape else numAnchors-1
+            for i in range(numSegments):
+                j=(i+1)%numAnchors
+                svg.append('C%g %g %g %g %g %g'%(points[i*3+2]+points[j*3]+points[j*3+1]))
         if self.closedShape:
             svg.append('Z')
         return ' '.join(svg)
 
+    def polyline(self,tolerance:float=0.25)->'np.ndarray':
+        """
+        this stroke flattened to a polyline (see flattenStrokes())
+
+        :param tolerance: how far (in pixels) the polyline may be from the curve
+        :return: an (n,2) array of x,y points
+        """
+        return flattenStrokes([self],tolerance)[0]
+
     def fromBytes(self,data:bytes,index:int=0):
         """
         decode a byte buffer
 
+        All the points are decoded in one go, straight from the buffer.
+
         :param data: data buffer to decode
         :param index: index within the buffer to start at
         """
-        io=IO(data,index,boolSize=32)
-        self.strokeType=io.u32
-        self.closedShape=io.bool
-        self.numFloatsPerPoint=io.u32
-        self.numPoints=io.u32
-        for _ in range(self.numPoints):
+        self.strokeType,closedShape,self.numFloatsPerPoint,numPoints=\
+            _STROKE_HEADER.unpack_from(data,index)
+        self.closedShape=closedShape!=0
+        index+=_STROKE_HEADER.size
+        numFloats=self._fileNumFloats
+        if has_numpy:
+            fileDtype=_FILE_POINT_DTYPES[numFloats]
+            filePoints=np.frombuffer(data,fileDtype,numPoints,index)
+            points=np.empty(numPoints,POINT_DTYPE)
+            for name,default in zip(_POINT_FIELDS,_POINT_DEFAULTS):
+                if name in fileDtype.names:
+                    points[name]=filePoints[name]
+                else:
+                    points[name]=default
+            self.pointArray=points
+            return index+fileDtype.itemsize*numPoints
+        pointStruct=struct.Struct('>I%df'%numFloats)
+        end=index+pointStruct.size*numPoints
+        self.points=[]
+        for values in pointStruct.iter_unpack(data[index:end]):
             gp=GimpPoint(self)
-            io.index=gp.fromBytes(io.data,io.index,self.numFloatsPerPoint)
+            gp.pointType,gp.x,gp.y,gp.pressure,gp.xTilt,gp.yTilt,gp.wheel=\
+                values+_POINT_DEFAULTS[len(values):]
             self.points.append(gp)
-        return io.index
+        return end
 
     def toBytes(self):
         """
         encode to binary data
         """
-        io=IO(boolSize=32)
-        io.u32=self.strokeType
-        io.bool=self.closedShape
-        io.u32=self.numFloatsPerPoint
-        io.u32=self.numPoints
-        for gp in self.points:
-            io.addBytes(gp.toBytes())
-        return io.data
+        numFloats=self._fileNumFloats
+        ret=bytearray(_STROKE_HEADER.pack(self.strokeType,self.closedShape,numFloats,self.numPoints))
+        if self._points is None: # straight from the array
+            fileDtype=_FILE_POINT_DTYPES[numFloats]
+            filePoints=np.empty(len(self._pointArray),fileDtype)
+            for name in fileDtype.names:
+                filePoints[name]=self._pointArray[name]
+            ret.extend(filePoints.tobytes())
+            return ret
+        pointStruct=struct.Struct('>I%df'%numFloats)
+        for gp in self._points:
+            values=[_POINT_DEFAULTS[i] if v is None else v
+                for i,v in enumerate(getattr(gp,name) for name in _POINT_FIELDS)]
+            ret.extend(pointStruct.pack(*values[:numFloats+1]))
+        return ret
 
     def __repr__(self,indent=''):
         """
@@ -183,20 +513,22 @@ class GimpStroke(GimpIOBase):
         ret.append('Stroke Type: '+self.STROKE_TYPES[self.strokeType])
         ret.append('Closed: '+str(self.closedShape))
         ret.append('Points: ')
-        for point in self.points:
+        for point in self._pointObjects():
             ret.append(point.__repr__(indent+'\t'))
         return indent+(('\n'+indent).join(ret))
 
 
-class GimpPoint(GimpIOBase):
+class GimpPoint:
     """
     A single point within a stroke
     """
 
     POINT_TYPES=['Anchor','Bezier control point']
 
-    def __init__(self,parent):
-        GimpIOBase.__init__(self,parent)
+    __slots__=('parent','x','y','pressure','xTilt','yTilt','wheel','pointType')
+
+    def __init__(self,parent:GimpStroke):
+        self.parent:GimpStroke=parent
         self.x:int=0
         self.y:int=0
         self.pressure:float=1.0
@@ -262,4 +594,88 @@ class GimpPoint(GimpIOBase):
         ret.append('Pressure: '+str(self.pressure))
         ret.append('Location: ('+str(self.xTilt)+','+str(self.yTilt)+')')
         ret.append('Wheel: '+str(self.wheel))
-        return indent+(('\n'+indent).join(ret))
\ No newline at end of file
+        return indent+(('\n'+indent).join(ret))
+
+class GimpOldPath:
+    """
+    A path in the old (pre-gimp 1.3) format, as found in PROP_PATHS
+
+    Newer files keep their paths as vectors instead (see GimpVector).
+    """
+
+    __slots__=('parent','name','linked','state','closed','version','pathType','tattoo','points')
+
+    def __init__(self,parent):
+        self.parent=parent
+        self.name:str=''
+        self.linked:bool=False
+        self.state:int=2 # 4 if closed, 2 otherwise
+        self.closed:bool=False
+        self.version:int=3 # 1 has integer points, 2 adds pathType, 3 adds tattoo
+        self.pathType:int=1
+        self.tattoo:int=0
+        self.points:List[Tuple[int,Union[int,float],Union[int,float]]]=[] # (pointType,x,y)
+
+    def fromBytes(self,data,index=0):
+        """
+        decode a byte buffer
+
+        :param data: data buffer to decode
+        :param index: index within the buffer to start at
+        """
+        io=IO(data,index,boolSize=32)
+        self.name=io.sz754
+        self.linked=io.bool
+        self.state=io.u8
+        self.closed=io.bool
+        numPoints=io.u32
+        self.version=io.u32
+        if self.version not in (1,2,3):
+            raise Exception('ERR: unknown path version %d'%self.version)
+        if self.version>1:
+            self.pathType=io.u32
+            if self.version>2:
+                self.tattoo=io.u32
+        self.points=[]
+        for _ in range(numPoints):
+            if self.version==1:
+                self.points.append((io.u32,io.i32,io.i32))
+            else:
+                self.points.append((io.u32,io.float,io.float))
+        return io.index
+
+    def toBytes(self):
+        """
+        encode to binary data
+        """
+        io=IO(boolSize=32)
+        io.sz754=self.name
+        io.bool=self.linked
+        io.u8=self.state
+        io.bool=self.closed
+        io.u32=len(self.points)
+        io.u32=self.version
+        if self.version>1:
+            io.u32=self.pathType
+            if self.version>2:
+                io.u32=self.tattoo
+        for pointType,x,y in self.points:
+            io.u32=pointType
+            if self.version==1:
+                io.i32=x
+                io.i32=y
+            else:
+                io.float=x
+                io.float=y
+        return io.data
+
+    def __repr__(self,indent=''):
+        """
+        Get a textual representation of this object
+        """
+        ret=[]
+        ret.append('Name: '+str(self.name))
+        ret.append('Linked: '+str(self.linked))
+        ret.append('Closed: '+str(self.closed))
+        ret.append('Points: '+str(self.points))
+        return indent+(('\n'+indent).join(ret))
@@ -13,10 +13,19 @@ Currently not supporting:
     Programatically alter documents (add layer, etc)
     Rendering a final, compositied image
 """
-from typing import Any, Union, BinaryIO, List
+from typing import Any, Union, BinaryIO, List, Tuple
+from io import BytesIO
+import mmap as mmapModule
+import contextlib
+import concurrent.futures
+import PIL.Image
 from gimpFormats.binaryIO import IO
-from gimpFormats.gimpIOBase import GimpIOBase
+from gimpFormats.gimpIOBase import GimpIOBase, _POINTER32, _POINTER64
 from gimpFormats.gimpImageInternals import GimpChannel, GimpImageHierarchy
+from gimpFormats.gimpXcfIndex import GimpXcfIndex
+from gimpFormats.gimpParasites import THUMBNAIL_PARASITES
+from gimpFormats.gimpTileCache import GimpTileCache
+from gimpFormats.gimpCompositor import GimpCompositor, layerCanvasBounds
 try:
     import smartimage
     has_smartimage=True
@@ -34,6 +43,19 @@ class GimpLayer(GimpIOBase):
         'Indexed without alpha','Indexed with alpha']
     PIL_MODE_TO_LAYER_MODE={'L':2,'LA':3,'RGB':0,'RGBA':1}
 
+    # the most dirty rectangles to keep track of before merging them into one
+    MAX_DIRTY_RECTS=16
+
+    _DEFAULTS_=dict(GimpIOBase._DEFAULTS_,
+        _opacity=None,_visible=None,_blendMode=None,_xOffset=None,_yOffset=None,
+        _applyMask=None,_compositeMode=None,_compositeSpace=None,_blendSpace=None,
+        _dirtyRects=None) # Union[None,List[Union[None,Tuple[int,int,int,int]]]]
+
+    __slots__=('width','height','colorMode','name',
+        '_imageHierarchy','_imageHierarchyPtr','_mask','_maskPtr','_data',
+        '_opacity','_visible','_blendMode','_xOffset','_yOffset',
+        '_applyMask','_compositeMode','_compositeSpace','_blendSpace','_dirtyRects')
+
     def __init__(self,parent,name=None,image:Union['PIL.Image',None]=None):
         GimpIOBase.__init__(self,parent)
         if name is None:
@@ -47,9 +69,143 @@ class GimpLayer(GimpIOBase):
         self._mask:Union[GimpChannel,None]=None
         self._maskPtr:Union[int,None]=None
         self._data:Union[None,bytearray]=None
+        # canvas areas changed since the compositor last looked (None=everything)
+        self._dirtyRects=[None] # never rendered, so all of it
         if image is not None:
             self.image=image # done last as it resets some of the above defaults
 
+    def markDirty(self,bounds:Union[None,Tuple[int,int,int,int]]=None)->None:
+        """
+        let the document know part of this layer needs to be re-rendered
+
+        Changing image, opacity, visible, blendMode, xOffset, yOffset,
+        applyMask, compositeMode, compositeSpace, blendSpace, or the
+        image of the mask does this automatically, but if you change
+        anything else (say, draw on the image in place) call this yourself.
+
+        :param bounds: (x0,y0,x1,y1) in layer pixels that changed
+            (if None, the whole layer)
+        """
+        if self._dirtyRects is None: # still being constructed
+            return
+        if None in self._dirtyRects: # already all dirty
+            return
+        rect=layerCanvasBounds(self)
+        if rect is not None and bounds is not None:
+            x,y=rect[0],rect[1]
+            rect=(x+bounds[0],y+bounds[1],x+bounds[2],y+bounds[3])
+        if rect is None or len(self._dirtyRects)>=self.MAX_DIRTY_RECTS:
+            rects=self._dirtyRects+[rect]
+            if rect is not None:
+                rect=(min(r[0] for r in rects),min(r[1] for r in rects),
+                    max(r[2] for r in rects),max(r[3] for r in rects))
+            self._dirtyRects=[rect]
+        else:
+            self._dirtyRects.append(rect)
+
+    @property
+    def opacity(self)->Union[None,int,float]:
+        """
+        layer opacity (either a float 0..1 or an int 0..255)
+        """
+        return self._opacity
+    @opacity.setter
+    def opacity(self,opacity:Union[None,int,float]):
+        self._opacity=opacity
+        self.markDirty()
+
+    @property
+    def visible(self)->Union[None,bool]:
+        """
+        is the layer visible
+        """
+        return self._visible
+    @visible.setter
+    def visible(self,visible:Union[None,bool]):
+        self._visible=visible
+        self.markDirty()
+
+    @property
+    def blendMode(self)->Union[None,int]:
+        """
+        how the layer is blended (one of self.BLEND_MODES)
+        """
+        return self._blendMode
+    @blendMode.setter
+    def blendMode(self,blendMode:Union[None,int]):
+        self.markDirty() # the old mode may have affected a different area
+        self._blendMode=blendMode
+        self.markDirty()
+
+    @property
+    def xOffset(self)->Union[None,int]:
+        """
+        where the layer is on the canvas
+        """
+        return self._xOffset
+    @xOffset.setter
+    def xOffset(self,xOffset:Union[None,int]):
+        self.markDirty() # where it was
+        self._xOffset=xOffset
+        self.markDirty() # where it is now
+
+    @property
+    def yOffset(self)->Union[None,int]:
+        """
+        where the layer is on the canvas
+        """
+        return self._yOffset
+    @yOffset.setter
+    def yOffset(self,yOffset:Union[None,int]):
+        self.markDirty() # where it was
+        self._yOffset=yOffset
+        self.markDirty() # where it is now
+
+    @property
+    def applyMask(self)->Union[None,bool]:
+        """
+        is the layer mask applied
+        """
+        return self._applyMask
+    @applyMask.setter
+    def applyMask(self,applyMask:Union[None,bool]):
+        self._applyMask=applyMask
+        self.markDirty()
+
+    @property
+    def compositeMode(self)->Union[None,int]:
+        """
+        how the layer is composited (one of self.COMPOSITE_MODES)
+        """
+        return self._compositeMode
+    @compositeMode.setter
+    def compositeMode(self,compositeMode:Union[None,int]):
+        self.markDirty() # clipping modes affect more than the layer itself
+        self._compositeMode=compositeMode
+        self.markDirty()
+
+    @property
+    def compositeSpace(self)->Union[None,int]:
+        """
+        the color space the layer is composited in (one of self.COMPOSITE_SPACES)
+        """
+        return self._compositeSpace
+    @compositeSpace.setter
+    def compositeSpace(self,compositeSpace:Union[None,int]):
+        self._compositeSpace=compositeSpace
+        self.markDirty()
+
+    @property
+    def blendSpace(self)->Union[None,int]:
+        """
+        the color space the layer is blended in
+        """
+        return self._blendSpace
+    @blendSpace.setter
+    def blendSpace(self,blendSpace:Union[None,int]):
+        self._blendSpace=blendSpace
+        self.markDirty()
+
     def fromBytes(self,data,index=0):
         """
         alias for _decode_()
@@ -75,9 +231,12 @@ class GimpLayer(GimpIOBase):
         self._data=data
         return io.index
 
-    def toBytes(self):
+    def toBytes(self,baseIndex:int=0):
         """
         encode to byte array
+
+        :param baseIndex: where in the file this will be written
+            (needed because pointers are absolute file positions)
         """
         dataAreaIO=IO()
         io=IO()
@@ -85,16 +244,54 @@ class GimpLayer(GimpIOBase):
         io.u32=self.height
         io.u32=self.colorMode
         io.sz754=self.name
-        dataAreaIndex=io.index+self._POINTER_SIZE_*2
-        io.addBytes(self._pointerEncode_(dataAreaIndex))
-        dataAreaIO.addBytes(self._propertiesEncode_())
-        io.addBytes(self._pointerEncode_(dataAreaIndex))
-        if self.mask is not None:
-            dataAreaIO.addBytes(self.mask.toBytes())
-        io.addBytes(self._pointerEncode_(dataAreaIndex+dataAreaIO.index))
-        io.addBytes(dataAreaIO)
+        io.addBytes(self._propertiesEncode_())
+        dataAreaIndex=baseIndex+io.index+(self._POINTER_SIZE_//8)*2
+        imageHierarchy=self.imageHierarchy
+        if imageHierarchy is None:
+            io.addBytes(self._pointerEncode_(0))
+        else:
+            io.addBytes(self._pointerEncode_(dataAreaIndex))
+            dataAreaIO.addBytes(imageHierarchy.toBytes(dataAreaIndex))
+        mask=self.mask
+        if mask is None:
+            io.addBytes(self._pointerEncode_(0))
+        else:
+            io.addBytes(self._pointerEncode_(dataAreaIndex+dataAreaIO.index))
+            dataAreaIO.addBytes(mask.toBytes(dataAreaIndex+dataAreaIO.index))
+        io.addBytes(dataAreaIO.data)
         return io.data
 
+    def toFile(self,f:BinaryIO,fileStart:int=0):
+        """
+        stream this layer out to a file at the current position
+
+        Rather than building everything in memory, pointers are written
+        as placeholders and filled in once the data they point to is written.
+
+        :param f: the file to write to
+        :param fileStart: where in f the xcf file begins
+            (pointers are relative to that)
+        """
+        io=IO()
+        io.u32=self.width
+        io.u32=self.height
+        io.u32=self.colorMode
+        io.sz754=self.name
+        io.addBytes(self._propertiesEncode_())
+        f.write(io.data)
+        tableIndex=f.tell()
+        f.write(self._pointersEncode_([0,0]))
+        ptrs=[0,0]
+        imageHierarchy=self.imageHierarchy
+        if imageHierarchy is not None:
+            ptrs[0]=f.tell()-fileStart
+            imageHierarchy.toFile(f,fileStart)
+        mask=self.mask
+        if mask is not None:
+            ptrs[1]=f.tell()-fileStart
+            mask.toFile(f,fileStart)
+        self._pointersPatch_(f,tableIndex,ptrs)
+
     def _addToSmartimage(self,si,parentLayer=None):
         """
         add this layer to a smartimage document
@@ -218,6 +415,7 @@ class GimpLayer(GimpIOBase):
 
         NOTE: resets layer width, height, and colorMode
         """
+        self.markDirty() # in case it gets smaller
         self.height=image.height
         self.width=image.width
         if image.mode not in self.PIL_MODE_TO_LAYER_MODE:
@@ -226,8 +424,69 @@ class GimpLayer(GimpIOBase):
         if not self.name and isinstance(image,str):
             # try to use a filename as the name
             self.name=image.rsplit('\\',1)[-1].rsplit('/',1)[-1]
-        self.imageHierarchy=GimpImageHierarchy(self)
-        self.imageHierarchy.image=image
+        self._imageHierarchy=GimpImageHierarchy(self,image)
+        self._imageHierarchyPtr=None
+        self.markDirty()
+
+    def getRegion(self,bounds:Tuple[int,int,int,int])->Union[None,'PIL.Image']:
+        """
+        get a portion of the layer image
+
+        Only the tiles that intersect the bounds are decompressed,
+        so this is much cheaper than cropping self.image
+        when all you want is a thumbnail or a small area.
+
+        :param bounds: (x0,y0,x1,y1) in layer pixels, x1 and y1 are exclusive
+        :return: the cropped image (can return None!)
+        """
+        if self.imageHierarchy is None:
+            return None
+        return self.imageHierarchy.getRegion(bounds)
+
+    def asArray(self,bounds:Union[None,Tuple[int,int,int,int]]=None,reduction:int=1
+        )->Union[None,'np.ndarray']:
+        """
+        get the layer image as a numpy array, skipping PIL entirely
+
+        Tiles are decoded directly into a preallocated array, which
+        is quicker than np.asarray(layer.image) when you want numpy anyway.
+
+        NOTE: requires numpy
+
+        :param bounds: only get this (x0,y0,x1,y1) part of the layer,
+            in layer pixels, decoding just the tiles it touches
+            (like getRegion())
+        :param reduction: shrink the layer by this factor (1,2,4..64)
+            a tile at a time, averaging each block of pixels
+            (bounds are then in shrunken pixels)
+        :return: array of shape (height,width,numChannels), typed to
+            match the document precision (can return None!)
+        """
+        if self.imageHierarchy is None:
+            return None
+        return self.imageHierarchy.asArray(bounds,reduction)
+
+    def fromArray(self,pixels:'np.ndarray')->None:
+        """
+        set the layer image from a numpy array
+
+        Unlike setting image, this keeps high bit depth pixels at
+        their full precision.
+
+        NOTE: resets layer width, height, and colorMode
+
+        :param pixels: array of shape (height,width,numChannels)
+            whose dtype matches the document precision
+        """
+        hierarchy=GimpImageHierarchy(self)
+        hierarchy.fromArray(pixels)
+        self.markDirty() # in case it gets smaller
+        self.height=hierarchy.height
+        self.width=hierarchy.width
+        self.colorMode=self.PIL_MODE_TO_LAYER_MODE[(None,'L','LA','RGB','RGBA')[pixels.shape[-1]]]
+        self._imageHierarchy=hierarchy
+        self._imageHierarchyPtr=None
+        self.markDirty()
 
     @property
     def imageHierarchy(self):
@@ -239,7 +498,7 @@ class GimpLayer(GimpIOBase):
 
         NOTE: can return None if it has been fully read into an image
         """
-        if self._imageHierarchy is None and self._imageHierarchyPtr>0:
+        if self._imageHierarchy is None and self._imageHierarchyPtr:
             self._imageHierarchy=GimpImageHierarchy(self)
             self._imageHierarchy.fromBytes(self._data,self._imageHierarchyPtr)
         return self._imageHierarchy
@@ -251,7 +510,8 @@ class GimpLayer(GimpIOBase):
         if self.mask is not None:
             self.mask._forceFullyLoaded()
         _=self.image # make sure the image is loaded so we can delete the hierarchy nonsense
-        self._imageHierarchy=None
+        self._imageHierarchyPtr=None
+        self._maskPtr=None
         self._data=None
 
     def __repr__(self,indent=''):
@@ -281,6 +541,11 @@ class Precision:
         self.gamma:bool=True
         self.numberFormat:Any=int
 
+    # (bits,numberFormat) for each precision code//100
+    # (the numbering changed between gimp versions)
+    _V5_PRECISIONS={1:(8,int),2:(16,int),3:(32,int),4:(16,float),5:(32,float)}
+    _V7_PRECISIONS={1:(8,int),2:(16,int),3:(32,int),5:(16,float),6:(32,float),7:(64,float)}
+
     def decode(self,gimpVersion,io):
         """
         decode the precision code from the file
@@ -295,47 +560,43 @@ class Precision:
                 self.gamma=(True,True,False,False,False)[code]
                 self.bits=(8,16,32,16,32)[code]
                 self.numberFormat=(int,int,int,float,float)[code]
-            elif gimpVersion in (5,6):
-                self.gamma=(code%100!=0)
-                code=int(code/100)
-                self.bits=(8,16,32,16,32)[code]
-                self.numberFormat=(int,int,int,float,float)[code]
-            else: # gimpVersion 7 or above
+            else:
+                if gimpVersion in (5,6):
+                    precisions=self._V5_PRECISIONS
+                else: # gimpVersion 7 or above
+                    precisions=self._V7_PRECISIONS
+                if code//100 not in precisions:
+                    raise Exception('ERR: unknown precision code %d'%code)
                 self.gamma=(code%100!=0)
-                code=int(code/100)
-                self.bits=(8,16,32,16,32,64)[code]
-                self.numberFormat=(int,int,int,float,float,float)[code]
+                self.bits,self.numberFormat=precisions[code//100]
 
     def encode(self,gimpVersion,io):
         """
         encode this to the file
-
-        NOTE: will not mess with development versions 5 or 6
         """
         if gimpVersion<4:
             if self.bits!=8 or not(self.gamma) or self.numberFormat!=int:
-                params=(str(str),gimpVersion)
-                raise Exception('Illegal precision (%s) for gimp version %f'%params)
+                params=(str(self),gimpVersion)
+                raise Exception('Illegal precision (%s) for gimp version %d'%params)
         else:
             if gimpVersion==4:
-                if self.bits==64:
-                    params=(str(str),gimpVersion)
-                    raise Exception('Illegal precision (%s) for gimp version %f'%params)
-                if self.numberFormat==int:
-                    code=(8,16,32).index(self.bits)
-                else:
-                    code=(16,32).index(self.bits)+2
-                code=code*100
-                if self.gamma:
-                    code+=50
-            elif gimpVersion in (5,6):
-                raise NotImplementedError('Cannot save to gimp developer version '+str(gimpVersion))
-            else: # version 7 or above
-                if self.numberFormat==int:
-                    code=(8,16,32).index(self.bits)
-                else:
-                    code=(16,32,64).index(self.bits)+2
-                code=code*100
+                precisions=[(8,int,True),(16,int,True),(32,int,False),(16,float,False),(32,float,False)]
+                key=(self.bits,self.numberFormat,self.gamma)
+                if key not in precisions:
+                    params=(str(self),gimpVersion)
+                    raise Exception('Illegal precision (%s) for gimp version %d'%params)
+                code=precisions.index(key)
+            else:
+                if gimpVersion in (5,6):
+                    precisions=self._V5_PRECISIONS
+                else: # version 7 or above
+                    precisions=self._V7_PRECISIONS
+                codes={v:k for k,v in precisions.items()}
+                key=(self.bits,self.numberFormat)
+                if key not in codes:
+                    params=(str(self),gimpVersion)
+                    raise Exception('Illegal precision (%s) for gimp version %d'%params)
+                code=codes[key]*100
                 if self.gamma:
                     code+=50
             io.u32=code
@@ -346,18 +607,167 @@ class Precision:
         """
         if self.bits==8 and self.gamma and self.numberFormat==int:
             return 0
-        if self.bits==64:
-            return 7
-        return 4
+        if (self.bits,self.numberFormat,self.gamma) in \
+            [(16,int,True),(32,int,False),(16,float,False),(32,float,False)]:
+            return 4
+        return 7
+
+    @property
+    def bytesPerSample(self)->int:
+        """
+        how many bytes each channel of each pixel takes up
+        """
+        return self.bits//8
+
+    @property
+    def dtype(self)->str:
+        """
+        the numpy dtype of a sample, as stored in the file (big endian)
+        """
+        if self.numberFormat is float:
+            return '>f%d'%self.bytesPerSample
+        return '>u%d'%self.bytesPerSample
 
     def __repr__(self):
         ret=[]
         ret.append(str(self.bits)+"-bit")
         ret.append('gamma' if self.gamma else 'linear')
-        ret.append('integer' if self.numberFormat is int else float)
+        ret.append('integer' if self.numberFormat is int else 'float')
         return ' '.join(ret)
 
 
+class GimpDocumentInfo:
+    """
+    A lightweight summary of an xcf file, as returned by GimpDocument.probe()
+
+    Only the header, image properties, and layer headers are read
+    (with a seek and a small read for each) so this costs about the
+    same no matter how much pixel data the file has.
+    """
+
+    # how many pointers to read at a time from the pointer tables
+    _POINTER_CHUNK=64
+
+    def __init__(self,filename:Union[None,str,BinaryIO]=None):
+        """
+        :param filename: optional file to probe (see load())
+        """
+        self.filename:Union[str,None]=None
+        self.version:int=0
+        self.width:int=0
+        self.height:int=0
+        self.baseColorMode:int=0
+        self.precision:Precision=Precision()
+        self.compression:Union[int,None]=None
+        self.horizontalResolution:Union[float,None]=None
+        self.verticalResolution:Union[float,None]=None
+        self.layerNames:List[str]=[]
+        if filename is not None:
+            self.load(filename)
+
+    def load(self,filename:Union[str,BinaryIO]):
+        """
+        read the summary from a file
+
+        :param filename: can be a file name or a seekable file-like object
+        """
+        if hasattr(filename,'read'):
+            self.filename=getattr(filename,'name',None)
+            self._decode_(filename)
+        else:
+            self.filename=filename
+            with open(filename,'rb') as f:
+                self._decode_(f)
+
+    def _decode_(self,f:BinaryIO):
+        """
+        read the summary from an open file
+        """
+        fileStart=f.tell()
+        io=IO(f.read(14)) # magic number and version
+        if io.getBytes(9)!="gimp xcf ".encode('ascii'):
+            raise Exception('Not a valid GIMP file')
+        version=io.cString
+        if version=='file':
+            self.version=0
+        else:
+            self.version=int(version[1:])
+        f.seek(fileStart+io.index)
+        io=IO(f.read(16))
+        self.width=io.u32
+        self.height=io.u32
+        self.baseColorMode=io.u32
+        self.precision=Precision()
+        self.precision.decode(self.version,io)
+        f.seek(f.tell()-len(io.data)+io.index)
+        # image properties, skipping the payload of any we don't care about
+        while True:
+            io=IO(f.read(8))
+            propertyType=io.u32
+            length=io.u32
+            if propertyType==GimpIOBase.PROP_END:
+                break
+            if propertyType==GimpIOBase.PROP_COMPRESSION:
+                self.compression=IO(f.read(length)).u8
+            elif propertyType==GimpIOBase.PROP_RESOLUTION:
+                io=IO(f.read(length))
+                self.horizontalResolution=io.float32
+                self.verticalResolution=io.float32
+            else:
+                f.seek(length,1)
+        # layer headers
+        self.layerNames=[]
+        for ptr in self._readPointers(f):
+            f.seek(fileStart+ptr+12) # skip width, height and type
+            length=IO(f.read(4)).u32
+            self.layerNames.append(IO(f.read(length)).getBytes(length)[:-1].decode('utf-8',errors='replace'))
+
+    def _readPointers(self,f:BinaryIO)->List[int]:
+        """
+        read a zero-terminated pointer table a chunk at a time
+        """
+        pointerSize=8 if self.version>=11 else 4
+        ptrs=[]
+        while True:
+            tableIndex=f.tell()
+            io=IO(f.read(pointerSize*self._POINTER_CHUNK))
+            count=len(io.data)//pointerSize
+            if count==0:
+                raise Exception('ERR: pointer table runs off the end of the file')
+            if pointerSize==8:
+                chunk=io.u64array(count).tolist()
+            else:
+                chunk=io.u32array(count).tolist()
+            if 0 in chunk:
+                ptrs.extend(chunk[:chunk.index(0)])
+                f.seek(tableIndex+pointerSize*(chunk.index(0)+1))
+                return ptrs
+            ptrs.extend(chunk)
+
+    @property
+    def numLayers(self)->int:
+        """
+        how many (top-level and nested) layers the file has
+        """
+        return len(self.layerNames)
+
+    def __repr__(self,indent=''):
+        """
+        Get a textual representation of this object
+        """
+        ret=[]
+        if self.filename is not None:
+            ret.append('Filename: '+self.filename)
+        ret.append('Version: '+str(self.version))
+        ret.append('Size: '+str(self.width)+' x '+str(self.height))
+        ret.append('Base Color Mode: '+GimpIOBase.COLOR_MODES[self.baseColorMode])
+        ret.append('Precision: '+str(self.precision))
+        if self.horizontalResolution is not None:
+            ret.append('Resolution: '+str(self.horizontalResolution)+' x '+str(self.verticalResolution))
+        ret.append('Layers: '+', '.join(self.layerNames))
+        return indent+(('\n'+indent).join(ret))
+
+
 class GimpDocument(GimpIOBase):
     """
     Pure python implementation of the gimp file format
@@ -376,38 +786,141 @@ class GimpDocument(GimpIOBase):
 
     MAGIC_NUMBER=(0,'gimp xcf ')
 
-    def __init__(self,filename: Union[None,str,BinaryIO]=None):
+    __slots__=('dirty','_layers','_layerPtr','_channels','_channelPtr',
+        '_version','_pointerStruct','width','height','baseColorMode','precision','_data',
+        '_encodePool','workers','_index','tileCache','_compositor','filename',
+        '_fileCompression','_decodePool')
+
+    def __init__(self,filename: Union[None,str,BinaryIO]=None,mmap:bool=False,workers:int=1,
+        index:Union[bool,str]=False):
+        """
+        :param filename: optional file to load (see load())
+        :param mmap: memory-map the file rather than reading it all in (see load())
+        :param workers: decompress this many tiles at once (see load())
+        :param index: keep a persistent index of the file (see load())
+        """
         GimpIOBase.__init__(self,self)
         self.dirty:bool=False # a file-changed indicator.  # TODO: Not fully implemented.
-        self._layers:Union[None,List[GimpLayer]]=None
+        self._layers:List[Union[None,GimpLayer]]=[] # None=not decoded yet
         self._layerPtr:Union[None,List[int]]=[]
-        self.channels:List[GimpChannel]=[]
+        self._channels:List[Union[None,GimpChannel]]=[] # None=not decoded yet
         self._channelPtr:Union[None,List[int]]=[]
         self.version:Union[None,float]=None
         self.width:int=0
         self.height:int=0
         self.baseColorMode:int=0
         self.precision:Union[None,Precision]=None # Precision object
-        self._data:Union[None,bytearray]=None
+        self._data:Union[None,memoryview]=None
+        self._encodePool:Union[None,concurrent.futures.Executor]=None # only while saving with workers
+        self._decodePool:Union[None,concurrent.futures.Executor]=None # started when first needed
+        self.workers:int=workers # how many tiles to decompress at once
+        self._index:Union[None,GimpXcfIndex]=None
+        self.tileCache:Union[None,GimpTileCache]=None # set to share decoded tiles (see GimpTileCache)
+        self._compositor:Union[None,GimpCompositor]=None # keeps rendered tiles for self.image
         self.filename:Union[str,None]=None
+        self._fileCompression:int=0 # what the tiles in _data are compressed with
         if filename is not None:
-            self.load(filename)
+            self.load(filename,mmap,workers,index)
 
-    def load(self,filename:Union[str,BinaryIO]):
+    @property
+    def version(self)->Union[None,int]:
+        """
+        the gimp file format version (None=pick the lowest that will do when saving)
+        """
+        return self._version
+    @version.setter
+    def version(self,version:Union[None,int]):
+        self._version=version
+        # every pointer in the file is read/written this way, so work it out once
+        if version is not None and version>=11:
+            self._pointerStruct=_POINTER64
+        else:
+            self._pointerStruct=_POINTER32
+
+    @staticmethod
+    def probe(filename:Union[str,BinaryIO])->GimpDocumentInfo:
+        """
+        quickly get the basic facts about a file without loading it
+
+        Only the header, image properties and layer headers are read,
+        so this is cheap enough to run across huge archives of files.
+
+        :param filename: can be a file name or a seekable file-like object
+        :return: the size, version, precision, color mode,
+            resolution, and layer names
+        """
+        return GimpDocumentInfo(filename)
+
+    def load(self,filename:Union[str,BinaryIO],mmap:bool=False,workers:Union[None,int]=None,
+        index:Union[bool,str]=False):
         """
         load a gimp file
 
         :param filename: can be a file name or a file-like object
+        :param mmap: rather than reading the whole file into memory,
+            map it read-only and have every layer, channel, and tile
+            refer directly into the mapping.  Very large files then
+            open in (nearly) constant memory.
+        :param workers: when a layer's image is decoded, decompress this
+            many tiles at once (zlib tiles on threads, RLE tiles on
+            processes).  Tiles are decoded lazily, so this takes effect
+            the first time each image is asked for.  The workers are
+            shared by every layer and kept until close().
+            (if None, keep the current setting)
+        :param index: for files that are opened over and over, keep an index
+            of where every layer and tile is (see GimpXcfIndex) so that the
+            pointer tables need not be walked again.  True keeps it in a
+            sidecar file next to this one, or give the name of a cache
+            directory to keep it in.  If the file has changed since, the
+            index is rebuilt.
         """
+        if workers is not None:
+            self.workers=workers
+        self._index=None
+        if index:
+            name=filename.name if hasattr(filename,'read') else filename
+            self._index=GimpXcfIndex(name,None if index is True else index)
+            self._index.load()
         if hasattr(filename,'read'):
             self.filename=filename.name
-            data=filename.read()
+            if mmap:
+                data=mmapModule.mmap(filename.fileno(),0,access=mmapModule.ACCESS_READ)
+            else:
+                data=filename.read()
         else:
             self.filename=filename
             f=open(filename,'rb')
-            data=f.read()
+            if mmap:
+                data=mmapModule.mmap(f.fileno(),0,access=mmapModule.ACCESS_READ)
+            else:
+                data=f.read()
             f.close()
         self._decode_(data)
+        if self._index is not None and not self._index.isValid:
+            self._buildIndex()
+            self._index.save()
+
+    def _buildIndex(self)->None:
+        """
+        record where all the layers, channels and tiles are
+        """
+        index=self._index
+        index.layerPtrs=list(self._layerPtr)
+        index.channelPtrs=list(self._channelPtr)
+        index.layers=[]
+        for layerIndex in range(len(self._layers)):
+            layer=self.getLayer(layerIndex)
+            hierarchy=layer.imageHierarchy
+            index.layers.append({
+                'name':layer.name,
+                'hierarchy':None if hierarchy is None else hierarchy.toIndex(index)})
+        index.channels=[]
+        for channelIndex in range(len(self._channels)):
+            channel=self.getChannel(channelIndex)
+            hierarchy=channel.imageHierarchy
+            index.channels.append({
+                'name':channel.name,
+                'hierarchy':None if hierarchy is None else hierarchy.toIndex(index)})
 
     def _decode_(self,data:bytes,index:int=0):
         """
@@ -416,7 +929,9 @@ class GimpDocument(GimpIOBase):
         :param data: data buffer to decode
         :param index: index within the buffer to start at
         """
-        io=IO(data,index)
+        # everything below slices from this one view rather than copying the data
+        io=IO(memoryview(data),index)
+        self._data=io.data
         if io.getBytes(9)!="gimp xcf ".encode('ascii'):
             raise Exception('Not a valid GIMP file')
         version=io.cString
@@ -430,52 +945,176 @@ class GimpDocument(GimpIOBase):
         self.precision=Precision()
         self.precision.decode(self.version,io)
         self._propertiesDecode_(io)
+        # tiles are decoded lazily, so remember this in case compression is changed before then
+        self._fileCompression=self.compression or 0
+        self.close() # a different compression may need a different kind of pool
+        if self._index is not None and self._index.isValid:
+            # the index already knows where everything is
+            self._layerPtr=list(self._index.layerPtrs)
+            self._layers=[None]*len(self._layerPtr)
+            self._channelPtr=list(self._index.channelPtrs)
+            self._channels=[None]*len(self._channelPtr)
+            return io.index
+        # only read the pointer tables here, the layers and channels
+        # themselves are decoded the first time they are asked for
         self._layerPtr=[]
-        self._layers=[]
         while True:
             ptr=self._pointerDecode_(io)
             if ptr==0:
                 break
             self._layerPtr.append(ptr)
-            l=GimpLayer(self)
-            l._decode_(io.data,ptr)
-            self._layers.append(l)
+        self._layers=[None]*len(self._layerPtr)
         self._channelPtr=[]
-        self.channels=[]
         while True:
             ptr=self._pointerDecode_(io)
             if ptr==0:
                 break
             self._channelPtr.append(ptr)
-            c=GimpChannel(self)
-            c.fromBytes(io.data,ptr)
-            self.channels.append(c)
+        self._channels=[None]*len(self._channelPtr)
         return io.index
 
-    def toBytes(self)->bytes:
+    def _decodeExecutor(self)->Union[None,concurrent.futures.Executor]:
+        """
+        the pool that tiles are decompressed on (see load())
+
+        It is started the first time any layer, mask or channel needs it
+        and then shared by all of them, so that worker processes are
+        not started over and over.
+
+        :return: the pool, or None to decode one tile at a time
+        """
+        if self.workers<=1 or self._fileCompression==0:
+            return None
+        if self._decodePool is None:
+            if self._fileCompression==1: # RLE is pure python, so needs processes
+                self._decodePool=concurrent.futures.ProcessPoolExecutor(self.workers)
+            else: # zlib releases the GIL, so threads will do
+                self._decodePool=concurrent.futures.ThreadPoolExecutor(self.workers)
+        return self._decodePool
+
+    def close(self)->None:
+        """
+        stop the workers that decompress tiles, if any were started
+
+        (the document can still be used, they will be started again if needed)
+        """
+        pool=self._decodePool
+        if pool is not None:
+            self._decodePool=None
+            pool.shutdown()
+
+    @contextlib.contextmanager
+    def _parallelEncoding(self,workers:int=1):
+        """
+        compress tiles in parallel for as long as this context is open
+
+        zlib releases the GIL, so threads are enough.  The RLE encoder is
+        pure python, so that needs separate processes.
+
+        :param workers: how many tiles to compress at once (1=no pool)
+        """
+        if workers<=1 or self._encodePool is not None:
+            yield
+            return
+        if self.compression==1: # RLE
+            pool=concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            pool=concurrent.futures.ThreadPoolExecutor(workers)
+        self._encodePool=pool
+        try:
+            yield
+        finally:
+            self._encodePool=None
+            pool.shutdown()
+
+    def toBytes(self,workers:int=1)->bytes:
+        """
+        encode to a byte array
+
+        :param workers: compress this many tiles in parallel
+        """
+        with self._parallelEncoding(workers):
+            return self._toBytes()
+    def _toBytes(self)->bytes:
         """
         encode to a byte array
         """
         io=IO()
+        io.addBytes(self._headerToBytes())
+        layers=self.layers
+        channels=self.channels
+        # two pointer tables, each with a terminating 0
+        pointerSize=self._POINTER_SIZE_//8
+        dataAreaIdx=io.index+pointerSize*(len(layers)+len(channels)+2)
+        dataAreaIo=IO()
+        for layer in layers:
+            io.addBytes(self._pointerEncode_(dataAreaIdx+dataAreaIo.index))
+            dataAreaIo.addBytes(layer.toBytes(dataAreaIdx+dataAreaIo.index))
+        io.addBytes(self._pointerEncode_(0))
+        for channel in channels:
+            io.addBytes(self._pointerEncode_(dataAreaIdx+dataAreaIo.index))
+            dataAreaIo.addBytes(channel.toBytes(dataAreaIdx+dataAreaIo.index))
+        io.addBytes(self._pointerEncode_(0))
+        io.addBytes(dataAreaIo.data)
+        return io.data
+
+    def _headerToBytes(self)->bytearray:
+        """
+        encode everything that comes before the layer and channel pointer tables
+        """
+        if self.precision is None:
+            self.precision=Precision()
+        if self.version is None:
+            self.version=self.precision.requiredGimpVersion()
+        io=IO()
         io.addBytes("gimp xcf ")
-        io.addBytes(str(self.version)+'\0')
+        if self.version==0:
+            io.addBytes('file\0')
+        else:
+            io.addBytes('v%03d\0'%self.version)
         io.u32=self.width
         io.u32=self.height
         io.u32=self.baseColorMode
-        if self.precision is None:
-            self.precision=Precision()
         self.precision.encode(self.version,io)
         io.addBytes(self._propertiesEncode_())
-        dataAreaIdx=io.index+self._POINTER_SIZE_*(len(self.layers)+len(self.channels))
-        dataAreaIo=IO()
-        for layer in self.layers:
-            io.pointer=dataAreaIdx+dataAreaIo.index
-            dataAreaIo.addBytes(layer.toBytes())
-        for channel in self.channels:
-            io.pointer=dataAreaIdx+dataAreaIo.index
-            dataAreaIo.addBytes(channel.toBytes())
         return io.data
 
+    def toFile(self,f:BinaryIO,workers:int=1)->None:
+        """
+        stream the document out to a file
+
+        Unlike toBytes(), nothing is built up in memory.  The header and
+        pointer tables are written with placeholder pointers, then every
+        tile is compressed and written straight to the file, and finally
+        the pointers are patched in.  Peak memory is about one tile
+        plus the document metadata (as long as the layers have not
+        already been decoded into whole images).
+
+        :param f: a seekable file opened for binary writing
+        :param workers: compress this many tiles in parallel
+        """
+        with self._parallelEncoding(workers):
+            self._toFile(f)
+    def _toFile(self,f:BinaryIO)->None:
+        """
+        stream the document out to a file
+        """
+        fileStart=f.tell()
+        f.write(self._headerToBytes())
+        numLayers=len(self._layers)
+        numChannels=len(self._channels)
+        tableIndex=f.tell()
+        f.write(self._pointersEncode_([0]*(numLayers+numChannels+2)))
+        layerPtrs=[]
+        for index in range(numLayers):
+            layerPtrs.append(f.tell()-fileStart)
+            self.getLayer(index).toFile(f,fileStart)
+        channelPtrs=[]
+        for index in range(numChannels):
+            channelPtrs.append(f.tell()-fileStart)
+            self.getChannel(index).toFile(f,fileStart)
+        self._pointersPatch_(f,tableIndex,layerPtrs+[0]+channelPtrs+[0])
+
     def _forceFullyLoaded(self)->None:
         """
         make sure everything is fully loaded from the file
@@ -494,36 +1133,76 @@ class GimpDocument(GimpIOBase):
         """
         Decode the image's layers if necessary
 
-        TODO: need to do the same thing with self.Channels
-        """
-        if self._layers is None:
-            self._layers=[]
-            for ptr in self._layerPtr:
-                l=GimpLayer(self)
-                l.fromBytes(self._data,ptr)
-                self._layers.append(l)
-            # add a reference back to this object so it doesn't go away while array is in use
-            self._layers[-1].parent=self
-            # override some internal methods so we can do more with them
-            self._layers._actualDelitem_=self._layers.__delitem__
-            self._layers.__delitem__=self.deleteLayer
-            self._layers._actualSetitem_=self._layers.__delitem__
-            self._layers.__setitem__=self.setLayer
+        NOTE: this decodes every layer.  If you only need a few,
+            getLayer() and len() are much cheaper.
+        """
+        for index,layer in enumerate(self._layers):
+            if layer is None:
+                self.getLayer(index)
         return self._layers
 
+    @property
+    def channels(self)->List[GimpChannel]:
+        """
+        Decode the image's channels if necessary
+        """
+        for index,channel in enumerate(self._channels):
+            if channel is None:
+                self.getChannel(index)
+        return self._channels
+
     def getLayer(self,index:int)->GimpLayer:
         """
         return a given layer
+
+        Only this layer is decoded (if it was not already)
         """
-        return self.layers[index]
+        layer=self._layers[index]
+        if layer is None:
+            layer=GimpLayer(self)
+            layer.fromBytes(self._data,self._layerPtr[index])
+            self._fromIndex(layer,self._index.layers[index] if self._isIndexed else None)
+            self._layers[index]=layer
+        return layer
+    @property
+    def _isIndexed(self)->bool:
+        """
+        is there an up to date index for what is loaded
+        """
+        return self._index is not None and self._index.isValid and self._layerPtr is not None
+
+    def _fromIndex(self,item:Union[GimpLayer,GimpChannel],entry:Union[None,dict])->None:
+        """
+        set up the image hierarchy of a layer or channel from
+        the index, so none of its pointer tables need to be read
+        """
+        if entry is None or entry['hierarchy'] is None:
+            return
+        hierarchy=GimpImageHierarchy(item)
+        hierarchy.fromIndex(self._index,entry['hierarchy'],self._data)
+        item._imageHierarchy=hierarchy
+
     def setLayer(self,index:int,layer:GimpLayer)->None:
         """
         assign to a given layer
         """
         self._forceFullyLoaded()
         self.dirty=True
-        self._layerPtr=None # no longer try to use the pointers to get data
-        self.layers[index]._actualSetitem(index,layer)
+        self.layers[index]=layer
+
+    def getChannel(self,index:int)->GimpChannel:
+        """
+        return a given channel
+
+        Only this channel is decoded (if it was not already)
+        """
+        channel=self._channels[index]
+        if channel is None:
+            channel=GimpChannel(self)
+            channel.fromBytes(self._data,self._channelPtr[index])
+            self._fromIndex(channel,self._index.channels[index] if self._isIndexed else None)
+            self._channels[index]=channel
+        return channel
 
     def newLayer(self,name:str,image:'PIL.Image',index:int=-1)->GimpLayer:
         """
@@ -580,15 +1259,18 @@ class GimpDocument(GimpIOBase):
         """
         delete a layer
         """
-        self.__delitem__(index)
+        self.dirty=True
+        del self.layers[index]
 
     # make this class act like this class is an array of layers
     def __len__(self):
-        return len(self.layers)
+        return len(self._layers)
     def __getitem__(self,index):
-        return self.layers[index]
+        if isinstance(index,slice):
+            return self.layers[index]
+        return self.getLayer(index)
     def __setitem__(self,index,layer):
-        self.setLayer(layer,index)
+        self.setLayer(index,layer)
     def __delitem__(self,index):
         self.deleteLayer(index)
     def __inc__(self,amt):
@@ -599,10 +1281,49 @@ class GimpDocument(GimpIOBase):
     def image(self)->'PIL.Image':
         """
         get a final, compiled image
+
+        The rendered tiles are kept, so after changing a layer, only
+        the parts of the image it affects are rendered again
+        (see GimpLayer.markDirty())
+        """
+        if self._compositor is None:
+            self._compositor=GimpCompositor(self)
+        pixels=self._compositor.render()
+        return PIL.Image.fromarray(pixels,'LA' if pixels.shape[-1]==2 else 'RGBA')
+
+    def thumbnail(self,maxSize:int=256)->'PIL.Image':
         """
-        # TODO: use the compositor directly.
-        # for now, convert to a smartimage and render that
-        return self._convertToSmartimage().image
+        get a small preview of the image, as quickly as possible
+
+        If one of the document parasites carries a thumbnail (exif or xmp)
+        that is big enough, that is used.  Otherwise the layers are
+        flattened at a fraction of their size, averaging each tile down
+        as it is decoded, so full size layers are never in memory.
+
+        :param maxSize: the largest the width or height can be
+        :return: image no bigger than maxSize x maxSize, keeping the aspect ratio
+        """
+        width,height=self.width,self.height
+        for parasite in self.parasites:
+            if parasite.name not in THUMBNAIL_PARASITES:
+                continue
+            data=parasite.thumbnailData
+            if data is None:
+                continue
+            try:
+                image=PIL.Image.open(BytesIO(data))
+                image.load()
+            except (OSError,SyntaxError): # not an image PIL can read
+                continue
+            if max(image.size)>=min(maxSize,max(width,height)):
+                image.thumbnail((maxSize,maxSize),PIL.Image.LANCZOS)
+                return image
+        reduction=1
+        while reduction<64 and max(width,height)>=maxSize*reduction*2:
+            reduction*=2
+        image=GimpCompositor(self,reduction=reduction).image
+        image.thumbnail((maxSize,maxSize),PIL.Image.LANCZOS)
+        return image
 
     def _convertToSmartimage(self):
         """
@@ -619,7 +1340,7 @@ class GimpDocument(GimpIOBase):
             layer._addToSmartimage(si)
         return si
 
-    def save(self,toFilename=None,toExtension=None):
+    def save(self,toFilename=None,toExtension=None,stream:bool=False,workers:int=1):
         """
         save this gimp image to a file
 
@@ -627,8 +1348,15 @@ class GimpDocument(GimpIOBase):
             (if None, save out to the currently loaded filename)
         :param toExtension: save to a certain format
             (if None, attempt to derive the format from the filename)
+        :param stream: for xcf files, write tiles directly to the file
+            one at a time rather than encoding the whole document in memory
+            first (see toFile()).  For png files, flatten the image
+            a tile at a time straight into the file (see GimpCompositor.save())
+        :param workers: for xcf files, compress this many tiles in parallel.
+            The tiles still end up in the file in the same order.
         """
-        self._forceFullyLoaded()
+        if not stream:
+            self._forceFullyLoaded()
         if toFilename is None:
             toFilename=self.filename
         if toExtension is None:
@@ -648,10 +1376,22 @@ class GimpDocument(GimpIOBase):
             toFilename='Untitled.'+toExtension
         # by this point we always have a filename and an extension without a '.'
         if toExtension=='xcf': # gimp xcf format
+            if stream and toFilename==self.filename and isinstance(self._data,memoryview) \
+                and isinstance(self._data.obj,mmapModule.mmap):
+                # we can't read tiles from the memory-mapped file while overwriting it
+                self._forceFullyLoaded()
             self.filename=toFilename
-            if not hasattr(toFilename,'write'):
-                f=open(toFilename,'wb')
-            f.write(self.toBytes())
+            if hasattr(toFilename,'write'):
+                if stream:
+                    self.toFile(toFilename,workers)
+                else:
+                    toFilename.write(self.toBytes(workers))
+            else:
+                with open(toFilename,'wb') as f:
+                    if stream:
+                        self.toFile(f,workers)
+                    else:
+                        f.write(self.toBytes(workers))
             self.dirty=False
         elif toExtension in ('simg','simt'): # smartimage
             simg=self._convertToSmartimage()
@@ -663,6 +1403,8 @@ class GimpDocument(GimpIOBase):
             pat.save(toFilename)
         elif toExtension=='psd': # photoshop
             raise NotImplementedError('don\'t you wish this worked!??')
+        elif toExtension=='png' and stream:
+            GimpCompositor(self).save(toFilename)
         else: # assume it's a PIL-compatible format
             self.image.save(toFilename)
 
@@ -678,11 +1420,11 @@ class GimpDocument(GimpIOBase):
         ret.append('Base Color Mode: '+self.COLOR_MODES[self.baseColorMode])
         ret.append('Precision: '+str(self.precision))
         ret.append(GimpIOBase.__repr__(self))
-        if self._layerPtr:
+        if self._layers:
             ret.append('Layers: ')
             for l in self.layers:
                 ret.append(l.__repr__('\t'))
-        if self._channelPtr:
+        if self._channels:
             ret.append('Channels: ')
             for ch in self.channels:
                 ret.append(ch.__repr__('\t'))
@@ -0,0 +1,164 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+"""
+A persistent index of where everything lives inside an xcf file.
+
+Reopening a file with an up-to-date index skips walking the
+pointer tables, so any tile of any layer can be reached directly.
+"""
+from typing import Union, List, Dict, Any
+import os
+import sys
+import json
+import array
+import hashlib
+
+
+class GimpXcfIndex:
+    """
+    Layer offsets, hierarchy offsets, tile pointer tables and layer
+    names of an xcf file, saved either alongside the file (a sidecar)
+    or in a cache directory.
+
+    The index is keyed by the file's path, modification time and size,
+    so if the file changes the index is simply ignored and rebuilt.
+    """
+
+    FORMAT_VERSION=1
+    SIDECAR_EXTENSION='.index.json'
+
+    def __init__(self,filename:str,cacheDir:Union[None,str]=None):
+        """
+        :param filename: the xcf file this is an index of
+        :param cacheDir: directory to keep the index in
+            (if None, it is a sidecar file next to the xcf)
+        """
+        self.filename:str=os.path.abspath(filename)
+        self.cacheDir:Union[None,str]=cacheDir
+        self.layerPtrs:List[int]=[]
+        self.channelPtrs:List[int]=[]
+        self.layers:List[Dict[str,Any]]=[] # {'name':str,'hierarchy':see GimpImageHierarchy.toIndex()}
+        self.channels:List[Dict[str,Any]]=[]
+        self.isValid:bool=False # does this match the current file?
+        self._tables:bytearray=bytearray() # pointer tables waiting to be saved
+
+    def addTable(self,ptrs:List[int])->List[int]:
+        """
+        add a pointer table to the index
+
+        Tile tables can be huge, so rather than go into the json, they
+        are kept in a binary file alongside it (as little endian 64-bit
+        values) and only read back when a particular table is needed.
+
+        :return: [offset,count] reference to pass to getTable()
+        """
+        table=array.array('Q',ptrs)
+        if sys.byteorder!='little':
+            table.byteswap()
+        ref=[len(self._tables),len(table)]
+        self._tables.extend(table.tobytes())
+        return ref
+
+    def getTable(self,ref:List[int])->'array.array':
+        """
+        read back a pointer table that was stored with addTable()
+        """
+        offset,count=ref
+        table=array.array('Q')
+        if self._tables:
+            table.frombytes(self._tables[offset:offset+count*8])
+        else:
+            with open(self.tablesFilename,'rb') as f:
+                f.seek(offset)
+                table.frombytes(f.read(count*8))
+        if sys.byteorder!='little':
+            table.byteswap()
+        return table
+
+    @property
+    def indexFilename(self)->str:
+        """
+        where the index is stored
+        """
+        if self.cacheDir is None:
+            return self.filename+self.SIDECAR_EXTENSION
+        name=hashlib.sha1(self.filename.encode('utf-8')).hexdigest()
+        return os.path.join(self.cacheDir,name+'.json')
+
+    @property
+    def tablesFilename(self)->str:
+        """
+        where the pointer tables are stored (see addTable())
+        """
+        return self.indexFilename.rsplit('.',1)[0]+'.tables'
+
+    @property
+    def key(self)->Dict[str,Any]:
+        """
+        identifies the exact version of the file this index is for
+        """
+        stat=os.stat(self.filename)
+        return {
+            'format':self.FORMAT_VERSION,
+            'path':self.filename,
+            'mtime':stat.st_mtime_ns,
+            'size':stat.st_size}
+
+    @property
+    def layerNames(self)->List[str]:
+        """
+        names of all the layers
+        """
+        return [layer['name'] for layer in self.layers]
+
+    def load(self)->bool:
+        """
+        load the index
+
+        :return: whether there was an index and it is still up to date
+        """
+        self.isValid=False
+        try:
+            with open(self.indexFilename,'r',encoding='utf-8') as f:
+                data=json.load(f)
+        except (OSError,ValueError):
+            return False
+        if data.get('key')!=self.key:
+            return False
+        self.layerPtrs=data['layerPtrs']
+        self.channelPtrs=data['channelPtrs']
+        self.layers=data['layers']
+        self.channels=data['channels']
+        self.isValid=True
+        return True
+
+    def save(self)->None:
+        """
+        save the index
+        """
+        data={
+            'key':self.key,
+            'layerPtrs':self.layerPtrs,
+            'channelPtrs':self.channelPtrs,
+            'layers':self.layers,
+            'channels':self.channels}
+        if self.cacheDir is not None:
+            os.makedirs(self.cacheDir,exist_ok=True)
+        # tables first, so a half-written index is never mistaken for a good one
+        with open(self.tablesFilename,'wb') as f:
+            f.write(self._tables)
+        with open(self.indexFilename,'w',encoding='utf-8') as f:
+            json.dump(data,f)
+        self._tables=bytearray()
+        self.isValid=True
+
+    def __repr__(self,indent:str='')->str:
+        """
+        Get a textual representation of this object
+        """
+        ret=[]
+        ret.append('File: '+self.filename)
+        ret.append('Index: '+self.indexFilename)
+        ret.append('Valid: '+str(self.isValid))
+        ret.append('Layers: '+', '.join(self.layerNames))
+        return indent+(('\n'+indent).join(ret))
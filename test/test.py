@@ -39,6 +39,7 @@ TESTS=[
     'twoLayers',
     'layerGroups',
     'withPaths',
+    'xcfInternals',
 ]
 
 
@@ -0,0 +1,1196 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+"""
+Run unit tests
+
+These cover the low-level xcf machinery (tile codecs, binary i/o).
+
+The benchmarks (which print rough timings) are skipped unless
+the GIMPFORMATS_BENCHMARKS environment variable is set.
+
+See:
+    http://pyunit.sourceforge.net/pyunit.html
+"""
+import unittest
+import os
+from io import BytesIO
+import time
+import struct
+from gimpFormats import *
+from gimpFormats.binaryIO import IO, GimpIOException
+
+
+__HERE__=os.path.abspath(__file__).rsplit(os.sep,1)[0]+os.sep
+
+
+def sampleFile(folder:str,filename:str)->str:
+    """
+    the full path of a sample file from one of the other test folders
+
+    :param folder: the test folder it is in, eg 'twoLayers'
+    :param filename: eg 'two_layers.xcf'
+    """
+    return __HERE__+'..'+os.sep+folder+os.sep+filename
+
+
+# timings are too slow and too noisy to run every time
+benchmark=unittest.skipUnless(os.environ.get('GIMPFORMATS_BENCHMARKS'),
+    'set GIMPFORMATS_BENCHMARKS=1 to run the benchmarks')
+
+
+def rleEncodeChannel(chanData):
+    """
+    a simple reference RLE encoder that uses every opcode
+    (short/long runs of identical bytes, short/long runs of different bytes)
+    """
+    ret=bytearray()
+    idx=0
+    while idx<len(chanData):
+        run=1
+        while idx+run<len(chanData) and chanData[idx+run]==chanData[idx]:
+            run+=1
+        if run>1:
+            if run<=127:
+                ret.extend((run-1,chanData[idx]))
+            else:
+                ret.extend((127,run>>8,run&0xff,chanData[idx]))
+        else:
+            while idx+run<len(chanData) and chanData[idx+run]!=chanData[idx+run-1]:
+                run+=1
+            if run<=128:
+                ret.append(256-run)
+            else:
+                ret.extend((128,run>>8,run&0xff))
+            ret.extend(chanData[idx:idx+run])
+        idx+=run
+    return ret
+
+
+def makeTile(width=64,height=64,bpp=4):
+    """
+    create some interleaved pixel data containing both flat areas and noise
+    """
+    pixels=width*height
+    channels=[]
+    for chan in range(bpp):
+        chanData=bytearray()
+        for n in range(pixels):
+            if (n//300)%2==0:
+                chanData.append((chan*40)&0xff) # flat area
+            else:
+                chanData.append((n*7+chan*13+(n*n)%11)&0xff) # noisy area
+        channels.append(chanData)
+    flat=bytearray(pixels*bpp)
+    for chan in range(bpp):
+        flat[chan::bpp]=channels[chan]
+    rle=bytearray()
+    for chanData in channels:
+        rle.extend(rleEncodeChannel(chanData))
+    return flat,rle
+
+
+class Test(unittest.TestCase):
+    """
+    Run unit test
+    """
+
+    def setUp(self):
+        self.dut=GimpImageLevel(None)
+
+    def tearDown(self):
+        pass
+
+    def testRLEDecode(self):
+        for bpp in (1,2,3,4):
+            flat,rle=makeTile(64,37,bpp)
+            actual=self.dut._decodeRLE(rle,64*37,bpp)
+            assert actual==flat
+            # decoding from the middle of a buffer
+            actual=self.dut._decodeRLE(b'junk'+rle,64*37,bpp,4)
+            assert actual==flat
+            # truncated anywhere, even inside a run header, it says so
+            for cut in (0,1,len(rle)//2,len(rle)-2,len(rle)-1):
+                with self.assertRaisesRegex(Exception,'RLE data ended early'):
+                    self.dut._decodeRLE(rle[:cut],64*37,bpp)
+        # a literal run of 10 bytes with only 3 there
+        with self.assertRaisesRegex(Exception,r'channel 0, pixel 0, run at offset 0 of 6 bytes'):
+            self.dut._decodeRLE(bytes([128,0,10,1,2,3]),10,1)
+
+    @benchmark
+    def testRLEDecodeSpeed(self):
+        flat,rle=makeTile()
+        numTiles=200
+        start=time.perf_counter()
+        for _ in range(numTiles):
+            actual=self.dut._decodeRLE(rle,64*64,4)
+        elapsed=time.perf_counter()-start
+        assert actual==flat
+        print('\nRLE decode: %.0f tiles/sec'%(numTiles/elapsed))
+
+    def testGetRegion(self):
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        full=GimpDocument(filename).layers[1].image
+        doc=GimpDocument(filename)
+        for bounds in [(0,0,10,10),(60,60,130,70),(500,400,600,600),(-5,-5,20,20)]:
+            region=doc.layers[1].getRegion(bounds)
+            clipped=(max(bounds[0],0),max(bounds[1],0),
+                min(bounds[2],full.width),min(bounds[3],full.height))
+            assert region.tobytes()==full.crop(clipped).tobytes()
+
+    def testMmapLoad(self):
+        filename=sampleFile('layerGroups','layer_groups.xcf')
+        doc=GimpDocument(filename)
+        mapped=GimpDocument(filename,mmap=True)
+        assert len(mapped.layers)==len(doc.layers)
+        for layer,mappedLayer in zip(doc.layers,mapped.layers):
+            assert mappedLayer.name==layer.name
+            # the layer data must be a view onto the document, not a copy
+            assert mappedLayer.imageHierarchy._data.obj is mapped._data.obj
+            assert mappedLayer.image.tobytes()==layer.image.tobytes()
+
+    def testLazyLayers(self):
+        filename=sampleFile('layerGroups','layer_groups.xcf')
+        doc=GimpDocument(filename)
+        assert len(doc)==3
+        assert doc._layers==[None,None,None] # nothing decoded yet
+        assert doc[1].name=='lips'
+        assert doc._layers[0] is None and doc._layers[2] is None
+        assert doc[-1] is doc.layers[2]
+        assert None not in doc._layers
+
+    def testIOReaders(self):
+        io=IO(b'\xff\xff\xff\xfe\x00\x01\xff\xff\xff\xff\xff\xff\xff\xff')
+        assert io.u32==0xfffffffe # unsigned, not -2
+        assert io.u16==1
+        assert io.u64==0xffffffffffffffff
+        io=IO(b'\xfe\xff\xff\xff',littleEndian=True)
+        assert io.i32==-2
+        io.index=0
+        io.littleEndian=False
+        assert io.i32==-16777217
+        io=IO(b'\x00\x01')
+        self.assertRaisesRegex(GimpIOException,'Err reading 4 bytes, only 2 available',lambda:io.u32)
+        self.assertRaisesRegex(GimpIOException,'Err reading 4 bytes',lambda:io.i32be)
+        self.assertRaises(GimpIOException,lambda:io.float64le)
+        assert io.index==0
+        assert io.u16==1
+        self.assertRaisesRegex(GimpIOException,'only 0 available',lambda:io.u8)
+
+    def testBulkReaders(self):
+        io=IO(b'\x00\x00\x00\x01\xff\xff\xff\xff'+b'\x00'*7+b'\x02'+b'\x01\x02\x03\x04\x05\x06')
+        assert io.u32array(2).tolist()==[1,0xffffffff]
+        assert io.u64array(1).tolist()==[2]
+        assert io.u8triples(2)==[(1,2,3),(4,5,6)]
+        assert io.index==len(io.data)
+        io=IO(b'\x01\x00\x00\x00',littleEndian=True)
+        assert io.u32array(1).tolist()==[1]
+        self.assertRaises(GimpIOException,io.u32array,1)
+
+    @benchmark
+    def testIOReadSpeed(self):
+        numReads=100000
+        io=IO(bytes(range(256))*(numReads*4//256+1))
+        start=time.perf_counter()
+        values=[io.u32 for _ in range(numReads)]
+        elapsed=time.perf_counter()-start
+        print('\nIO.u32: %.0f reads/sec'%(numReads/elapsed))
+        io.index=0
+        start=time.perf_counter()
+        array=io.u32array(numReads)
+        elapsed=time.perf_counter()-start
+        print('IO.u32array: %.0f reads/sec'%(numReads/elapsed))
+        assert array.tolist()==values
+
+    def testIOWrites(self):
+        io=IO()
+        io.u32=1
+        io.addBytes(b'ab')
+        io.index=8 # leaving a gap pads with zeros
+        io.u16=0xffff
+        io.index=4 # overwrite in place
+        io.addBytes('cd')
+        assert io.data==b'\x00\x00\x00\x01cd\x00\x00\xff\xff'
+        io.index=len(io.data)
+        io.sz754='hi'
+        assert io.data[10:]==b'\x00\x00\x00\x03hi\x00'
+
+    def testEncodeRoundTrip(self):
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        original=GimpDocument(filename)
+        images=[layer.image.tobytes() for layer in original.layers]
+        for compression in (0,1,2):
+            # the tiles are still compressed the way the file has them
+            doc=GimpDocument(filename)
+            doc.compression=compression
+            assert [layer.image.tobytes() for layer in doc.layers]==images
+            doc=GimpDocument(filename)
+            doc.compression=compression
+            decoded=GimpDocument()
+            decoded._decode_(doc.toBytes())
+            assert decoded.compression==compression
+            assert [layer.name for layer in decoded.layers]==[layer.name for layer in original.layers]
+            assert [layer.image.tobytes() for layer in decoded.layers]==images
+
+    def testRLEEncode(self):
+        for bpp in (1,3,4):
+            flat,_=makeTile(64,37,bpp)
+            rle=self.dut._encodeRLE(flat,bpp)
+            assert self.dut._decodeRLE(rle,64*37,bpp)==flat
+        # long runs, both identical and different
+        flat=bytes(70000)+bytes(range(256))*300
+        rle=self.dut._encodeRLE(flat,1)
+        assert self.dut._decodeRLE(rle,len(flat),1)==flat
+
+    @benchmark
+    def testEncodeSpeed(self):
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        doc=GimpDocument(filename)
+        image=doc.layers[1].image.crop((0,0,128,128))
+        doc=GimpDocument()
+        doc.width=image.width
+        doc.height=image.height
+        for n in range(100):
+            doc.newLayer('layer %d'%n,image)
+        start=time.perf_counter()
+        data=doc.toBytes()
+        elapsed=time.perf_counter()-start
+        print('\nEncode 100 layers: %.3f sec (%d bytes)'%(elapsed,len(data)))
+        decoded=GimpDocument()
+        decoded._decode_(data)
+        assert len(decoded)==100
+        assert decoded[99].image.tobytes()==image.tobytes()
+
+    def testStreamSave(self):
+        filename=sampleFile('layerGroups','layer_groups.xcf')
+        expected=GimpDocument(filename).toBytes()
+        f=BytesIO()
+        f.write(b'junk') # the xcf does not have to start at the beginning of the file
+        GimpDocument(filename,mmap=True).toFile(f)
+        assert f.getvalue()[4:]==expected
+
+    def testParallelSave(self):
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        for compression in (1,2):
+            doc=GimpDocument(filename)
+            doc.compression=compression
+            expected=doc.toBytes()
+            assert doc.toBytes(workers=2)==expected
+            f=BytesIO()
+            doc.toFile(f,workers=2)
+            assert f.getvalue()==expected
+
+    def testParallelLoad(self):
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        doc=GimpDocument(filename)
+        images=[layer.image.tobytes() for layer in doc.layers]
+        # the sample is RLE, so also try it as zlib
+        doc.compression=2
+        zipped=doc.toBytes()
+        doc=GimpDocument(filename,workers=2)
+        assert [layer.image.tobytes() for layer in doc.layers]==images
+        doc.close()
+        doc=GimpDocument(workers=2)
+        doc._decode_(zipped)
+        pools=set()
+        for layer in doc.layers:
+            assert layer.image.tobytes()==images[doc.layers.index(layer)]
+            pools.add(id(doc._decodePool))
+        assert len(pools)==1 # every layer shares the same workers
+        doc.close()
+        assert doc._decodePool is None
+
+    def testZlibTiles(self):
+        import PIL.Image
+        image=PIL.Image.effect_noise((200,130),100).convert('RGBA') # compresses worse than raw
+        doc=GimpDocument()
+        doc.width=image.width
+        doc.height=image.height
+        doc.compression=2
+        doc.newLayer('noise',image)
+        decoded=GimpDocument()
+        decoded._decode_(doc.toBytes())
+        level=decoded[0].imageHierarchy.levels[0]
+        # a tile's data ends exactly where the next one begins
+        assert len(level._tileData(0))==level._tilePtrs[1]-level._tilePtrs[0]
+        assert decoded[0].image.tobytes()==image.tobytes()
+
+    def testAsArray(self):
+        import numpy as np
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        doc=GimpDocument(filename)
+        for layer in doc.layers:
+            expected=np.asarray(layer.image)
+            actual=GimpDocument(filename)[doc.layers.index(layer)].asArray()
+            assert actual.shape==expected.shape
+            assert (actual==expected).all()
+            assert (layer.asArray()==expected).all() # after it has been decoded
+            region=GimpDocument(filename)[doc.layers.index(layer)].asArray((60,70,200,130))
+            assert (region==expected[70:130,60:200]).all()
+
+    @benchmark
+    def testAsArraySpeed(self):
+        import numpy as np
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        numLoads=10
+        start=time.perf_counter()
+        for _ in range(numLoads):
+            expected=np.asarray(GimpDocument(filename)[1].image)
+        elapsed=time.perf_counter()-start
+        print('\nnp.asarray(layer.image): %.1f layers/sec'%(numLoads/elapsed))
+        start=time.perf_counter()
+        for _ in range(numLoads):
+            actual=GimpDocument(filename)[1].asArray()
+        elapsed=time.perf_counter()-start
+        print('layer.asArray(): %.1f layers/sec'%(numLoads/elapsed))
+        assert (actual==expected).all()
+
+    def testEmptyHierarchy(self):
+        with self.assertWarnsRegex(UserWarning,'no image data'):
+            assert GimpImageHierarchy(None).fromBytes(b'')==0
+
+    def testHighBitDepth(self):
+        import numpy as np
+        for bits,numberFormat,dtype in [(16,int,np.uint16),(32,int,np.uint32),
+            (16,float,np.float16),(32,float,np.float32),(64,float,np.float64)]:
+            if numberFormat is int:
+                pixels=np.arange(70*100*4,dtype=dtype).reshape(70,100,4)*37
+            else:
+                pixels=np.linspace(0.0,1.0,70*100*4,dtype=dtype).reshape(70,100,4)
+            for compression in (0,1,2):
+                doc=GimpDocument()
+                doc.width=100
+                doc.height=70
+                doc.compression=compression
+                doc.version=11
+                doc.precision=Precision()
+                doc.precision.bits=bits
+                doc.precision.numberFormat=numberFormat
+                doc.precision.gamma=False
+                layer=doc.newLayer('deep',None)
+                layer.fromArray(pixels)
+                assert (layer.asArray()==pixels).all()
+                decoded=GimpDocument()
+                decoded._decode_(doc.toBytes())
+                assert decoded.precision.bits==bits and decoded.precision.numberFormat is numberFormat
+                actual=decoded[0].asArray()
+                assert actual.dtype==dtype
+                assert (actual==pixels).all()
+                assert decoded[0].image.mode=='RGBA' # reduced to 8 bits for PIL
+        self.assertRaises(Exception,layer.fromArray,pixels.astype(np.uint8))
+
+    def testPrecisionCodes(self):
+        filename=sampleFile('layerGroups','layer_groups.xcf')
+        doc=GimpDocument(filename)
+        assert str(doc.precision)=='8-bit gamma integer'
+        for version,code,expected in [(7,100,'8-bit linear integer'),(11,750,'64-bit gamma float'),
+            (7,550,'16-bit gamma float'),(5,500,'32-bit linear float'),(4,3,'16-bit linear float')]:
+            precision=Precision()
+            precision.decode(version,IO(code.to_bytes(4,'big')))
+            assert str(precision)==expected
+            io=IO()
+            precision.encode(version,io)
+            assert bytes(io.data)==code.to_bytes(4,'big')
+
+    def testProbe(self):
+        for filename in [sampleFile('layerGroups','layer_groups.xcf'),sampleFile('twoLayers','two_layers.xcf')]:
+            doc=GimpDocument(filename)
+            info=GimpDocument.probe(filename)
+            assert (info.width,info.height,info.version)==(doc.width,doc.height,doc.version)
+            assert info.baseColorMode==doc.baseColorMode
+            assert str(info.precision)==str(doc.precision)
+            assert info.horizontalResolution==doc.horizontalResolution
+            assert info.layerNames==[layer.name for layer in doc.layers]
+            assert info.numLayers==len(doc)
+            with open(filename,'rb') as f:
+                assert GimpDocument.probe(f).layerNames==info.layerNames
+
+    def testIndex(self):
+        import tempfile
+        import shutil
+        tempDir=tempfile.mkdtemp()
+        try:
+            filename=os.path.join(tempDir,'layer_groups.xcf')
+            shutil.copyfile(sampleFile('layerGroups','layer_groups.xcf'),filename)
+            expected=[layer.image.tobytes() for layer in GimpDocument(filename).layers]
+            cacheDir=os.path.join(tempDir,'cache')
+            for index in (True,cacheDir):
+                doc=GimpDocument(filename,index=index) # builds the index
+                assert doc._index.isValid
+                assert doc._index.layerNames==[layer.name for layer in doc.layers]
+                doc=GimpDocument(filename,mmap=True,index=index) # uses the index
+                assert doc._isIndexed
+                assert doc[2]._imageHierarchy is not None # came from the index, not the file
+                assert [layer.image.tobytes() for layer in doc.layers]==expected
+                assert doc[1].getRegion((0,0,5,5)).size==(5,5)
+            assert os.path.exists(filename+GimpXcfIndex.SIDECAR_EXTENSION)
+            # once the file changes, the index no longer applies
+            GimpDocument(filename).save(filename)
+            index=GimpXcfIndex(filename)
+            assert not index.load()
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testTileCache(self):
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        expected=GimpDocument(filename)[1].getRegion((100,100,300,200))
+        cache=GimpTileCache()
+        doc=GimpDocument(filename)
+        doc.tileCache=cache
+        other=GimpDocument(filename)
+        other.tileCache=cache
+        assert doc[1].getRegion((100,100,300,200)).tobytes()==expected.tobytes()
+        misses=cache.misses
+        assert misses==12 and cache.hits==0 # 4x3 tiles
+        assert doc[1].getRegion((100,100,300,200)).tobytes()==expected.tobytes()
+        assert cache.hits==12 and cache.misses==misses
+        other[1].getRegion((100,100,300,200)) # different document, so different tiles
+        assert cache.misses==misses*2
+        # shrinking the budget evicts the oldest tiles
+        cache.maxBytes=64*64*4*3
+        cache.put(('new',),bytes(64*64*4))
+        assert len(cache)==3 and cache.numBytes<=cache.maxBytes
+        assert cache.stats['evictions']==22
+        # decoding on workers uses and fills the cache too
+        cache=GimpTileCache()
+        doc=GimpDocument(filename,workers=2)
+        doc.tileCache=cache
+        doc[1].getRegion((100,100,300,200))
+        numTiles=doc[1].imageHierarchy.levels[0].numTiles
+        assert doc[1].image.tobytes()==GimpDocument(filename)[1].image.tobytes()
+        doc.close()
+        assert cache.hits==12 and cache.misses==numTiles
+        assert len(cache)==numTiles
+
+    @benchmark
+    def testTileCacheSpeed(self):
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        numReads=20
+        regions=[]
+        for cache in (None,GimpTileCache()):
+            doc=GimpDocument(filename)
+            doc.tileCache=cache
+            start=time.perf_counter()
+            for _ in range(numReads):
+                region=doc[1].getRegion((100,100,300,300))
+            elapsed=time.perf_counter()-start
+            print('\ngetRegion with%s cache: %.1f reads/sec'%('' if cache else 'out',numReads/elapsed))
+            regions.append(region.tobytes())
+        assert regions[0]==regions[1]
+        assert cache.hits==(numReads-1)*cache.misses
+
+    def testCompositor(self):
+        import numpy as np
+        import PIL.Image
+        doc=GimpDocument(sampleFile('layerGroups','layer_groups.xcf'))
+        expected=np.asarray(PIL.Image.open(sampleFile('layerGroups','layer_groups.png')).convert('RGBA'))
+        actual=np.asarray(doc.image)
+        assert actual.shape==expected.shape
+        assert np.abs(actual.astype(int)-expected).max()<=1
+
+    def _compositeTwo(self,blendMode,bottom,top,opacity=1.0):
+        """
+        composite one pixel over another, returning the 8-bit result
+        """
+        import PIL.Image
+        doc=GimpDocument()
+        doc.width=1
+        doc.height=1
+        for name,color in (('top',top),('bottom',bottom)):
+            layer=GimpLayer(doc,name,PIL.Image.new('RGBA',(1,1),color))
+            doc.layers.append(layer)
+        doc.layers[0].blendMode=blendMode
+        doc.layers[0].opacity=opacity
+        return tuple(int(v) for v in GimpCompositor(doc).asArray()[0,0])
+
+    def _assertPixel(self,actual,expected):
+        """
+        compare 8-bit pixels, allowing for rounding
+        """
+        assert max(abs(a-e) for a,e in zip(actual,expected))<=1,(actual,expected)
+
+    def testBlendModes(self):
+        import numpy as np
+        import PIL.Image
+        BLEND_MODES=GimpIOBase.BLEND_MODES
+        # legacy modes work on the srgb values directly
+        self._assertPixel(self._compositeTwo(BLEND_MODES.index('Multiply (legacy)'),(200,100,50,255),(128,255,0,255)),(100,100,0,255))
+        self._assertPixel(self._compositeTwo(BLEND_MODES.index('Screen (legacy)'),(0,255,128,255),(255,0,0,255)),(255,255,128,255))
+        self._assertPixel(self._compositeTwo(BLEND_MODES.index('Addition (legacy)'),(200,10,0,255),(100,10,0,255)),(255,20,0,255))
+        # the newer ones, mostly in linear light
+        self._assertPixel(self._compositeTwo(BLEND_MODES.index('Multiply'),(255,128,0,255),(128,128,128,255)),(128,61,0,255))
+        self._assertPixel(self._compositeTwo(BLEND_MODES.index('Normal'),(255,0,0,255),(0,0,255,255),0.5),(188,0,188,255))
+        self._assertPixel(self._compositeTwo(BLEND_MODES.index('Normal (legacy)'),(255,0,0,255),(0,0,255,255),0.5),(128,0,128,255))
+        assert self._compositeTwo(BLEND_MODES.index('Erase'),(255,0,0,255),(0,0,0,255))[3]==0
+        self._assertPixel(self._compositeTwo(BLEND_MODES.index('Behind'),(255,0,0,255),(0,0,255,255)),(255,0,0,255))
+        # clip to backdrop, so nothing shows over transparency
+        assert self._compositeTwo(BLEND_MODES.index('Screen'),(0,0,0,0),(255,255,255,255))[3]==0
+        # and all of them at least run
+        doc=GimpDocument()
+        doc.width=64
+        doc.height=64
+        rng=np.random.default_rng(0)
+        for _ in range(2):
+            pixels=rng.integers(0,256,(64,64,4),dtype=np.uint8)
+            doc.layers.append(GimpLayer(doc,'',PIL.Image.fromarray(pixels,'RGBA')))
+        for blendMode in range(len(BLEND_MODES)):
+            doc.layers[0].blendMode=blendMode
+            color,alpha=GimpCompositor(doc).composite()
+            assert np.isfinite(color).all(),BLEND_MODES[blendMode]
+            assert alpha.min()>=0.0 and alpha.max()<=1.0,BLEND_MODES[blendMode]
+
+    @benchmark
+    def testCompositorSpeed(self):
+        import numpy as np
+        import PIL.Image
+        doc=GimpDocument()
+        doc.width=1024
+        doc.height=768
+        rng=np.random.default_rng(0)
+        for i in range(50):
+            pixels=rng.integers(0,256,(300,400,4),dtype=np.uint8)
+            layer=GimpLayer(doc,'layer %d'%i,PIL.Image.fromarray(pixels,'RGBA'))
+            layer.xOffset=int(rng.integers(0,624))
+            layer.yOffset=int(rng.integers(0,468))
+            layer.blendMode=(28,30,31,23,46)[i%5] # normal,multiply,screen,overlay,grain extract
+            doc.layers.append(layer)
+        start=time.perf_counter()
+        image=doc.image
+        elapsed=time.perf_counter()-start
+        assert image.size==(1024,768)
+        print('\nflatten 50 layers (1024x768): %.2f sec'%elapsed)
+
+    def testTiledCompositor(self):
+        import numpy as np
+        import PIL.Image
+        filename=sampleFile('layerGroups','layer_groups.xcf')
+        expected=GimpCompositor(GimpDocument(filename)).asArray()
+        for tileSize in (64,100):
+            compositor=GimpCompositor(GimpDocument(filename),tileSize)
+            actual=np.zeros_like(expected)
+            for (x0,y0,x1,y1),pixels in compositor.tiles():
+                assert pixels.shape[:2]==(y1-y0,x1-x0)
+                actual[y0:y1,x0:x1]=pixels
+            assert (actual==expected).all()
+        # offset layers that do not line up with the tiles, in every mode
+        doc=GimpDocument()
+        doc.width=200
+        doc.height=150
+        rng=np.random.default_rng(0)
+        for blendMode in range(len(GimpIOBase.BLEND_MODES)):
+            pixels=rng.integers(0,256,(int(rng.integers(10,100)),int(rng.integers(10,100)),4),dtype=np.uint8)
+            layer=GimpLayer(doc,'',PIL.Image.fromarray(pixels,'RGBA'))
+            layer.xOffset=int(rng.integers(-40,180))
+            layer.yOffset=int(rng.integers(-40,130))
+            layer.blendMode=blendMode
+            doc.layers.append(layer)
+        compositor=GimpCompositor(doc,37)
+        expected=compositor.asArray()
+        actual=np.zeros_like(expected)
+        for (x0,y0,x1,y1),pixels in compositor.tiles():
+            actual[y0:y1,x0:x1]=pixels
+        assert (actual==expected).all()
+        # streaming out to png
+        f=BytesIO()
+        compositor.save(f)
+        f.seek(0)
+        assert (np.asarray(PIL.Image.open(f))==expected).all()
+
+    def testDirtyRegions(self):
+        import numpy as np
+        import PIL.Image
+        doc=GimpDocument()
+        doc.width=300
+        doc.height=200
+        rng=np.random.default_rng(0)
+        for i in range(6):
+            pixels=rng.integers(0,256,(80,100,4),dtype=np.uint8)
+            layer=GimpLayer(doc,'layer %d'%i,PIL.Image.fromarray(pixels,'RGBA'))
+            layer.xOffset=i*40
+            layer.yOffset=i*20
+            layer.blendMode=(28,30,31)[i%3]
+            doc.layers.append(layer)
+        _=doc.image
+        compositor=doc._compositor
+        untouched=compositor._renderedTiles[(0,128)]
+        # changes are noted on the layer
+        doc.layers[1].opacity=0.5
+        assert doc.layers[1]._dirtyRects==[(40,20,140,100)]
+        doc.layers[1].xOffset=50 # both where it was and where it is now
+        assert doc.layers[1]._dirtyRects==[(40,20,140,100),(40,20,140,100),(50,20,150,100)]
+        for change in range(4):
+            if change==0:
+                doc.layers[1].visible=False
+            elif change==1:
+                doc.layers[1].visible=True
+                doc.layers[4].blendMode=44 # hard light
+            elif change==2:
+                doc.layers[3].image=PIL.Image.new('RGBA',(30,30),(255,0,0,128))
+            else:
+                doc.layers.append(GimpLayer(doc,'new',PIL.Image.new('RGBA',(300,200),(0,0,255,40))))
+            actual=np.asarray(doc.image)
+            assert (actual==GimpCompositor(doc).asArray()).all()
+            if change<3:
+                # tiles nothing touched are not rendered again
+                assert compositor._renderedTiles[(0,128)] is untouched
+            assert not any(layer._dirtyRects for layer in doc.layers)
+
+    def testDirtyRenderSettings(self):
+        import numpy as np
+        import PIL.Image
+        doc=GimpDocument(sampleFile('xcfWithSettings','with_settings.xcf'))
+        top,wilber=doc.layers
+        top.blendMode=23 # overlay, so the blend space makes a difference
+        top.opacity=0.5 # and half see-through, so the composite space does too
+        changes=[
+            lambda:setattr(top,'blendSpace',1), # linear
+            lambda:setattr(top,'compositeSpace',2), # perceptual
+            lambda:setattr(wilber,'applyMask',False),
+            lambda:setattr(wilber,'applyMask',True),
+            lambda:setattr(wilber.mask,'image',PIL.Image.new('L',(wilber.width,wilber.height),64)),
+            lambda:setattr(top,'compositeMode',4), # intersection clears everything outside the layer
+            lambda:setattr(top,'compositeMode',1),
+            lambda:setattr(top,'blendMode',61), # pass-through
+            lambda:setattr(top,'isGroup',True)] # an empty group shows nothing
+        before=np.asarray(doc.image)
+        for change in changes:
+            change()
+            actual=doc._compositor.render()
+            expected=GimpCompositor(doc).asArray()
+            assert (actual==expected).all()
+            assert (actual!=before).any() # so the change did matter
+            before=actual
+            assert not any(layer._dirtyRects for layer in doc.layers)
+
+    @benchmark
+    def testDirtyRegionsSpeed(self):
+        import numpy as np
+        import PIL.Image
+        doc=GimpDocument()
+        doc.width=1024
+        doc.height=768
+        rng=np.random.default_rng(0)
+        for i in range(50):
+            pixels=rng.integers(0,256,(300,400,4),dtype=np.uint8)
+            layer=GimpLayer(doc,'layer %d'%i,PIL.Image.fromarray(pixels,'RGBA'))
+            layer.xOffset=int(rng.integers(0,624))
+            layer.yOffset=int(rng.integers(0,468))
+            doc.layers.append(layer)
+        start=time.perf_counter()
+        _=doc.image
+        elapsed=time.perf_counter()-start
+        print('\nfirst render of 50 layers: %.2f sec'%elapsed)
+        for i in range(3):
+            doc.layers[10].opacity=0.9-i*0.1
+            start=time.perf_counter()
+            image=doc.image
+            elapsed=time.perf_counter()-start
+            print('re-render after changing opacity: %.2f sec'%elapsed)
+        assert image.tobytes()==GimpCompositor(doc).image.tobytes()
+
+    @benchmark
+    def testTiledCompositorMemory(self):
+        import tracemalloc
+        import PIL.Image
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        peaks=[]
+        images=[]
+        for name,flatten in (
+            ('doc.image',lambda doc,f:doc.image.save(f,'png')),
+            ('GimpCompositor.save()',lambda doc,f:GimpCompositor(doc).save(f))):
+            doc=GimpDocument(filename)
+            f=BytesIO()
+            tracemalloc.start()
+            flatten(doc,f)
+            peak=tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('\n%s peak memory: %.1f MB'%(name,peak/1e6),end='')
+            peaks.append(peak)
+            f.seek(0)
+            images.append(PIL.Image.open(f).tobytes())
+        print()
+        assert images[0]==images[1]
+        assert peaks[1]<peaks[0]
+
+    def _propertyLayer(self,doc):
+        """
+        a layer with a typical assortment of properties set
+        """
+        layer=GimpLayer(doc,'props')
+        layer.opacity=0.75
+        layer.visible=True
+        layer.isLinked=True
+        layer.blendMode=28
+        layer.xOffset=-12
+        layer.yOffset=34
+        layer.color=(0.25,0.5,1.0)
+        layer.colorTag=3
+        layer.compositeMode=-1
+        layer.compositeSpace=2
+        layer.blendSpace=1
+        layer.uniqueId='0000002a'
+        layer.itemPath=[0,3]
+        p=GimpParasite()
+        p.name='gimp-comment'
+        p.flags=1
+        p.data=b'hello'
+        layer.parasites.append(p)
+        return layer
+
+    def testProperties(self):
+        doc=GimpDocument()
+        original=self._propertyLayer(doc)
+        data=original._propertiesEncode_()
+        layer=GimpLayer(doc)
+        io=IO(data)
+        assert layer._propertiesDecode_(io)==len(data)
+        assert io.index==len(data)
+        for name in ('opacity','visible','isLinked','blendMode','xOffset','yOffset',
+            'color','colorTag','compositeMode','compositeSpace','blendSpace','uniqueId','itemPath'):
+            assert getattr(layer,name)==getattr(original,name),name
+        assert [(p.name,p.flags,p.data) for p in layer.parasites]==[('gimp-comment',1,b'hello')]
+        assert layer._propertiesEncode_()==data
+        # the single-property entry points work the same way
+        layer=GimpLayer(doc)
+        layer._propertyDecode_(GimpLayer.PROP_OFFSETS,original._propertyEncode_(GimpLayer.PROP_OFFSETS)[4:])
+        assert (layer.xOffset,layer.yOffset)==(-12,34)
+        assert original._propertyEncode_(GimpLayer.PROP_OLD_SAMPLE_POINTS)==bytearray()
+        with self.assertRaises(Exception):
+            layer._propertyDecode_(99,b'')
+
+    def testOldPaths(self):
+        # one version 1 path laid out by hand: name, linked, state,
+        # closed, number of points, version, then int32 points
+        data=struct.pack('>II',1,1)+struct.pack('>I',4)+b'old\x00'\
+            +struct.pack('>IBIII',1,4,1,2,1)+struct.pack('>Iii',0,10,-20)+struct.pack('>Iii',1,30,40)
+        doc=GimpDocument()
+        doc._propertyDecode_(GimpDocument.PROP_PATHS,data)
+        assert doc.activePathIndex==1
+        assert len(doc.paths)==1
+        path=doc.paths[0]
+        assert (path.name,path.linked,path.state,path.closed,path.version)==('old',True,4,True,1)
+        assert path.points==[(0,10,-20),(1,30,40)]
+        assert doc._propertyEncode_(GimpDocument.PROP_PATHS)[4:]==data
+        # versions 2 and 3 have float points and extra fields
+        path=GimpOldPath(doc)
+        path.name='new'
+        path.tattoo=7
+        path.points=[(0,1.5,2.5),(1,-3.0,4.0),(0,5.0,6.0)]
+        doc.paths.append(path)
+        data=doc._propertyEncode_(GimpDocument.PROP_PATHS)[4:]
+        doc2=GimpDocument()
+        doc2._propertyDecode_(GimpDocument.PROP_PATHS,data)
+        assert [p.name for p in doc2.paths]==['old','new']
+        assert (doc2.paths[1].version,doc2.paths[1].tattoo)==(3,7)
+        assert doc2.paths[1].points==path.points
+        assert doc2._propertyEncode_(GimpDocument.PROP_PATHS)[4:]==data
+
+    @benchmark
+    def testPropertyDecodeSpeed(self):
+        doc=GimpDocument()
+        numLayers=5000
+        block=bytes(self._propertyLayer(doc)._propertiesEncode_())
+        data=block*numLayers
+        layers=[GimpLayer(doc) for _ in range(numLayers)]
+        io=IO(memoryview(data))
+        start=time.perf_counter()
+        for layer in layers:
+            layer._propertiesDecode_(io)
+        elapsed=time.perf_counter()-start
+        assert io.index==len(data)
+        assert layers[-1].xOffset==-12
+        print('\ndecode properties of %d layers: %.1f ms'%(numLayers,elapsed*1000))
+
+    def testCompactObjects(self):
+        from gimpFormats.gimpVectors import GimpStroke, GimpPoint
+        doc=GimpDocument()
+        a=GimpLayer(doc)
+        b=GimpLayer(doc)
+        # unset properties read as their defaults
+        assert a.opacity is None and a.selected is False and a.vectorsVersion==0
+        # and list defaults are not shared between objects
+        a.parasites.append(GimpParasite())
+        assert len(a.parasites)==1 and b.parasites==[]
+        with self.assertRaises(AttributeError):
+            _=a.noSuchThing
+        for item in (a,doc,GimpChannel(doc),GimpPoint(GimpStroke(None))):
+            assert not hasattr(item,'__dict__'),item.__class__.__name__
+
+    @benchmark
+    def testCompactObjectsMemory(self):
+        import tracemalloc
+        import gc
+        from gimpFormats.gimpVectors import GimpStroke, GimpPoint
+        doc=GimpDocument()
+        block=bytes(self._propertyLayer(doc)._propertiesEncode_())
+        stroke=GimpStroke(None)
+        count=2000
+        def decodedLayer():
+            layer=GimpLayer(doc)
+            layer._propertiesDecode_(IO(memoryview(block)))
+            return layer
+        for name,create in (
+            ('empty layer',lambda:GimpLayer(doc)),
+            ('decoded layer',decodedLayer),
+            ('path point',lambda:GimpPoint(stroke))):
+            gc.collect()
+            tracemalloc.start()
+            items=[create() for _ in range(count)]
+            size=tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print('\n%s: %d bytes'%(name,size/len(items)),end='')
+            assert not hasattr(items[0],'__dict__')
+        print()
+
+    def testDocLookup(self):
+        filename=sampleFile('layerGroups','layer_groups.xcf')
+        doc=GimpDocument(filename)
+        level=doc.layers[-1].imageHierarchy.levels[0]
+        assert level.doc is doc
+        assert doc.doc is doc
+        # the pointer size follows the version
+        doc.version=10
+        assert level._POINTER_SIZE_==32
+        assert level._pointerEncode_(1)==b'\0\0\0\1'
+        doc.version=11
+        assert level._POINTER_SIZE_==64
+        assert level._pointerEncode_(1)==b'\0\0\0\0\0\0\0\1'
+        io=IO(b'\0\0\0\0\0\0\0\2')
+        assert level._pointerDecode_(io)==2 and io.index==8
+
+    @benchmark
+    def testDocLookupSpeed(self):
+        import numpy as np
+        import PIL.Image
+        # groups nested 12 deep, each holding 8 layers
+        doc=GimpDocument()
+        doc.width=doc.height=256
+        rng=np.random.default_rng(0)
+        path=[]
+        for depth in range(12):
+            group=GimpLayer(doc,'group %d'%depth)
+            group.isGroup=True
+            path=path+[0]
+            group.itemPath=path
+            doc.layers.append(group)
+            for i in range(8):
+                pixels=rng.integers(0,256,(256,256,4),dtype=np.uint8)
+                layer=GimpLayer(doc,'layer %d.%d'%(depth,i),PIL.Image.fromarray(pixels,'RGBA'))
+                layer.itemPath=path+[i+1]
+                doc.layers.append(layer)
+        doc.compression=0
+        data=bytes(doc.toBytes())
+        start=time.perf_counter()
+        doc=GimpDocument()
+        doc._decode_(data)
+        numTiles=0
+        for layer in doc.layers:
+            hierarchy=layer.imageHierarchy
+            if hierarchy is None or not hierarchy.levels:
+                continue
+            level=hierarchy.levels[0]
+            for tileNum in range(level.numTiles):
+                level._decodeTile(tileNum)
+                numTiles+=1
+        elapsed=time.perf_counter()-start
+        print('\nload nested groups, %d layers, %d tiles: %.1f ms'%(len(doc.layers),numTiles,elapsed*1000))
+        assert numTiles==12*8*16
+        start=time.perf_counter()
+        for _ in range(100000):
+            found=level.doc
+        elapsed=time.perf_counter()-start
+        print('level.doc: %.0f ns'%(elapsed*1e4))
+        assert found is doc
+
+    def _strokeBytes(self,numPoints,numFloats):
+        """
+        a closed bezier stroke in file format
+        """
+        import struct
+        data=bytearray(struct.pack('>IIII',1,1,numFloats,numPoints))
+        for i in range(numPoints):
+            data.extend(struct.pack('>I%df'%numFloats,i%3!=0,*[float(i+j) for j in range(numFloats)]))
+        return bytes(data)
+
+    def testStrokeArrays(self):
+        from gimpFormats.gimpVectors import GimpStroke, GimpPoint
+        for numFloats in (2,4,6):
+            data=self._strokeBytes(10,numFloats)
+            stroke=GimpStroke(None)
+            assert stroke.fromBytes(data)==len(data)
+            assert stroke.numPoints==10
+            points=stroke.pointArray
+            assert points['x'][3]==3.0 and points['y'][3]==4.0
+            assert points['pointType'].tolist()==[0,1,1]*3+[0]
+            if numFloats<6:
+                assert points['wheel'][3]==0.5 # the default
+            assert stroke.toBytes()==data
+            # the object view has the same values
+            point=stroke.points[3]
+            assert (point.pointType,point.x,point.y)==(0,3.0,4.0)
+            # and once used, it is what gets saved
+            point.x=100.0
+            stroke.points.append(GimpPoint(stroke))
+            decoded=GimpStroke(None)
+            decoded.fromBytes(stroke.toBytes())
+            assert decoded.numPoints==11
+            assert decoded.pointArray['x'][3]==100.0
+        filename=sampleFile('xcfWithSettings','with_settings.xcf')
+        doc=GimpDocument(filename)
+        assert [vector.name for vector in doc.vectors]==['square','outline']
+        assert doc._vectorsEncode_()==GimpDocument(filename)._vectorsEncode_()
+
+    @benchmark
+    def testStrokeSpeed(self):
+        import tracemalloc
+        from gimpFormats.gimpVectors import GimpStroke
+        numPoints=50000
+        data=self._strokeBytes(numPoints,6)
+        tracemalloc.start()
+        start=time.perf_counter()
+        stroke=GimpStroke(None)
+        stroke.fromBytes(data)
+        elapsed=time.perf_counter()-start
+        size=tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('\ndecode %d path points: %.1f ms, %d bytes/point'%(numPoints,elapsed*1000,size/numPoints))
+        start=time.perf_counter()
+        assert stroke.toBytes()==data
+        elapsed=time.perf_counter()-start
+        print('encode %d path points: %.1f ms'%(numPoints,elapsed*1000))
+
+    def _circleStroke(self,vector,cx,cy,r):
+        """
+        a circle made of 4 bezier curves, the way gimp stores it
+        """
+        import numpy as np
+        from gimpFormats.gimpVectors import GimpStroke, POINT_DTYPE
+        k=0.5522847498*r # control point distance for a quarter circle
+        points=[]
+        for x,y,dx,dy in ((cx+r,cy,0,k),(cx,cy+r,-k,0),(cx-r,cy,0,-k),(cx,cy-r,k,0)):
+            points.extend(((1,x-dx,y-dy),(0,x,y),(1,x+dx,y+dy)))
+        stroke=GimpStroke(vector)
+        pointArray=np.zeros(len(points),POINT_DTYPE)
+        pointArray['pointType'],pointArray['x'],pointArray['y']=np.array(points).T
+        stroke.pointArray=pointArray
+        return stroke
+
+    def testVectorPaths(self):
+        import numpy as np
+        from gimpFormats.gimpVectors import GimpVector
+        doc=GimpDocument()
+        doc.width=doc.height=100
+        vector=GimpVector(doc)
+        vector.strokes.append(self._circleStroke(vector,50,50,40))
+        assert vector.svgPath==('M90 50 C90 72.0914 72.0914 90 50 90 C27.9086 90 10 72.0914 10 50 '
+            'C10 27.9086 27.9086 10 50 10 C72.0914 10 90 27.9086 90 50 Z')
+        # the polyline is never more than the tolerance away from the circle
+        for tolerance in (1.0,0.25,0.05):
+            polyline=vector.polylines(tolerance)[0]
+            radius=np.hypot(polyline[:,0]-50,polyline[:,1]-50)
+            angles=np.arctan2(polyline[:,1]-50,polyline[:,0]-50)
+            sagitta=40*(1-np.cos(np.diff(np.unwrap(angles))/2))
+            assert np.all(np.abs(radius-40)<0.05)
+            assert np.all(sagitta<=tolerance+0.05)
+        # filled, it has the area of a circle
+        mask=vector.maskArray()
+        assert mask.shape==(100,100)
+        assert abs(mask.sum()/255-np.pi*40*40)<40
+        assert mask[50,50]==255 and mask[5,5]==0
+        assert 0<mask[78,78]<255 # anti-aliased edge
+        assert set(np.unique(vector.maskArray(antialias=False)))=={0,255}
+        # a hole, depending on the fill rule
+        vector.strokes.append(self._circleStroke(vector,50,50,20))
+        assert vector.maskArray()[50,50]==255
+        assert vector.maskArray(fillRule='evenodd')[50,50]==0
+        assert abs(vector.maskArray(fillRule='evenodd').sum()/255-np.pi*(40*40-20*20))<60
+        assert vector.mask().mode=='L'
+
+    @benchmark
+    def testVectorPathsSpeed(self):
+        import numpy as np
+        from gimpFormats.gimpVectors import GimpVector
+        doc=GimpDocument()
+        doc.width=doc.height=2000
+        vector=GimpVector(doc)
+        rng=np.random.default_rng(0)
+        for _ in range(2000):
+            vector.strokes.append(self._circleStroke(vector,*rng.uniform(0,2000,2),rng.uniform(5,60)))
+        start=time.perf_counter()
+        polylines=vector.polylines()
+        elapsed=time.perf_counter()-start
+        print('\nflatten %d strokes to %d points: %.1f ms'%(len(polylines),sum(len(p) for p in polylines),elapsed*1000))
+        assert len(polylines)==2000
+        for antialias in (False,True):
+            start=time.perf_counter()
+            mask=vector.maskArray(antialias=antialias)
+            elapsed=time.perf_counter()-start
+            print('rasterize 2000x2000 mask%s: %.1f ms'%(' (antialiased)' if antialias else '',elapsed*1000))
+            assert mask.shape==(2000,2000) and mask.any()
+
+    def testReducedArray(self):
+        import numpy as np
+        from gimpFormats.gimpImageInternals import _reducePixels
+        filename=sampleFile('twoLayers','two_layers.xcf')
+        doc=GimpDocument(filename)
+        for i,layer in enumerate(doc.layers):
+            full=layer.asArray()
+            for reduction in (2,8,64):
+                expected=_reducePixels(full,reduction)
+                h,w=expected.shape[:2]
+                assert (h,w)==(-(-full.shape[0]//reduction),-(-full.shape[1]//reduction))
+                actual=GimpDocument(filename)[i].asArray(reduction=reduction) # tile by tile
+                assert (actual==expected).all()
+                assert (layer.asArray(reduction=reduction)==expected).all() # after it has been decoded
+                region=GimpDocument(filename)[i].asArray((1,2,w-1,h),reduction)
+                assert (region==expected[2:h,1:w-1]).all()
+        # transparent pixels do not bleed into the average
+        pixels=np.zeros((2,2,4),dtype=np.uint8)
+        pixels[0,0]=(255,0,0,255)
+        assert _reducePixels(pixels,2)[0,0].tolist()==[255,0,0,64]
+        self.assertRaises(Exception,doc.layers[0].asArray,None,3)
+
+    def _thumbnailDoc(self,width,height,numLayers):
+        import numpy as np
+        import PIL.Image
+        doc=GimpDocument()
+        doc.width=width
+        doc.height=height
+        rng=np.random.default_rng(0)
+        y,x=np.mgrid[0:height//2,0:width//2]
+        for i in range(numLayers):
+            pixels=np.empty((height//2,width//2,4),dtype=np.uint8)
+            pixels[...,0]=x*255//(width//2)
+            pixels[...,1]=y*255//(height//2)
+            pixels[...,2]=i*255//numLayers
+            pixels[...,3]=np.where((x//100+y//100)%2,255,128)
+            layer=GimpLayer(doc,'layer %d'%i,PIL.Image.fromarray(pixels,'RGBA'))
+            layer.xOffset=int(rng.integers(0,width//2))
+            layer.yOffset=int(rng.integers(0,height//2))
+            doc.layers.append(layer)
+        decoded=GimpDocument()
+        decoded._decode_(doc.toBytes()) # so tiles get decoded on demand
+        return decoded
+
+    def testThumbnail(self):
+        import numpy as np
+        import PIL.Image
+        import struct
+        filename=sampleFile('layerGroups','layer_groups.xcf')
+        doc=GimpDocument(filename)
+        expected=doc.image
+        expected.thumbnail((128,128),PIL.Image.LANCZOS)
+        thumbnail=GimpDocument(filename).thumbnail(128)
+        assert thumbnail.size==expected.size==(128,115)
+        difference=np.abs(np.asarray(thumbnail,dtype=float)-np.asarray(expected,dtype=float))
+        assert difference.mean()<2.0
+        # an exif thumbnail gets used instead
+        jpeg=BytesIO()
+        PIL.Image.new('RGB',(160,120),(0,0,255)).save(jpeg,'jpeg')
+        jpeg=jpeg.getvalue()
+        ifd1=8+2+12+4
+        thumbnailAt=ifd1+2+2*12+4
+        exif=b'Exif\0\0'+b'MM\0*'+struct.pack('>I',8) \
+            +struct.pack('>HHHII',1,0x0112,3,1,1<<16)+struct.pack('>I',ifd1) \
+            +struct.pack('>HHHIIHHII',2,0x0201,4,1,thumbnailAt,0x0202,4,1,len(jpeg))+struct.pack('>I',0) \
+            +jpeg
+        parasite=GimpParasite()
+        parasite.name='exif-data'
+        parasite.data=exif
+        assert parasite.thumbnailData==jpeg
+        doc=GimpDocument(filename)
+        doc.parasites.append(parasite)
+        thumbnail=doc.thumbnail(100)
+        assert thumbnail.size==(100,75)
+        assert thumbnail.getpixel((50,37))[2]>200 # blue, not the layers
+        # but not if it is too small
+        assert doc.thumbnail(256).size==(256,229)
+
+    @benchmark
+    def testThumbnailSpeed(self):
+        import PIL.Image
+        data=self._thumbnailDoc(4096,4096,4).toBytes()
+        start=time.perf_counter()
+        doc=GimpDocument()
+        doc._decode_(data)
+        image=doc.image
+        image.thumbnail((256,256),PIL.Image.LANCZOS)
+        elapsed=time.perf_counter()-start
+        print('\n4096x4096 doc.image then shrink: %.2f sec'%elapsed)
+        start=time.perf_counter()
+        numThumbnails=5
+        for _ in range(numThumbnails):
+            doc=GimpDocument()
+            doc._decode_(data)
+            image=doc.thumbnail(256)
+        elapsed=(time.perf_counter()-start)/numThumbnails
+        assert image.size==(256,256)
+        print('4096x4096 thumbnail(256): %.2f sec'%elapsed)
+
+
+def testSuite():
+    """
+    Combine unit tests into an entire suite
+    """
+    testSuite = unittest.TestSuite()
+    testSuite.addTest(Test("testRLEDecode"))
+    testSuite.addTest(Test("testRLEDecodeSpeed"))
+    testSuite.addTest(Test("testGetRegion"))
+    testSuite.addTest(Test("testMmapLoad"))
+    testSuite.addTest(Test("testLazyLayers"))
+    testSuite.addTest(Test("testIOReaders"))
+    testSuite.addTest(Test("testBulkReaders"))
+    testSuite.addTest(Test("testIOReadSpeed"))
+    testSuite.addTest(Test("testIOWrites"))
+    testSuite.addTest(Test("testEncodeRoundTrip"))
+    testSuite.addTest(Test("testRLEEncode"))
+    testSuite.addTest(Test("testEncodeSpeed"))
+    testSuite.addTest(Test("testStreamSave"))
+    testSuite.addTest(Test("testParallelSave"))
+    testSuite.addTest(Test("testParallelLoad"))
+    testSuite.addTest(Test("testZlibTiles"))
+    testSuite.addTest(Test("testAsArray"))
+    testSuite.addTest(Test("testAsArraySpeed"))
+    testSuite.addTest(Test("testEmptyHierarchy"))
+    testSuite.addTest(Test("testHighBitDepth"))
+    testSuite.addTest(Test("testPrecisionCodes"))
+    testSuite.addTest(Test("testProbe"))
+    testSuite.addTest(Test("testIndex"))
+    testSuite.addTest(Test("testTileCache"))
+    testSuite.addTest(Test("testTileCacheSpeed"))
+    testSuite.addTest(Test("testCompositor"))
+    testSuite.addTest(Test("testBlendModes"))
+    testSuite.addTest(Test("testCompositorSpeed"))
+    testSuite.addTest(Test("testTiledCompositor"))
+    testSuite.addTest(Test("testTiledCompositorMemory"))
+    testSuite.addTest(Test("testDirtyRegions"))
+    testSuite.addTest(Test("testDirtyRenderSettings"))
+    testSuite.addTest(Test("testDirtyRegionsSpeed"))
+    testSuite.addTest(Test("testProperties"))
+    testSuite.addTest(Test("testOldPaths"))
+    testSuite.addTest(Test("testPropertyDecodeSpeed"))
+    testSuite.addTest(Test("testCompactObjects"))
+    testSuite.addTest(Test("testCompactObjectsMemory"))
+    testSuite.addTest(Test("testDocLookup"))
+    testSuite.addTest(Test("testDocLookupSpeed"))
+    testSuite.addTest(Test("testStrokeArrays"))
+    testSuite.addTest(Test("testStrokeSpeed"))
+    testSuite.addTest(Test("testVectorPaths"))
+    testSuite.addTest(Test("testVectorPathsSpeed"))
+    testSuite.addTest(Test("testReducedArray"))
+    testSuite.addTest(Test("testThumbnail"))
+    testSuite.addTest(Test("testThumbnailSpeed"))
+    return testSuite
+
+
+def cmdline(args):
+    """
+    Run the command line
+
+    :param args: command line arguments (WITHOUT the filename)
+    """
+    unittest.main()
+
+
+if __name__=='__main__':
+    import sys
+    cmdline(sys.argv[1:])